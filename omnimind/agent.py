@@ -18,22 +18,42 @@ class Agent:
         self.retriever = retriever
         self.enable_critique = enable_critique
         self.max_iters = max_iters
+        self.timer = retriever.timer  # tool / synthesis / critique stages next to the retrieval ones
 
-    def run(self, query: str):
-        # 1) retrieve
-        ctxs = self.retriever.retrieve(query)
+    def run(self, query: str, filter=None):
+        out = dict(self.run_steps(query, filter))
+        answer = out["synthesis"]
+        if "critique" in out:
+            answer = answer + "\n" + out["critique"]
+        return answer + "\n" + out["sources"]
+
+    def run_steps(self, query: str, filter=None):
+        """
+        The agent loop as (event, payload) pairs, each yielded as soon as its stage is done
+        (streaming): candidates, contexts, tool, synthesis, critique, sources.
+        """
+        # 1) retrieve (filter: see HybridRetriever.retrieve_batch)
+        ctxs = []
+        for event, hits in self.retriever.retrieve_steps(query, filter):
+            ctxs = hits
+            yield event, hits
         # 2) naive tool intent detection (MVP)
         if any(t in query.lower() for t in ["calc","calculate","sqrt","^","sin(","cos("]):
-            tool_out = call_tool("calculator", expression=query.split("calc")[-1].strip() or query)
+            with self.timer.stage("tool"):
+                tool_out = call_tool("calculator", expression=query.split("calc")[-1].strip() or query)
             tool_note = f"\n[TOOL=calculator] {tool_out}\n"
+            yield "tool", {"name": "calculator", "output": tool_out}
         else:
             tool_note = ""
         # 3) synthesize
-        answer = synthesize_answer(query, ctxs) + tool_note
+        with self.timer.stage("synthesis"):
+            answer = synthesize_answer(query, ctxs) + tool_note
+        yield "synthesis", answer
         # 4) self-critique
         if self.enable_critique:
-            critique = self_critique(query, answer, ctxs)
-            answer = answer + "\n" + critique
+            with self.timer.stage("critique"):
+                critique = self_critique(query, answer, ctxs)
+            yield "critique", critique
         # 5) add minimal citations
         cites = "\nSources:\n" + "\n".join({f"- {c['source']} (score={c['_rank']:.3f})" for c in ctxs})
-        return answer + "\n" + cites
+        yield "sources", cites
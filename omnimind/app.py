@@ -1,40 +1,96 @@
 from __future__ import annotations
-import yaml
+import asyncio, json, os, threading, time
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
+from contextlib import ExitStack, asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
-from .memory import VectorMemory
-from .ingest_text import prepare_text_docs
-from .ingest_image import prepare_image_docs
-from .retriever import HybridRetriever
-from .agent import Agent
+from .utils import load_config, process_memory
+from .timing import StageTimer, request_trace, render_prometheus, profile
+from .attrs import normalize_filter
+
+# Models, faiss and the ingest stack are imported in _ensure_components() / the endpoints
+# that use them, so importing the app (and answering /health) does not wait on torch.
+if TYPE_CHECKING:
+    from .memory import VectorMemory
+    from .retriever import HybridRetriever
+    from .agent import Agent
 
 # ---------- Load config ----------
-CFG = yaml.safe_load(open("config.yaml", "r"))
+# OMNIMIND_CONFIG, else the config.yaml next to the package; relative paths in it are
+# resolved against its directory, so the server can be started from anywhere
+CONFIG_PATH = os.environ.get("OMNIMIND_CONFIG") or str(Path(__file__).resolve().parents[1] / "config.yaml")
+CFG = load_config(CONFIG_PATH)
 
 # ---------- Singletons ----------
 _vec: Optional[VectorMemory] = None
+_img: Optional[VectorMemory] = None
 _rtv: Optional[HybridRetriever] = None
 _agent: Optional[Agent] = None
+_requests = StageTimer()  # end-to-end latency per endpoint, for /metrics
+_jobs = None  # JobQueue running POST /ingest in the background, created on first use
+_init_lock = threading.Lock()
+_ready = {"ready": False, "error": None, "load_s": None}
 
 def _ensure_components():
-    global _vec, _rtv, _agent
+    with _init_lock:  # the warmup thread and early requests may race to build the singletons
+        _build_components()
+
+def _build_components():
+    global _vec, _img, _rtv, _agent
+    from .memory import VectorMemory
+    from .retriever import HybridRetriever
+    from .agent import Agent
+    from .ingest_image import build_image_memory
+    sharding = CFG["retrieval"]["sharding"]
     if _vec is None:
+        model = migrate_stores()
+        # always snapshot readers: ingest (a background job here, or scripts/ingest.py) writes
+        # through its own handle and publishes; queries switch to the new snapshot whole.
+        # Sharded, BM25 lives in the shards; this store only embeds queries and backs graph expansion.
         _vec = VectorMemory(
             CFG["paths"]["vector_index"],
             CFG["paths"]["docstore"],
             CFG["models"]["embed_text"],
+            CFG["retrieval"]["index"],
+            model=model,
+            lexical_path=None if sharding["enabled"] else CFG["paths"]["lexical_index"],
+            backend_cfg=CFG["inference"],
+            read_only=True,
+            reload_check_s=CFG["serving"]["reload_check_s"],
         )
+        _img = build_image_memory(CFG, read_only=True)
     if _rtv is None:
         _rtv = HybridRetriever(
             _vec,
             CFG["models"]["cross_encoder"],
             CFG["retrieval"]["top_k"],
             CFG["retrieval"]["rerank_k"],
+            backend_cfg=CFG["inference"],
         )
+        batching = CFG["serving"]["batching"]
+        if batching["enabled"]:
+            _rtv.enable_batching(batching["max_batch_size"], batching["max_wait_ms"])
+        if sharding["enabled"]:
+            from .shards import ShardCoordinator, shard_urls
+            _rtv.enable_shards(ShardCoordinator(shard_urls(sharding), sharding["timeout_s"],
+                                                reload_check_s=CFG["serving"]["reload_check_s"]))
+        if CFG["retrieval"]["lexical"]["enabled"]:
+            _rtv.enable_lexical(CFG["retrieval"]["lexical"])
+        if CFG["retrieval"]["cascade"]["enabled"]:
+            _rtv.enable_cascade(CFG["retrieval"]["cascade"])
+        if CFG["retrieval"]["graph"]["enabled"]:
+            from .kgstore import KGStore
+            _rtv.enable_graph(KGStore(CFG["paths"]["kg_store"], CFG["serving"]["reload_check_s"]),
+                              CFG["retrieval"]["graph"])
+        if _img is not None:
+            _rtv.enable_images(_img, CFG["images"])
+        if CFG["cache"]["enabled"]:
+            _rtv.enable_cache(CFG["cache"])
     if _agent is None:
         _agent = Agent(
             _rtv,
@@ -42,8 +98,72 @@ def _ensure_components():
             max_iters=CFG["agent"]["max_iters"],
         )
 
+def migrate_stores():
+    """
+    Data written before snapshots existed (an index saved without a pointer, or a legacy
+    docstore.jsonl) is invisible to the read-only store the app serves from: open it once as
+    a writer, which migrates it, and publish() it. Returns that writer's encoder for reuse,
+    or None when there was nothing to do. scripts/serve.py runs this before forking.
+    """
+    from .memory import VectorMemory, unpublished
+    paths = CFG["paths"]
+    if not unpublished(paths["vector_index"], paths["docstore"]):
+        return None
+    writer = VectorMemory(paths["vector_index"], paths["docstore"], CFG["models"]["embed_text"],
+                          CFG["retrieval"]["index"], lexical_path=paths["lexical_index"], backend_cfg=CFG["inference"])
+    try:
+        print(f"[app] Published {paths['vector_index']} as snapshot v{writer.publish()} for read-only serving")
+    finally:
+        writer.close()
+    return writer.model
+
+def preload_models():
+    """
+    Load the text models in this process so forked workers share them (scripts/serve.py calls
+    this before forking). Only weights are loaded: no inference runs and no threads start,
+    both of which must happen in each worker after the fork.
+    """
+    from . import inference
+    cascade = CFG["retrieval"]["cascade"]
+    small = cascade.get("small_model") if cascade["enabled"] else None
+    inference.preload([CFG["models"]["embed_text"]], [CFG["models"]["cross_encoder"], small], CFG["inference"])
+
+def _warmup():
+    """Load models + index and run one dummy inference through each, so the first request is not cold."""
+    t = time.perf_counter()
+    try:
+        _ensure_components()
+        _vec.search_batch(["warmup"], k=1)  # embedder forward, index search, docstore pages
+        if _rtv.shards is not None:
+            _rtv.shards.search(_vec.encode(["warmup"]), k=1)  # connections to the shard workers
+        _rtv._predict([("warmup", "warmup")])  # cross-encoder forward
+        if _rtv.small_rank is not None:
+            _rtv.small_rank.predict([("warmup", "warmup")])
+        if _img is not None:
+            _img.search_batch(["warmup"], k=1)
+            _img.timer.reset()
+        _rtv.timer.reset()  # keep the dummy calls out of /metrics
+    except Exception as e:
+        _ready["error"] = f"{type(e).__name__}: {e}"
+        print(f"[app] Warmup failed: {_ready['error']}")
+        return
+    _ready.update(ready=True, load_s=round(time.perf_counter() - t, 3))
+    print(f"[app] Ready in {_ready['load_s']}s")
+
+@asynccontextmanager
+async def lifespan(app):
+    w = CFG["serving"]["warmup"]
+    if w["enabled"] and w["background"]:
+        # serve /health (and queue early requests) while the models load
+        threading.Thread(target=_warmup, name="omnimind-warmup", daemon=True).start()
+    elif w["enabled"]:
+        _warmup()
+    else:
+        _ready["ready"] = True  # components load lazily on the first request
+    yield
+
 # ---------- FastAPI ----------
-app = FastAPI(title="OmniMind API", version="0.1.0", description="RAG + Tools + Self-critique")
+app = FastAPI(title="OmniMind API", version="0.1.0", description="RAG + Tools + Self-critique", lifespan=lifespan)
 
 # (Optional) loosen CORS for local dev
 app.add_middleware(
@@ -55,21 +175,56 @@ app.add_middleware(
 )
 
 # ---------- Schemas ----------
-class IngestResponse(BaseModel):
-    chunks_added: int = Field(..., description="Number of chunks added to the vector store.")
+class IngestJob(BaseModel):
+    id: str
+    kind: str
+    state: str = Field(..., description="queued | running | done | failed")
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Any] = Field(default_factory=dict,
+                                     description="Counters so far: files_done / files_total, chunks_added, ...")
+    result: Optional[Dict[str, Any]] = Field(None, description="Final ingest counters plus the published snapshot.")
+    error: Optional[str] = None
+
+class IngestJobsResponse(BaseModel):
+    jobs: List[IngestJob]
 
 class QueryRequest(BaseModel):
     query: str
+    filter: Optional[Dict[str, Any]] = Field(
+        None, description='Only chunks matching all given fields, e.g. {"type": "audio", "source": "data/raw/notes/"} '
+                          "(type: one or a list of values; source: path prefixes).")
+    timings: bool = Field(False, description="Return this request's per-stage timings (ms).")
+    profile: bool = Field(False, description="Sample this request's stacks (serving.metrics.profiling).")
 
 class QueryResponse(BaseModel):
     answer: str
     contexts: List[Dict[str, Any]]
+    timings: Optional[Dict[str, float]] = None
+    profile: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    filter: Optional[Dict[str, Any]] = Field(
+        None, description='Only chunks matching all given fields, e.g. {"type": "audio", "source": "data/raw/notes/"} '
+                          "(type: one or a list of values; source: path prefixes).")
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
 
 class AgentRequest(BaseModel):
     query: str
+    filter: Optional[Dict[str, Any]] = Field(
+        None, description='Only chunks matching all given fields, e.g. {"type": "audio", "source": "data/raw/notes/"} '
+                          "(type: one or a list of values; source: path prefixes).")
+    timings: bool = Field(False, description="Return this request's per-stage timings (ms).")
+    profile: bool = Field(False, description="Sample this request's stacks (serving.metrics.profiling).")
 
 class AgentResponse(BaseModel):
     answer: str
+    timings: Optional[Dict[str, float]] = None
+    profile: Optional[str] = None
 
 class ToolsResponse(BaseModel):
     tools: Dict[str, Dict[str, Any]]
@@ -77,29 +232,143 @@ class ToolsResponse(BaseModel):
 # ---------- Endpoints ----------
 @app.get("/health")
 def health():
+    """Liveness: the process is up (models may still be loading, see /ready)."""
     return {"status": "ok"}
 
-@app.post("/ingest", response_model=IngestResponse)
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once models and index are loaded and warmed up, 503 until then (or if loading failed)."""
+    if _ready["ready"]:
+        return {"status": "ready", "load_s": _ready["load_s"]}
+    status = "error" if _ready["error"] else "loading"
+    return JSONResponse({"status": status, "error": _ready["error"]}, status_code=503)
+
+@app.get("/stats")
+def stats():
+    """Serving counters: batcher queue depth / batch sizes, cache hits/misses, rerank work, memory, shard workers."""
+    _ensure_components()
+    out = {"batching": _rtv.batching_stats(), "cache": _rtv.cache_stats(), "rerank": _rtv.rerank_stats(),
+           "memory": dict(process_memory(), pid=os.getpid())}
+    if _rtv.shards is not None:
+        out["shards"] = _rtv.shards.stats()
+    return out
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus exposition: latency histograms per query stage and per endpoint, plus rerank/cache counters."""
+    if not CFG["serving"]["metrics"]["enabled"]:
+        raise HTTPException(404, "metrics are disabled (serving.metrics.enabled)")
+    _ensure_components()
+    counters = {f"rerank_{k}": v for k, v in _rtv.rerank_stats().items() if not k.endswith("_per_query")}
+    for level, st in _rtv.cache_stats().items():
+        if isinstance(st, dict):
+            counters.update({f"cache_{level}_{k}": v for k, v in st.items() if k in ("hits", "misses", "evictions")})
+    timers = {"stage": (_rtv.timer, "stage"), "request": (_requests, "endpoint")}
+    if _img is not None:
+        timers["image_stage"] = (_img.timer, "stage")
+    return PlainTextResponse(render_prometheus(timers, counters), media_type="text/plain; version=0.0.4")
+
+class _Traced:
+    """
+    Per-request instrumentation: endpoint latency into _requests, and (when asked for and
+    allowed by serving.metrics) the request's stage breakdown and a sampled profile.
+    """
+    def __init__(self, endpoint: str, req):
+        m = CFG["serving"]["metrics"]
+        self.endpoint = endpoint
+        self.want_timings = req.timings and m["request_timings"]
+        self.want_profile = req.profile and m["profiling"]
+        self.interval_ms = m["profile_interval_ms"]
+        self.timings = self.profile = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        self._trace = self._stack.enter_context(request_trace())
+        if self.want_profile:
+            self._prof = self._stack.enter_context(profile(self.interval_ms))
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+        _requests.add(self.endpoint, self._trace["total"] / 1000.0)
+        if self.want_timings:
+            self.timings = {k: round(v, 3) for k, v in self._trace.items()}
+        if self.want_profile:
+            self.profile = self._prof.folded()
+        return False
+
+@app.post("/ingest", response_model=IngestJob, status_code=202)
 def ingest():
     """
-    Ingest files under data/raw:
+    Start incrementally ingesting files under data/raw in the background:
       - .txt, .md (chunked + embedded)
-      - .png, .jpg, .jpeg (image proxies for MVP)
+      - .png, .jpg, .jpeg (CLIP image embeddings, when images.enabled)
+      - .wav, .mp3, .m4a, .flac, .ogg (cached Whisper transcripts, when audio.enabled)
+    Unchanged files are skipped, changed files are re-chunked, deleted files are dropped.
+    Returns the job at once (poll GET /ingest/jobs/{id}); queries keep being served from the
+    current snapshot and switch to the new one when the job publishes it.
     """
+    global _jobs
+    if CFG["serving"]["read_only"]:
+        raise HTTPException(409, "read-only serving: run scripts/ingest.py; workers reload the published index")
     _ensure_components()
     raw_dir = CFG["paths"]["data_raw"]
     if not Path(raw_dir).exists():
         raise HTTPException(400, f"Raw data directory not found: {raw_dir}")
+    with _init_lock:
+        if _jobs is None:
+            from .jobs import JobQueue
+            _jobs = JobQueue(nice=CFG["ingest"]["background_nice"], name="ingest")
+    return _jobs.submit("ingest", _run_ingest)
 
-    text_docs = prepare_text_docs(raw_dir)
-    img_docs = prepare_image_docs(raw_dir)
-    docs = text_docs + img_docs
+@app.get("/ingest/jobs/{job_id}", response_model=IngestJob)
+def ingest_job(job_id: str):
+    """State and progress of one ingest job."""
+    job = _jobs.status(job_id) if _jobs is not None else None
+    if job is None:
+        raise HTTPException(404, f"no such job: {job_id}")
+    return job
 
-    if not docs:
-        return IngestResponse(chunks_added=0)
+@app.get("/ingest/jobs", response_model=IngestJobsResponse)
+def ingest_jobs():
+    """Recent ingest jobs, newest first."""
+    return IngestJobsResponse(jobs=_jobs.jobs() if _jobs is not None else [])
 
-    _vec.add_texts(docs)
-    return IngestResponse(chunks_added=len(docs))
+def _run_ingest(report):
+    """Job body: ingest through writable handles, publish, then have this process's readers switch."""
+    from .ingest import ingest_dir
+    from .ingest_audio import build_audio_pool
+    ing = CFG["ingest"]
+    vec, img = _vec.writer(reset_vectors=True), _img.writer(reset_vectors=True) if _img is not None else None
+    try:
+        stats = ingest_dir(
+            vec,
+            CFG["paths"]["data_raw"],
+            CFG["paths"]["ingest_manifest"],
+            CFG["retrieval"]["chunk_size"],
+            CFG["retrieval"]["chunk_overlap"],
+            ing["batch_size"],
+            ing["checkpoint_every"],
+            workers=ing["workers"],
+            embed_workers=ing["embed_workers"],
+            threads_per_embed_worker=ing["threads_per_embed_worker"],
+            img_vec=img,
+            audio=build_audio_pool(CFG),
+            chunker=CFG["retrieval"]["chunker"],
+            progress=report,
+        )
+        sharding = CFG["retrieval"]["sharding"]
+        if sharding["enabled"]:
+            from .shards import sync_shards
+            stats["shards"] = sync_shards(vec, CFG["paths"]["shards"], sharding["shards"])
+    finally:
+        vec.close()  # release the writer lock: another ingest may run now
+        if img is not None:
+            img.close()
+    _vec.refresh(force=True)
+    if _img is not None:
+        _img.refresh(force=True)
+    return dict(stats, snapshot=vec.snapshot)
 
 @app.post("/query", response_model=QueryResponse)
 def query(req: QueryRequest):
@@ -108,8 +377,116 @@ def query(req: QueryRequest):
     Useful for debugging retrieval quality.
     """
     _ensure_components()
-    ctxs = _rtv.retrieve(req.query)
-    answer = f"(RAG) {req.query}\n\n" + "\n".join([c["text"][:280].replace("\n", " ") for c in ctxs])
+    filter = _filter(req.filter)
+    with _Traced("query", req) as tr:
+        ctxs = _rtv.retrieve(req.query, filter)
+        with _rtv.timer.stage("synthesis"):
+            out = _rag_response(req.query, ctxs)
+    out.timings, out.profile = tr.timings, tr.profile
+    return out
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+def query_batch(req: BatchQueryRequest):
+    """
+    Batched /query: all queries share one embedding pass, one FAISS search
+    and one cross-encoder call. Results are returned in request order.
+    """
+    _ensure_components()
+    filter = _filter(req.filter)
+    with _requests.stage("query_batch", len(req.queries)):
+        all_ctxs = _rtv.retrieve_batch(req.queries, filter)
+    return BatchQueryResponse(results=[_rag_response(q, ctxs) for q, ctxs in zip(req.queries, all_ctxs)])
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """
+    /query as Server-Sent Events, one per stage as soon as it is done:
+      candidates  {"contexts": [...]}  ANN (+ BM25 / graph) hits, before reranking
+      contexts    {"contexts": [...]}  reranked contexts
+      answer      {"answer": "..."}
+      done        {"timings": ..., "profile": ...}   (or error {"detail": "..."})
+    """
+    await run_in_threadpool(_ensure_components)
+    filter = _filter(req.filter)
+
+    def steps():
+        for event, ctxs in _rtv.retrieve_steps(req.query, filter):
+            yield event, {"contexts": ctxs}
+        with _rtv.timer.stage("synthesis"):
+            out = _rag_response(req.query, ctxs)
+        yield "answer", {"answer": out.answer}
+    return _sse("query_stream", req, steps())
+
+@app.post("/agent/stream")
+async def agent_stream(req: AgentRequest):
+    """
+    /agent as Server-Sent Events: candidates and contexts (as /query/stream), then tool
+    {"name", "output"}, synthesis {"text"}, critique {"text"} and sources {"text"} as each
+    stage finishes, answer {"answer"} (the /agent answer) and done.
+    """
+    await run_in_threadpool(_ensure_components)
+    filter = _filter(req.filter)
+
+    def steps():
+        answer = []
+        for event, payload in _agent.run_steps(req.query, filter):
+            if event in ("candidates", "contexts"):
+                payload = {"contexts": payload}
+            elif event != "tool":
+                answer.append(payload)
+                payload = {"text": payload}
+            yield event, payload
+        yield "answer", {"answer": "\n".join(answer)}
+    return _sse("agent_stream", req, steps())
+
+def _sse(endpoint, req, steps):
+    """
+    Stream (event, payload) pairs from the blocking `steps` generator as Server-Sent Events:
+    one worker thread runs every stage, inside the request's trace and profiler (so timings
+    and stack samples belong to the thread doing the work), and hands each event to the
+    event loop as soon as it is produced, so the first bytes leave after the vector search
+    instead of after the whole pipeline.
+    """
+    async def events():
+        loop = asyncio.get_running_loop()
+        queue, closed = asyncio.Queue(), threading.Event()
+        put = lambda event, payload: loop.call_soon_threadsafe(queue.put_nowait, (event, _event(event, payload)))
+
+        def work():
+            try:
+                with _Traced(endpoint, req) as tr:
+                    for event, payload in steps:
+                        put(event, payload)
+                        if closed.is_set():  # client went away
+                            return
+                put("done", {"timings": tr.timings, "profile": tr.profile})
+            except Exception as e:
+                put("error", {"detail": f"{type(e).__name__}: {e}"})
+
+        worker = loop.run_in_executor(None, work)
+        try:
+            while True:
+                event, chunk = await queue.get()
+                yield chunk
+                if event in ("done", "error"):
+                    break
+        finally:
+            closed.set()
+        await worker
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _filter(filter):
+    try:
+        return normalize_filter(filter)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+def _rag_response(query: str, ctxs: List[Dict[str, Any]]) -> QueryResponse:
+    answer = f"(RAG) {query}\n\n" + "\n".join([c["text"][:280].replace("\n", " ") for c in ctxs])
     return QueryResponse(answer=answer, contexts=ctxs)
 
 @app.post("/agent", response_model=AgentResponse)
@@ -118,8 +495,10 @@ def agent(req: AgentRequest):
     Full agent loop: retrieve → (maybe) tool → synthesize → critique → cite.
     """
     _ensure_components()
-    out = _agent.run(req.query)
-    return AgentResponse(answer=out)
+    filter = _filter(req.filter)
+    with _Traced("agent", req) as tr:
+        out = _agent.run(req.query, filter)
+    return AgentResponse(answer=out, timings=tr.timings, profile=tr.profile)
 
 @app.get("/tools", response_model=ToolsResponse)
 def tools():
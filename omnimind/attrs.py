@@ -0,0 +1,169 @@
+import os, threading
+import numpy as np
+from pathlib import Path
+from .utils import ensure_dir
+
+"""
+Attribute index over the rows of a DocStore (== faiss ids), for filtered search.
+
+Append-only on disk, like the BM25 index next to it:
+  <base>.attrvals  one "<field>\t<value>" line per distinct type / source; the n-th line
+                   of a field is its id n
+  <base>.attrs     packed (type id, source id) per row (its length is the number of rows indexed)
+
+A filter such as {"type": "audio"} or {"type": ["text", "audio"], "source": "data/raw/notes/"}
+matches rows whose type is one of the given values and whose source starts with one of
+the given prefixes (a file, or a whole source tree); fields combine with AND. mask()
+resolves it to a bool per row with a couple of vectorised compares over .attrs, dead
+rows cleared, and caches it until rows are added or deleted.
+
+Rows missing here are filled in from the docstore on open. Only the docstore's writer
+(see docstore.py) opens this index writable and saves them; an index holding more rows
+than its docstore no longer lines up with it and is rebuilt. With read_only=True (serving
+processes) the files are neither created nor repaired, and rows missing from them are
+indexed in memory only; max_rows pins the index to the rows of a published snapshot.
+"""
+
+FIELDS = ("type", "source")
+_ROW = np.dtype([("type", "<u2"), ("source", "<u4")])
+
+def normalize_filter(filter):
+    """Canonical, hashable form of a filter dict (None for no filter); ValueError on unknown fields."""
+    if not filter:
+        return None
+    if isinstance(filter, tuple):
+        return filter  # already normalized
+    out = []
+    for field in sorted(filter):
+        if field not in FIELDS:
+            raise ValueError(f"unknown filter field {field!r}; expected one of {FIELDS}")
+        values = filter[field]
+        if values is None:
+            continue
+        values = (values,) if isinstance(values, str) else tuple(values)
+        out.append((field, tuple(sorted(set(map(str, values))))))
+    return tuple(out) or None
+
+class AttributeIndex:
+    def __init__(self, path, docstore, read_only=False, max_rows=None, max_cached=256):
+        self.base = str(path)
+        self.read_only = read_only
+        self.max_rows = max_rows
+        self.values_path = self.base + ".attrvals"
+        self.rows_path = self.base + ".attrs"
+        self.docstore = docstore
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._masks = {}  # normalized filter -> bool per row
+        self._gen = 0     # bumped by add / delete; a mask computed across a bump is not cached
+        if not read_only:
+            ensure_dir(Path(self.base).parent)
+            for p in (self.values_path, self.rows_path):
+                if not Path(p).exists():
+                    open(p, "wb").close()
+            rows = os.path.getsize(self.rows_path) // _ROW.itemsize
+            if rows > docstore.n:
+                print(f"[attrs] {self.base} has {rows} rows, its docstore {docstore.n}; re-indexing")
+                for p in (self.values_path, self.rows_path):
+                    open(p, "wb").close()
+        self._load()
+        self._catch_up()
+
+    # ---------- files ----------
+    def _load(self):
+        data = b""
+        if Path(self.values_path).exists():
+            with open(self.values_path, "rb") as f:
+                data = f.read()
+        # a value line without its newline is a torn append; no committed row can reference it
+        data = data[:data.rfind(b"\n") + 1]
+        self.values = {f: [] for f in FIELDS}
+        self.ids = {f: {} for f in FIELDS}
+        for line in data.decode("utf-8").split("\n")[:-1]:
+            field, _, value = line.partition("\t")
+            self.ids[field][value] = len(self.values[field])
+            self.values[field].append(value)
+        rows = np.fromfile(self.rows_path, dtype=_ROW) if Path(self.rows_path).exists() else np.zeros(0, dtype=_ROW)
+        if not self.read_only:
+            with open(self.values_path, "r+b") as f:
+                f.truncate(len(data))
+            with open(self.rows_path, "r+b") as f:
+                f.truncate(rows.nbytes)
+        self.rows = rows[:self.max_rows]
+        self.n = len(self.rows)
+        self._unsaved_values, self._saved_n = [], self.n
+
+    def _catch_up(self, batch=10000):
+        stop = self.docstore.n
+        for start in range(self.n, stop, batch):
+            fids = list(range(start, min(start + batch, stop)))
+            self.add(fids, [m or {} for m in self.docstore.get_many(fids)])  # dead rows never match anyway
+        if self.n > self._saved_n and not self.read_only:
+            print(f"[attrs] Indexed {self.n - self._saved_n} rows missing from {self.base}")
+            self.save()
+
+    def save(self):
+        """Append everything added since the last save; .attrs last, it commits the rows."""
+        if self.n == self._saved_n or self.read_only:
+            return
+        with open(self.values_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{field}\t{value}\n" for field, value in self._unsaved_values))
+        with open(self.rows_path, "ab") as f:
+            f.write(self.rows[self._saved_n:].tobytes())
+        self._unsaved_values, self._saved_n = [], self.n
+
+    # ---------- updates ----------
+    def _value_id(self, field, value):
+        vid = self.ids[field].get(value)
+        if vid is None:
+            vid = self.ids[field][value] = len(self.values[field])
+            self.values[field].append(value)
+            self._unsaved_values.append((field, value))
+        return vid
+
+    def add(self, fids, docs):
+        """Record the attributes of rows fids (the rows right after the last indexed one)."""
+        if not fids:
+            return
+        if fids[0] != self.n:
+            raise ValueError(f"attribute index expects row {self.n}, got {fids[0]}")
+        rows = np.empty(len(fids), dtype=_ROW)
+        rows["type"] = [self._value_id("type", str(d.get("type", ""))) for d in docs]
+        rows["source"] = [self._value_id("source", str(d.get("source", ""))) for d in docs]
+        with self._lock:
+            self.rows = np.concatenate([self.rows, rows])
+            self.n += len(fids)
+            self._masks.clear()
+            self._gen += 1
+
+    def delete(self, fids):
+        """The docstore just deleted rows: cached masks are stale."""
+        if fids:
+            with self._lock:
+                self._masks.clear()
+                self._gen += 1
+
+    # ---------- queries ----------
+    def mask(self, filter):
+        """bool per row (len n) for the rows matching filter and still alive; None for no filter."""
+        key = normalize_filter(filter)
+        if key is None:
+            return None
+        with self._lock:
+            m, gen = self._masks.get(key), self._gen
+        if m is not None:
+            return m
+        rows = self.rows
+        m = self.docstore.alive_mask()[:len(rows)].astype(bool)
+        for field, values in key:
+            if field == "source":
+                ids = [i for i, s in enumerate(self.values["source"]) if s.startswith(values)]
+            else:
+                ids = [self.ids[field][v] for v in values if v in self.ids[field]]
+            m &= np.isin(rows[field], ids)
+        with self._lock:
+            if gen == self._gen:
+                if len(self._masks) >= self.max_cached:
+                    self._masks.clear()
+                self._masks[key] = m
+        return m
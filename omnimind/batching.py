@@ -0,0 +1,96 @@
+import queue, threading, time
+from concurrent.futures import Future
+
+class _Request:
+    __slots__ = ("items", "future")
+
+    def __init__(self, items):
+        self.items = items
+        self.future = Future()
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into batched calls of `fn(items) -> outputs` (one output per item).
+
+    Requests arriving within `max_wait_ms` of the first one are merged, up to
+    `max_batch_size` items, run through `fn` once on a worker thread, and each
+    caller's future receives the slice of outputs for its own items.
+    Usage:
+        enc = MicroBatcher(model_encode, max_batch_size=64, max_wait_ms=5)
+        vecs = enc(["a query"])          # blocks; many threads can call at once
+    """
+    def __init__(self, fn, max_batch_size=64, max_wait_ms=5.0, name="batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._q = queue.Queue()
+        self._carry = None  # request that would have overflowed the previous batch
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "items": 0, "max_queue_depth": 0,
+                       "batch_size_hist": {}, "errors": 0}
+        self._thread = threading.Thread(target=self._loop, name=f"microbatch-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, items) -> Future:
+        req = _Request(list(items))
+        if not req.items:
+            req.future.set_result([])
+            return req.future
+        self._q.put(req)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._q.qsize())
+        return req.future
+
+    def __call__(self, items):
+        return self.submit(items).result()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats, batch_size_hist=dict(self._stats["batch_size_hist"]))
+        s["queue_depth"] = self._q.qsize()
+        s["avg_batch_size"] = s["items"] / s["batches"] if s["batches"] else 0.0
+        s["max_batch_size"], s["max_wait_ms"] = self.max_batch_size, self.max_wait * 1000
+        return s
+
+    def _collect(self):
+        first, self._carry = self._carry or self._q.get(), None
+        batch, n = [first], len(first.items)
+        deadline = time.monotonic() + self.max_wait
+        while n < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if n + len(req.items) > self.max_batch_size:
+                self._carry = req  # leads the next batch
+                break
+            batch.append(req)
+            n += len(req.items)
+        return batch, n
+
+    def _loop(self):
+        while True:
+            batch, n = self._collect()
+            bucket = 1 << max(0, (n - 1).bit_length())  # power-of-two histogram buckets
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["items"] += n
+                hist = self._stats["batch_size_hist"]
+                hist[bucket] = hist.get(bucket, 0) + 1
+            try:
+                out = self.fn([x for req in batch for x in req.items])
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            i = 0
+            for req in batch:
+                req.future.set_result(out[i:i + len(req.items)])
+                i += len(req.items)
@@ -0,0 +1,240 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import yaml
+
+from .memory import VectorMemory
+from .retriever import HybridRetriever
+from .ingest import ingest_dir
+from .rag import synthesize_answer
+from .evaluate import evaluate_file
+from .utils import sha1, ensure_dir, load_jsonl
+
+"""
+Latency / throughput benchmark built on the evaluation harness.
+
+Ingests a corpus into a scratch store (a synthetic one of --docs files, or --raw_dir
+with queries from --eval_jsonl), then measures:
+  ingest        chunks/s through ingest_dir
+  latency       p50/p95/p99 of retrieve + synthesis, one query at a time
+  stages        ms per query in embed, search, lexical, graph, rerank, images, synthesis
+  quality       evaluate_file on the same queries (synthetic ones know their source chunk)
+  concurrency   QPS and p50/p95/p99 with N concurrent clients, in-process (retriever with
+                request batching, as the app serves it) or against a running app (--url)
+  peak_rss_mb   peak resident memory of the benchmark process
+
+    python -m omnimind.benchmark --docs 5000 --queries 500 --concurrency 1,4,16 --out bench.json
+    python -m omnimind.benchmark --raw_dir data/raw --eval_jsonl data/processed/eval_qa.jsonl
+    python -m omnimind.benchmark --url http://127.0.0.1:8000 --concurrency 1,8,32
+    python -m omnimind.benchmark --baseline bench_prev.json   # adds ratios against an earlier run
+
+Results are written as JSON (with the config and machine they came from) so runs compare.
+"""
+
+def percentiles(latencies_s: List[float]) -> Dict[str, float]:
+    if not latencies_s:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    xs = sorted(latencies_s)
+    at = lambda q: 1000.0 * xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+    return {"p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99), "mean_ms": 1000.0 * sum(xs) / len(xs)}
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # KiB on Linux
+
+def synth_corpus(raw_dir: str, n_docs: int, n_queries: int, words_per_doc: int = 60, topics: int = 50,
+                 seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Write n_docs short text files (one chunk each) drawn from per-topic vocabularies and
+    return n_queries eval examples whose positive is the chunk the query words came from.
+    """
+    rnd = random.Random(seed)
+    vocab = [[f"t{t}w{j}" for j in range(200)] for t in range(topics)]
+    common = [f"c{j}" for j in range(500)]
+    docs = []
+    for i in range(n_docs):
+        words = [rnd.choice(vocab[i % topics]) if rnd.random() < 0.6 else rnd.choice(common)
+                 for _ in range(words_per_doc)]
+        p = Path(raw_dir) / f"doc{i:06d}.txt"
+        p.write_text(" ".join(words) + ".", encoding="utf-8")
+        docs.append((str(p), words))
+    examples = []
+    for _ in range(n_queries):
+        path, words = rnd.choice(docs)
+        q = " ".join(rnd.sample(words, min(6, len(words))))
+        examples.append({"query": q, "answers": [" ".join(words[:12])], "positive_ids": [sha1(f"{path}:0")]})
+    return examples
+
+# ---------- load generators ----------
+def _local_client(rtv: HybridRetriever):
+    def call(q):
+        ctxs = rtv.retrieve(q)
+        synthesize_answer(q, ctxs)
+    return call
+
+def _http_client(url: str, timeout_s: float = 60.0):
+    def call(q):
+        req = urllib.request.Request(url.rstrip("/") + "/query", data=json.dumps({"query": q}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout_s) as r:
+            r.read()
+    return call
+
+def run_load(call, queries: List[str], concurrency: int, n_requests: int) -> Dict[str, Any]:
+    """n_requests calls spread over `concurrency` client threads; QPS over the wall time of the whole run."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    it = iter(range(n_requests))
+
+    def client():
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(it, None)
+            if i is None:
+                return
+            t = time.perf_counter()
+            try:
+                call(queries[i % len(queries)])
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for f in [pool.submit(client) for _ in range(concurrency)]:
+            f.result()
+    wall = time.perf_counter() - t0
+    return {"concurrency": concurrency, "requests": n_requests, "errors": errors,
+            "qps": len(latencies) / wall if wall else 0.0, **percentiles(latencies)}
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """current / baseline for the headline numbers (latency: < 1 is better; throughput: > 1 is better)."""
+    ratio = lambda a, b: a / b if b else None
+    out = {"ingest_chunks_per_s": ratio(current["ingest"]["chunks_per_s"], baseline["ingest"]["chunks_per_s"])}
+    for k in ("p50_ms", "p95_ms", "p99_ms"):
+        out[f"latency_{k}"] = ratio(current["latency"][k], baseline["latency"][k])
+    base = {r["concurrency"]: r for r in baseline.get("concurrency", [])}
+    for r in current["concurrency"]:
+        if r["concurrency"] in base:
+            out[f"qps@{r['concurrency']}"] = ratio(r["qps"], base[r["concurrency"]]["qps"])
+    out["peak_rss_mb"] = ratio(current["peak_rss_mb"], baseline["peak_rss_mb"])
+    return out
+
+def run(cfg: Dict[str, Any], work_dir: str, examples: Optional[List[Dict[str, Any]]] = None,
+        raw_dir: Optional[str] = None, n_docs: int = 2000, n_queries: int = 200, words_per_doc: int = 60,
+        concurrency=(1, 4, 16), requests_per_level: Optional[int] = None, url: Optional[str] = None,
+        seed: int = 0) -> Dict[str, Any]:
+    rcfg, ing = cfg["retrieval"], cfg["ingest"]
+    if raw_dir is None:
+        raw_dir = os.path.join(work_dir, "raw")
+        ensure_dir(raw_dir)
+        examples = synth_corpus(raw_dir, n_docs, n_queries, words_per_doc, seed=seed)
+    eval_path = os.path.join(work_dir, "queries.jsonl")
+    with open(eval_path, "w", encoding="utf-8") as f:
+        for ex in examples:
+            f.write(json.dumps(ex, ensure_ascii=False) + "\n")
+    queries = [ex["query"] for ex in examples]
+
+    store = os.path.join(work_dir, "store")
+    vec = VectorMemory(os.path.join(store, "faiss.index"), os.path.join(store, "docstore"), cfg["models"]["embed_text"],
+                       rcfg["index"], lexical_path=os.path.join(store, "bm25") if rcfg["lexical"]["enabled"] else None,
+                       backend_cfg=cfg["inference"])
+    ingest = ingest_dir(vec, raw_dir, os.path.join(store, "manifest.json"), rcfg["chunk_size"], rcfg["chunk_overlap"],
+                        ing["batch_size"], ing["checkpoint_every"], workers=ing["workers"],
+                        embed_workers=ing["embed_workers"], threads_per_embed_worker=ing["threads_per_embed_worker"],
+                        chunker=rcfg["chunker"])
+
+    rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], rcfg["top_k"], rcfg["rerank_k"],
+                          backend_cfg=cfg["inference"])
+    if rcfg["lexical"]["enabled"]:
+        rtv.enable_lexical(rcfg["lexical"])
+    if rcfg["cascade"]["enabled"]:
+        rtv.enable_cascade(rcfg["cascade"])
+    for q in queries[:8]:  # warm up model and index pages
+        rtv.retrieve(q)
+
+    # one query at a time: end-to-end latency and where it goes
+    rtv.timer.reset()
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        ctxs = rtv.retrieve(q)
+        with rtv.timer.stage("synthesis"):
+            synthesize_answer(q, ctxs)
+        latencies.append(time.perf_counter() - t)
+    stages = {k: 1000.0 * s["seconds"] / len(queries) for k, s in rtv.stage_stats().items()}
+    quality = evaluate_file(eval_path, rtv)
+
+    batching = cfg["serving"]["batching"]
+    if url is None and batching["enabled"]:
+        rtv.enable_batching(batching["max_batch_size"], batching["max_wait_ms"])
+    call = _http_client(url) if url else _local_client(rtv)
+    levels = [run_load(call, queries, c, requests_per_level or max(len(queries), 4 * c)) for c in concurrency]
+
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+            "target": url or "in-process",
+            "corpus": {"raw_dir": raw_dir, "docs": ingest["files_added"], "queries": len(queries)},
+            "config": {"models": cfg["models"], "retrieval": rcfg, "inference": cfg["inference"],
+                       "batching": batching},
+        },
+        "ingest": {k: ingest[k] for k in ("chunks_added", "seconds", "chunks_per_s")},
+        "latency": {"queries": len(queries), **percentiles(latencies)},
+        "stages_ms_per_query": stages,
+        "quality": {"retrieval": quality["retrieval"], "ms_per_query_batched": quality["ms_per_query"]},
+        "concurrency": levels,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OmniMind ingest, retrieval latency and throughput.")
+    parser.add_argument("--config", type=str, default="config.yaml")
+    parser.add_argument("--docs", type=int, default=2000, help="Synthetic corpus size (files, one chunk each).")
+    parser.add_argument("--queries", type=int, default=200, help="Synthetic queries.")
+    parser.add_argument("--words_per_doc", type=int, default=60)
+    parser.add_argument("--raw_dir", type=str, default=None, help="Ingest these files instead of a synthetic corpus.")
+    parser.add_argument("--eval_jsonl", type=str, default=None, help="Queries (eval format) to use with --raw_dir.")
+    parser.add_argument("--concurrency", type=str, default="1,4,16", help="Comma-separated client counts.")
+    parser.add_argument("--requests", type=int, default=None, help="Requests per concurrency level.")
+    parser.add_argument("--url", type=str, default=None, help="Load a running app (uvicorn) instead of in-process.")
+    parser.add_argument("--work_dir", type=str, default=None, help="Scratch store location (default: a temp dir).")
+    parser.add_argument("--out", type=str, default=None, help="Write the JSON report here.")
+    parser.add_argument("--baseline", type=str, default=None, help="Earlier report to compare against.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.raw_dir and not args.eval_jsonl:
+        parser.error("--raw_dir needs --eval_jsonl for its queries")
+
+    cfg = yaml.safe_load(open(args.config, "r"))
+    examples = list(load_jsonl(args.eval_jsonl)) if args.eval_jsonl else None
+    levels = [int(c) for c in args.concurrency.split(",")]
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as d:
+        report = run(cfg, d, examples, args.raw_dir, args.docs, args.queries, args.words_per_doc, levels,
+                     args.requests, args.url, args.seed)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        ensure_dir(Path(args.out).parent)
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+
+if __name__ == "__main__":
+    main()
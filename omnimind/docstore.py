@@ -0,0 +1,213 @@
+import json, mmap, os
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from pathlib import Path
+from .utils import ensure_dir
+
+"""
+Compact, append-only docstore.
+
+Row i holds the metadata of faiss id i and lives in three files next to each other:
+  <base>.blob     concatenated UTF-8 JSON records
+  <base>.offsets  uint64 end offset of each record in .blob (fixed width, so row i is O(1) to locate)
+  <base>.alive    one uint8 per row, 0 once the row has been deleted
+
+All three are memory-mapped read-only: opening costs nothing regardless of size and
+a lookup decodes only the requested rows. Appends and deletes write only the bytes
+they touch.
+
+There is one writer at a time: a writable open takes an exclusive lock on <base>.lock
+(held until close() or exit) before it repairs anything, and fails if another handle,
+in this process or another, holds it. Everything kept in step with the rows (BM25,
+attributes, embeddings) is only written by that writer.
+
+read_only=True is for serving processes while another process ingests: nothing is
+created, repaired or written, only committed rows (those with an offset) are mapped,
+and refresh() picks up rows appended since. Deletes are visible at once, since the
+writer flips .alive bytes in place in the shared mapping, unless the reader is pinned
+to a published snapshot: refresh(rows, alive_path) maps exactly the first `rows`
+rows with the frozen copy of .alive written by snapshot_alive().
+"""
+
+def _base(path):
+    p = Path(path)
+    return str(p.with_suffix("")) if p.suffix == ".jsonl" else str(p)
+
+class DocStore:
+    def __init__(self, path, read_only=False):
+        self.base = _base(path)
+        self.read_only = read_only
+        self.blob_path = self.base + ".blob"
+        self.offsets_path = self.base + ".offsets"
+        self.alive_path = self.base + ".alive"
+        if read_only:
+            self._remap()
+            return
+        ensure_dir(Path(self.base).parent)
+        self._lock = _lock(self.base + ".lock")
+        if not Path(self.offsets_path).exists():
+            legacy = self.base + ".jsonl"
+            if Path(legacy).exists():
+                self._migrate_jsonl(legacy)
+            else:
+                for p in (self.blob_path, self.offsets_path, self.alive_path):
+                    open(p, "wb").close()
+        self._repair()
+        self._remap()
+
+    # ---------- files ----------
+    def _repair(self):
+        # the offsets table is authoritative; drop any tail left by an interrupted append
+        n = os.path.getsize(self.offsets_path) // 8
+        with open(self.offsets_path, "r+b") as f:
+            f.truncate(n * 8)
+            if n:
+                f.seek((n - 1) * 8)
+                end = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            else:
+                end = 0
+        with open(self.blob_path, "r+b") as f:
+            f.truncate(end)
+        with open(self.alive_path, "r+b") as f:
+            f.truncate(n)
+
+    def _remap(self, rows=None, alive_path=None):
+        self.n = os.path.getsize(self.offsets_path) // 8 if Path(self.offsets_path).exists() else 0
+        if rows is not None:
+            self.n = min(self.n, rows)
+        # [:n]: a concurrent writer appends .blob/.alive before the offset that commits a row
+        self._ends = np.memmap(self.offsets_path, dtype="<u8", mode="r")[:self.n] if self.n else np.zeros(0, dtype="<u8")
+        alive_path = alive_path or self.alive_path
+        self._alive = np.memmap(alive_path, dtype="u1", mode="r")[:self.n] if self.n else np.zeros(0, dtype="u1")
+        size = os.path.getsize(self.blob_path) if self.n else 0
+        if size:
+            with open(self.blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+        self.live = int(self._alive.sum()) if self.n else 0
+
+    def _migrate_jsonl(self, legacy, batch=10000):
+        """Stream a docstore.jsonl (rows optionally carrying ascending "_fid") into the compact layout."""
+        for p in (self.blob_path, self.offsets_path, self.alive_path):
+            open(p, "wb").close()
+        recs, alive, n, end, count = [], [], 0, 0, 0
+        with open(legacy, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                m = json.loads(line)
+                fid = int(m.pop("_fid", n))
+                if fid < n:
+                    raise ValueError(f"{legacy}: _fid {fid} out of order")
+                gap = fid - n  # deleted ids become dead rows
+                recs += [None] * gap + [m]
+                alive += [0] * gap + [1]
+                n, count = fid + 1, count + 1
+                if len(recs) >= batch:
+                    end = self._write(recs, alive, end)
+                    recs, alive = [], []
+        self._write(recs, alive, end)
+        print(f"[docstore] Migrated {count} records from {legacy}")
+
+    def _write(self, recs, alive, start):
+        blobs = [json.dumps(r or {}, ensure_ascii=False).encode("utf-8") for r in recs]
+        ends = start + np.cumsum([len(b) for b in blobs], dtype="<u8")
+        with open(self.blob_path, "ab") as f:
+            f.write(b"".join(blobs))
+        with open(self.alive_path, "ab") as f:
+            f.write(np.array(alive, dtype="u1").tobytes())
+        # offsets last: a row exists only once its end offset is written
+        with open(self.offsets_path, "ab") as f:
+            f.write(ends.astype("<u8").tobytes())
+        return int(ends[-1]) if len(ends) else start
+
+    def refresh(self, rows=None, alive_path=None):
+        """Map rows committed by another process since the last (re)map, or exactly a published snapshot."""
+        self._remap(rows, alive_path)
+
+    def snapshot_alive(self, tag):
+        """Freeze the current .alive flags into <base>.alive.<tag> (one byte per row); returns its path."""
+        path = f"{self.alive_path}.{tag}"
+        np.fromfile(self.alive_path, dtype="u1", count=self.n).tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return path
+
+    def close(self):
+        """Release the writer lock; the handle stays readable."""
+        if getattr(self, "_lock", None) is not None:
+            self._lock.close()
+            self._lock = None
+            self.read_only = True
+
+    def _writable(self):
+        if self.read_only:
+            raise RuntimeError(f"docstore {self.base} is open read-only")
+
+    # ---------- API ----------
+    def __len__(self):
+        return self.live
+
+    def __contains__(self, fid):
+        return 0 <= fid < self.n and bool(self._alive[fid])
+
+    def _decode(self, fid):
+        start = int(self._ends[fid - 1]) if fid else 0
+        return json.loads(self._blob[start:int(self._ends[fid])].decode("utf-8"))
+
+    def get(self, fid):
+        """Fresh dict for a live row (callers may mutate it), or None."""
+        return self._decode(fid) if fid in self else None
+
+    def get_many(self, fids):
+        return [self.get(int(f)) for f in fids]
+
+    def alive_mask(self):
+        """uint8 per row, 0 for deleted rows (read-only view, replaced on the next append/delete)."""
+        return self._alive
+
+    def live_ids(self):
+        return np.flatnonzero(self._alive).astype("int64")
+
+    def items(self):
+        for fid in self.live_ids():
+            yield int(fid), self._decode(int(fid))
+
+    def append(self, docs):
+        """Append docs as new rows; returns their row ids (== faiss ids)."""
+        if not docs:
+            return []
+        self._writable()
+        start_row = self.n
+        start = int(self._ends[-1]) if self.n else 0
+        self._write(docs, [1] * len(docs), start)
+        self._remap()
+        return list(range(start_row, start_row + len(docs)))
+
+    def delete(self, fids):
+        fids = [int(f) for f in fids if int(f) in self]
+        if fids:
+            self._writable()
+            with open(self.alive_path, "r+b") as f:
+                for fid in fids:
+                    f.seek(fid)
+                    f.write(b"\x00")
+            self._remap()
+        return fids
+
+def _lock(path):
+    """Exclusive lock on path, held while the returned file stays open; BlockingIOError if taken."""
+    f = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError as e:
+        f.close()
+        raise BlockingIOError(e.errno, f"another writer (e.g. a running ingest) holds {path}") from None
+    return f
@@ -0,0 +1,116 @@
+import hashlib, json, os
+import numpy as np
+from pathlib import Path
+from .utils import ensure_dir, write_json_atomic
+
+"""
+Raw embeddings of the rows of a DocStore (== faiss ids), so the index can be rebuilt as
+another type, re-created after losing its file, or re-sharded without running the encoder.
+
+Memory-mapped, next to the docstore:
+  <base>.emb       fixed-width records, row i = docstore row i: a 16-byte key of the chunk id
+                   and its vector (float32, or float16 at half the size)
+  <base>.emb.json  what produced them: model name, inference backend, dim, dtype and a
+                   fingerprint (the embedding of a fixed probe sentence, which changes with
+                   the model's weights even when its name does not)
+
+A row is only trusted when its key matches the chunk id now in that docstore row and its
+vector is unit length, so rows never stored (ingested before this store existed), or
+torn by a crash, are recomputed by the caller and written back with put(). When the
+encoder no longer matches the tag, opening fails with ValueError: only reset=True (the
+ingest and index rebuild paths) starts the store afresh, so other writers such as a
+diagnostic script on another backend never discard the stored vectors, nor mix in
+vectors of a second model.
+"""
+
+DTYPES = ("float32", "float16")
+PROBE = "OmniMind embedding store fingerprint probe."
+
+def _key(chunk_id):
+    return hashlib.blake2b(str(chunk_id).encode("utf-8"), digest_size=16).digest()
+
+def same_model(a, b, min_cosine=0.99):
+    """Whether two tags describe the same encoder (fingerprints may differ by float noise)."""
+    if a.get("model") != b.get("model") or a.get("dim") != b.get("dim"):
+        return False
+    fa, fb = a.get("fingerprint"), b.get("fingerprint")
+    if fa is None or fb is None:
+        return True
+    return float(np.dot(fa, fb)) >= min_cosine
+
+class EmbeddingStore:
+    def __init__(self, path, tag, dtype="float32", reset=False):
+        """
+        tag: {"model", "backend", "dim", "fingerprint"} of the encoder writing to this store.
+        reset: start afresh if the stored vectors are another encoder's (else ValueError).
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding dtype {dtype!r}; expected one of {DTYPES}")
+        self.base = str(path)
+        self.path = self.base + ".emb"
+        self.meta_path = self.base + ".emb.json"
+        ensure_dir(Path(self.base).parent)
+        meta = None
+        if Path(self.meta_path).exists():
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta is not None and not same_model(meta, tag):
+            held = (f"{self.path} holds vectors of {meta.get('model')} ({meta.get('backend')}), "
+                    f"the encoder is {tag.get('model')} ({tag.get('backend')})")
+            if not reset:
+                raise ValueError(f"{held}; re-ingest or run scripts/build_index.py to replace them")
+            print(f"[embstore] {held}; starting afresh")
+            meta = None
+        if meta is None or not Path(self.path).exists():
+            meta = dict(tag, dtype=dtype)
+            open(self.path, "wb").close()
+            write_json_atomic(self.meta_path, meta)
+        elif meta["dtype"] != dtype:
+            print(f"[embstore] {self.path} stores {meta['dtype']}, keeping it (config asks for {dtype})")
+        self.meta = meta
+        self.row = np.dtype([("key", "V16"), ("vec", "<f2" if meta["dtype"] == "float16" else "<f4", (meta["dim"],))])
+        n = os.path.getsize(self.path) // self.row.itemsize
+        with open(self.path, "r+b") as f:
+            f.truncate(n * self.row.itemsize)  # drop a torn tail record
+        self._remap(n)
+
+    def _remap(self, n):
+        self.n = n
+        self.rows = np.memmap(self.path, dtype=self.row, mode="r+", shape=(n,)) if n else np.zeros(0, dtype=self.row)
+
+    @property
+    def nbytes(self):
+        return self.n * self.row.itemsize
+
+    def put(self, fids, chunk_ids, embs):
+        """Store the embeddings of rows fids (new rows past the end, or rows being backfilled)."""
+        fids = np.asarray(fids, dtype="int64")
+        if not len(fids):
+            return
+        end = int(fids.max()) + 1
+        if end > self.n:
+            self.rows = None  # release the old mapping before growing the file
+            with open(self.path, "r+b") as f:
+                f.truncate(end * self.row.itemsize)  # rows in between read back as zero keys: not stored
+            self._remap(end)
+        rec = np.empty(len(fids), dtype=self.row)
+        rec["key"] = [_key(c) for c in chunk_ids]
+        rec["vec"] = embs
+        self.rows[fids] = rec
+
+    def get(self, fids, chunk_ids):
+        """(float32 vectors, bool per row: stored and valid) for rows fids holding chunk_ids."""
+        fids = np.asarray(fids, dtype="int64")
+        vecs = np.zeros((len(fids), self.meta["dim"]), dtype="float32")
+        inside = fids < self.n
+        rec = self.rows[fids[inside]]
+        ok = np.zeros(len(fids), dtype=bool)
+        keys = np.array([_key(c) for c in chunk_ids], dtype="V16")[inside]
+        vecs[inside] = rec["vec"]
+        norms = np.linalg.norm(vecs[inside], axis=1)
+        ok[inside] = (rec["key"] == keys) & (np.abs(norms - 1.0) < 1e-2)
+        return vecs, ok
+
+    def flush(self):
+        if self.n:
+            self.rows.flush()
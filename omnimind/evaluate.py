@@ -5,14 +5,17 @@ from pathlib import Path
 from typing import List, Dict, Any, Tuple
 import yaml
 import math
+import time
 from collections import defaultdict, Counter
 
 from .memory import VectorMemory
 from .retriever import HybridRetriever
+from .kgstore import KGStore
+from .ingest_image import build_image_memory
 
 """
 Lightweight evaluation harness for:
-1) Retrieval: Recall@K and MRR@K against gold supporting IDs.
+1) Retrieval: Recall@K and MRR@K against gold supporting IDs, plus retrieval latency.
 2) RAG Answer Quality: token-overlap Precision/Recall/F1 vs. gold answers (bag-of-words).
 
 Expected evaluation file format (JSONL):
@@ -23,6 +26,11 @@ Expected evaluation file format (JSONL):
 }
 
 You can build this file gradually as you use the system.
+`--fusion both` runs the set twice, dense-only and with BM25 rank fusion, to compare
+recall and latency at the same top_k; `--cascade both` does the same for staged
+reranking and reports the metric deltas against the cross-encoder pairs saved.
+Latency / throughput (per-stage timings, percentiles, QPS under concurrency, ingest
+rate, peak RSS) is measured by omnimind/benchmark.py on top of evaluate_file.
 """
 
 def tokenize(s: str) -> List[str]:
@@ -61,7 +69,7 @@ def mrr_at_k(retrieved_ids: List[str], positive_ids: List[str], k: int) -> float
             return 1.0 / i
     return 0.0
 
-def evaluate_file(eval_path: str, retriever: HybridRetriever, ks=(1, 3, 5, 10)) -> Dict[str, Any]:
+def evaluate_file(eval_path: str, retriever: HybridRetriever, ks=(1, 3, 5, 10), batch_size: int = 32) -> Dict[str, Any]:
     results = {
         "retrieval": {f"Recall@{k}": [] for k in ks} | {f"MRR@{k}": [] for k in ks},
         "rag": {"P": [], "R": [], "F1": []},
@@ -69,15 +77,18 @@ def evaluate_file(eval_path: str, retriever: HybridRetriever, ks=(1, 3, 5, 10))
     }
 
     with open(eval_path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            ex = json.loads(line)
-            query = ex["query"]
+        examples = [json.loads(line) for line in f if line.strip()]
+
+    retrieval_s = 0.0
+    retriever.reset_rerank_stats()
+    for start in range(0, len(examples), batch_size):
+        batch = examples[start:start + batch_size]
+        t = time.perf_counter()
+        batch_ctxs = retriever.retrieve_batch([ex["query"] for ex in batch])
+        retrieval_s += time.perf_counter() - t
+        for ex, ctxs in zip(batch, batch_ctxs):
             gold_answers = ex.get("answers", [])
             pos_ids = ex.get("positive_ids", [])
-
-            ctxs = retriever.retrieve(query)
             retrieved_ids = [c["id"] for c in ctxs]
 
             # Retrieval metrics
@@ -97,9 +108,27 @@ def evaluate_file(eval_path: str, retriever: HybridRetriever, ks=(1, 3, 5, 10))
         "retrieval": {k: (sum(v) / len(v) if v else 0.0) for k, v in results["retrieval"].items()},
         "rag": {k: (sum(v) / len(v) if v else 0.0) for k, v in results["rag"].items()},
         "count": results["count"],
+        "ms_per_query": 1000.0 * retrieval_s / results["count"] if results["count"] else 0.0,
+        "rerank": retriever.rerank_stats(),
     }
     return agg
 
+def _modes(arg: str, enabled: bool) -> List[bool]:
+    if arg == "config":
+        return [enabled]
+    return [False, True] if arg == "both" else [arg == "on"]
+
+def cascade_tradeoff(full: Dict[str, Any], cascade: Dict[str, Any]) -> Dict[str, Any]:
+    """Quality lost (metric deltas, cascade - full) against cross-encoder work and latency saved."""
+    lp_full = full["rerank"]["large_pairs_per_query"]
+    lp_casc = cascade["rerank"]["large_pairs_per_query"]
+    return {
+        "delta": {k: cascade["retrieval"][k] - v for k, v in full["retrieval"].items()},
+        "large_pairs_saved": 1.0 - lp_casc / lp_full if lp_full else 0.0,
+        "early_exit_rate": cascade["rerank"]["early_exits"] / (cascade["rerank"]["queries"] or 1),
+        "latency_saved": 1.0 - cascade["ms_per_query"] / full["ms_per_query"] if full["ms_per_query"] else 0.0,
+    }
+
 def main():
     parser = argparse.ArgumentParser(description="Evaluate OmniMind retrieval and RAG.")
     parser.add_argument("--eval_jsonl", type=str, default="data/processed/eval_qa.jsonl",
@@ -107,17 +136,41 @@ def main():
     parser.add_argument("--config", type=str, default="config.yaml")
     parser.add_argument("--top_k", type=int, default=None, help="Override top_k for retrieval.")
     parser.add_argument("--rerank_k", type=int, default=None, help="Override rerank_k for retrieval.")
+    parser.add_argument("--batch_size", type=int, default=32, help="Queries retrieved per batched call.")
+    parser.add_argument("--fusion", choices=["config", "on", "off", "both"], default="config",
+                        help="BM25 + dense rank fusion: as configured, forced on/off, or both for a comparison.")
+    parser.add_argument("--cascade", choices=["config", "on", "off", "both"], default="config",
+                        help="Staged reranking: as configured, forced on/off, or both to report quality lost vs. cost saved.")
     args = parser.parse_args()
 
     cfg = yaml.safe_load(open(args.config, "r"))
 
-    vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"])
+    vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"], cfg["retrieval"]["index"],
+                       lexical_path=cfg["paths"]["lexical_index"], backend_cfg=cfg["inference"], read_only=True)
     top_k = args.top_k or cfg["retrieval"]["top_k"]
     rerank_k = args.rerank_k or cfg["retrieval"]["rerank_k"]
-    rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], top_k, rerank_k)
-
-    report = evaluate_file(args.eval_jsonl, rtv)
-    print(json.dumps(report, indent=2))
+    rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], top_k, rerank_k, backend_cfg=cfg["inference"])
+    if cfg["retrieval"]["graph"]["enabled"]:
+        rtv.enable_graph(KGStore(cfg["paths"]["kg_store"]), cfg["retrieval"]["graph"])
+    img = build_image_memory(cfg, read_only=True)
+    if img is not None:
+        rtv.enable_images(img, cfg["images"])
+
+    rcfg = cfg["retrieval"]
+    cascades = _modes(args.cascade, rcfg["cascade"]["enabled"])
+    report = {}
+    for fuse in _modes(args.fusion, rcfg["lexical"]["enabled"]):
+        base = "fusion" if fuse else "dense_only"
+        for casc in cascades:
+            rtv.fusion = rtv.cascade = None
+            if fuse:
+                rtv.enable_lexical(rcfg["lexical"])
+            if casc:
+                rtv.enable_cascade(rcfg["cascade"])
+            report[base + ("+cascade" if casc else "")] = evaluate_file(args.eval_jsonl, rtv, batch_size=args.batch_size)
+        if len(cascades) == 2:
+            report[base + ":cascade_vs_full"] = cascade_tradeoff(report[base], report[base + "+cascade"])
+    print(json.dumps(report if len(report) > 1 else next(iter(report.values())), indent=2))
 
 if __name__ == "__main__":
     main()
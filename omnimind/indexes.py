@@ -0,0 +1,159 @@
+import math, time
+import faiss
+import numpy as np
+
+"""
+FAISS index construction from the `retrieval.index` section of config.yaml.
+
+  flat      exact inner-product scan (IDMap2 over IndexFlatIP)
+  ivf_flat  inverted lists over full vectors          (nlist, nprobe)
+  ivf_pq    inverted lists over PQ-compressed vectors (nlist, nprobe, pq_m, pq_nbits)
+  hnsw      graph index                               (M, efConstruction, efSearch)
+
+IVF indexes carry ids natively and need training; HNSW cannot remove vectors, so
+removed chunks stay in the graph as tombstones until the index is rebuilt.
+search_subset() restricts a search to a set of ids (attribute filters).
+"""
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+DEFAULTS = {
+    "type": "flat",
+    "nlist": 1024,
+    "nprobe": 16,
+    "pq_m": 16,
+    "pq_nbits": 8,
+    "M": 32,
+    "efConstruction": 200,
+    "efSearch": 64,
+    "filter_exact_max": 4096,
+    "vectors": "float32",
+}
+
+VECTOR_STORES = ("float32", "float16", "none")
+
+def index_spec(cfg=None):
+    spec = dict(DEFAULTS, **(cfg or {}))
+    if spec["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown retrieval.index.type {spec['type']!r}; expected one of {INDEX_TYPES}")
+    if spec["vectors"] not in VECTOR_STORES:
+        raise ValueError(f"Unknown retrieval.index.vectors {spec['vectors']!r}; expected one of {VECTOR_STORES}")
+    return spec
+
+def build_index(dim, spec):
+    t = spec["type"]
+    if t == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    if t == "hnsw":
+        index = faiss.index_factory(dim, f"IDMap2,HNSW{spec['M']}", faiss.METRIC_INNER_PRODUCT)
+        faiss.downcast_index(index.index).hnsw.efConstruction = spec["efConstruction"]
+        return index
+    codec = "Flat" if t == "ivf_flat" else f"PQ{spec['pq_m']}x{spec['pq_nbits']}"
+    return faiss.index_factory(dim, f"IVF{spec['nlist']},{codec}", faiss.METRIC_INNER_PRODUCT)
+
+def index_type(index):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def min_train_size(spec):
+    if spec["type"] == "ivf_flat":
+        return spec["nlist"]
+    if spec["type"] == "ivf_pq":
+        return max(spec["nlist"], 1 << spec["pq_nbits"])
+    return 0
+
+def supports_remove(index):
+    return index_type(index) != "hnsw"
+
+def is_lossy(index):
+    return index_type(index) == "ivf_pq"
+
+def set_search_params(index, spec):
+    """Apply query-time knobs (nprobe / efSearch); these are not persisted with the index."""
+    t = index_type(index)
+    if t in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = spec["nprobe"]
+    elif t == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = spec["efSearch"]
+
+def search_subset(index, q, k, mask, exact_max=4096):
+    """
+    index.search restricted to the ids set in `mask` (bool per id); returns (D, I) likewise.
+    Up to exact_max ids on an index keeping full vectors (flat / hnsw), those vectors are
+    scanned exactly, so the cost follows the selection rather than the index size. Otherwise
+    FAISS searches with an IDSelectorBitmap and skips unselected ids; IVF probes more lists
+    the more selective the filter (selected ids are then spread thinner over each list).
+    """
+    ids = np.flatnonzero(mask).astype("int64")
+    D = np.full((len(q), k), -np.inf, dtype="float32")
+    I = np.full((len(q), k), -1, dtype="int64")
+    if not len(ids):
+        return D, I
+    t = index_type(index)
+    if len(ids) <= exact_max and t in ("flat", "hnsw"):
+        scores = q @ index.reconstruct_batch(ids).T
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        D[:, :top.shape[1]] = np.take_along_axis(scores, top, axis=1)
+        I[:, :top.shape[1]] = ids[top]
+        return D, I
+    bits = np.packbits(mask, bitorder="little")  # referenced by sel until the search returns
+    sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+    if t in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        frac = len(ids) / max(1, index.ntotal)
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=min(ivf.nlist, math.ceil(ivf.nprobe / frac)))
+    elif t == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=faiss.downcast_index(index.index).hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return index.search(q, k, params=params)
+
+def train(index, vecs, spec, max_train=100_000, seed=0):
+    if index.is_trained:
+        return
+    need = min_train_size(spec)
+    if len(vecs) < need:
+        raise RuntimeError(
+            f"retrieval.index.type={spec['type']} needs at least {need} vectors to train, got {len(vecs)}. "
+            "Ingest with type=flat first, then run `python scripts/build_index.py` once the corpus is larger."
+        )
+    if len(vecs) > max_train:
+        vecs = vecs[np.random.RandomState(seed).choice(len(vecs), max_train, replace=False)]
+    index.train(np.ascontiguousarray(vecs, dtype="float32"))
+
+def reconstruct(index, fids):
+    """Stored vectors for the given ids (approximate for PQ indexes)."""
+    if index_type(index) in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)  # ids are not sequential
+    return np.vstack([index.reconstruct(int(f)) for f in fids]).astype("float32") if len(fids) else \
+        np.zeros((0, index.d), dtype="float32")
+
+def recall_at_k(vecs, queries, spec, k=10, train_size=100_000):
+    """
+    Build `spec` over vecs and compare its top-k for each query against an exact scan.
+    Returns recall@k (fraction of exact neighbours found) and mean latency per query.
+    """
+    ids = np.arange(len(vecs), dtype="int64")
+    exact = faiss.IndexFlatIP(vecs.shape[1])
+    exact.add(vecs)
+    _, gt = exact.search(queries, k)
+
+    index = build_index(vecs.shape[1], spec)
+    t = time.perf_counter()
+    train(index, vecs, spec, max_train=train_size)
+    index.add_with_ids(vecs, ids)
+    build_s = time.perf_counter() - t
+    set_search_params(index, spec)
+    t = time.perf_counter()
+    _, found = index.search(queries, k)
+    ms = (time.perf_counter() - t) * 1000 / len(queries)
+    hits = sum(len(set(g) & set(f)) for g, f in zip(gt, found))
+    return {"recall": hits / (k * len(queries)), "ms_per_query": ms, "build_s": build_s}
@@ -0,0 +1,167 @@
+import time
+from pathlib import Path
+import numpy as np
+
+"""
+CPU inference backends for the embedder and cross-encoder, from the `inference`
+section of config.yaml.
+
+  torch       PyTorch fp32 (reference)
+  torch_int8  PyTorch with nn.Linear layers dynamically quantized to int8
+  onnx        ONNX Runtime fp32 graph (exported by sentence-transformers on first load)
+  onnx_int8   ONNX Runtime graph dynamically quantized to int8 for `quantization`;
+              exported once into onnx_dir and reused afterwards
+
+intra_op_threads / inter_op_threads (0 = library default) go to torch.set_num_*threads
+or the ONNX Runtime session options. The ONNX backends need `optimum[onnxruntime]`.
+Before switching a deployment, run scripts/check_backend.py: parity_report() compares
+embeddings, dense hits and rerank orderings against fp32 over the eval queries.
+"""
+
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+DEFAULTS = {
+    "backend": "torch",
+    "intra_op_threads": 0,
+    "inter_op_threads": 0,
+    "onnx_dir": "./data/models/onnx",
+    "quantization": "avx2",
+}
+
+def backend_spec(cfg=None):
+    spec = dict(DEFAULTS, **(cfg or {}))
+    if spec["backend"] not in BACKENDS:
+        raise ValueError(f"Unknown inference.backend {spec['backend']!r}; expected one of {BACKENDS}")
+    return spec
+
+def _torch_threads(spec):
+    if not (spec["intra_op_threads"] or spec["inter_op_threads"]):
+        return
+    import torch  # torch backends only; the ONNX ones never import it
+    if spec["intra_op_threads"]:
+        torch.set_num_threads(spec["intra_op_threads"])
+    if spec["inter_op_threads"]:
+        try:
+            torch.set_num_interop_threads(spec["inter_op_threads"])
+        except RuntimeError:
+            pass  # only settable once per process, before any inter-op work has run
+
+def _session_options(spec):
+    import onnxruntime as ort
+    so = ort.SessionOptions()
+    if spec["intra_op_threads"]:
+        so.intra_op_num_threads = spec["intra_op_threads"]
+    if spec["inter_op_threads"]:
+        so.inter_op_num_threads = spec["inter_op_threads"]
+        so.execution_mode = ort.ExecutionMode.ORT_PARALLEL  # inter-op threads are idle in sequential mode
+    return so
+
+def _load(cls, name, spec):
+    backend = spec["backend"]
+    if backend in ("torch", "torch_int8"):
+        _torch_threads(spec)
+        model = cls(name, device="cpu") if backend == "torch_int8" else cls(name)
+        if backend == "torch_int8":
+            import torch
+            # CrossEncoder is not an nn.Module in older sentence-transformers; its HF model is
+            target = model if isinstance(model, torch.nn.Module) else model.model
+            torch.quantization.quantize_dynamic(target, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+    kwargs = {"provider": "CPUExecutionProvider", "session_options": _session_options(spec)}
+    if backend == "onnx":
+        return cls(name, backend="onnx", model_kwargs=kwargs)
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    local = Path(spec["onnx_dir"]) / name.replace("/", "__")
+    file_name = f"onnx/model_qint8_{spec['quantization']}.onnx"
+    if not (local / file_name).exists():
+        fp32 = cls(name, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"})
+        fp32.save_pretrained(str(local))
+        export_dynamic_quantized_onnx_model(fp32, spec["quantization"], str(local))
+        print(f"[inference] Quantized {name} -> {local / file_name}")
+    return cls(str(local), backend="onnx", model_kwargs=dict(kwargs, file_name=file_name))
+
+# models loaded by preload(), handed out instead of loading a second copy
+_preloaded = {}
+
+def _key(kind, name, spec):
+    # only the settings that select / configure the model (the rest, e.g. parity thresholds, may not hash)
+    return kind, name, tuple(spec[k] for k in sorted(DEFAULTS))
+
+def preload(embedders=(), cross_encoders=(), cfg=None):
+    """
+    Load models once in a parent process before it forks its serving workers: the weights
+    are then shared copy-on-write (never written after load) instead of copied per worker,
+    and load_embedder / load_cross_encoder return these instances.
+    """
+    spec = backend_spec(cfg)
+    for kind, names, load in (("embed", embedders, load_embedder), ("rank", cross_encoders, load_cross_encoder)):
+        for name in names:
+            if name and _key(kind, name, spec) not in _preloaded:
+                _preloaded[_key(kind, name, spec)] = load(name, cfg)
+
+# sentence-transformers (and torch behind it) is imported on first load, not with this module
+def load_embedder(name, cfg=None):
+    spec = backend_spec(cfg)
+    if _key("embed", name, spec) in _preloaded:
+        return _preloaded[_key("embed", name, spec)]
+    from sentence_transformers import SentenceTransformer
+    return _load(SentenceTransformer, name, spec)
+
+def load_cross_encoder(name, cfg=None):
+    spec = backend_spec(cfg)
+    if _key("rank", name, spec) in _preloaded:
+        return _preloaded[_key("rank", name, spec)]
+    from sentence_transformers import CrossEncoder
+    return _load(CrossEncoder, name, spec)
+
+def _timed(fn, *args, **kwargs):
+    t = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t
+
+def _encode(model, texts, batch_size):
+    embs = np.asarray(model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                                   show_progress_bar=False), dtype="float32")
+    return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+
+def parity_report(queries, candidates, ref_embed, new_embed, ref_rank, new_rank, index=None, k=10,
+                  rerank_k=6, batch_size=64):
+    """
+    Compare a backend against the fp32 reference on the same inputs.
+    candidates: per query, the passage texts to rerank (e.g. the reference top_k).
+    index: optional faiss index to compare dense hits@k for the two query embeddings.
+    Returns cosine stats, dense-hit overlap, top-1 agreement / overlap@rerank_k of the
+    rerank orderings, and per-query latency of both.
+    """
+    passages = [p for ps in candidates for p in ps]
+    ref_q, t_ref_q = _timed(_encode, ref_embed, queries, batch_size)
+    new_q, t_new_q = _timed(_encode, new_embed, queries, batch_size)
+    cos = np.concatenate([(ref_q * new_q).sum(axis=1),
+                          (_encode(ref_embed, passages, batch_size) * _encode(new_embed, passages, batch_size)).sum(axis=1)])
+    report = {"queries": len(queries), "passages": len(passages),
+              "embed": {"cosine_mean": float(cos.mean()), "cosine_min": float(cos.min()),
+                        "ms_per_query_ref": 1000 * t_ref_q / len(queries),
+                        "ms_per_query_new": 1000 * t_new_q / len(queries)}}
+    if index is not None:
+        _, ref_ids = index.search(ref_q, k)
+        _, new_ids = index.search(new_q, k)
+        report["dense"] = {f"overlap@{k}": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_ids, new_ids)]))}
+
+    pairs = [(q, p) for q, ps in zip(queries, candidates) for p in ps]
+    ref_s, t_ref_r = _timed(ref_rank.predict, pairs, batch_size=batch_size)
+    new_s, t_new_r = _timed(new_rank.predict, pairs, batch_size=batch_size)
+    ref_s, new_s = np.asarray(ref_s, dtype="float32"), np.asarray(new_s, dtype="float32")
+    top1, overlap, i = [], [], 0
+    for ps in candidates:
+        if ps:
+            a = np.argsort(-ref_s[i:i + len(ps)])[:rerank_k]
+            b = np.argsort(-new_s[i:i + len(ps)])[:rerank_k]
+            top1.append(float(a[0] == b[0]))
+            overlap.append(len(set(a) & set(b)) / len(a))
+        i += len(ps)
+    report["rerank"] = {"top1_agreement": float(np.mean(top1)) if top1 else 1.0,
+                        f"overlap@{rerank_k}": float(np.mean(overlap)) if overlap else 1.0,
+                        "max_abs_score_diff": float(np.abs(ref_s - new_s).max()) if len(pairs) else 0.0,
+                        "ms_per_query_ref": 1000 * t_ref_r / len(queries),
+                        "ms_per_query_new": 1000 * t_new_r / len(queries)}
+    return report
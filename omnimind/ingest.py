@@ -0,0 +1,307 @@
+from __future__ import annotations
+import json
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+
+from .utils import file_sha1, write_json_atomic
+from .ingest_text import CHUNKER_VERSIONS, TEXT_EXTS, text_file_docs
+from .ingest_image import IMAGE_EXTS, image_file_docs
+from .ingest_audio import AUDIO_EXTS
+
+"""
+Incremental, content-addressed, streaming ingestion.
+
+The manifest records, per source file, the content hash and chunking parameters
+it was ingested with (including the chunker's version, see ingest_text.CHUNKER_VERSIONS)
+plus the faiss ids of its chunks, and the docstore row count at the last checkpoint:
+
+{
+  "files": {"data/raw/notes.txt": {"hash": "...", "size": 123, "mtime_ns": ..., "params": {...}, "fids": [0, 1, 2]}},
+  "rows": {"text": 3, "image": 0}
+}
+
+On each run unchanged files are skipped, changed files have their old chunks
+replaced, and files that disappeared from raw_dir have their vectors removed.
+Text chunks go to the text store; images (when an image store is given) are
+embedded from pixels with CLIP into their own store; audio (when an AudioPool is
+given) is transcribed, with cached transcripts, and its segment-aligned chunks go
+to the text store.
+
+Work is a generator pipeline: discover -> read/chunk (one file at a time) ->
+fixed-size batches -> embed -> append, so peak memory is one batch plus one
+file. Every `checkpoint_every` batches the index and manifest are written
+together; a file whose chunks are not all committed stays marked "partial",
+and a re-run replaces it and drops any rows appended after the last checkpoint.
+
+The final checkpoint publish()es each store that changed as a new snapshot,
+which read-only serving processes swap in whole (see VectorMemory.refresh), so
+they never see a half-ingested run.
+
+Parallel mode (workers / embed_workers > 0) reads and chunks files in a process
+pool and encodes batches across a pool of embedding processes; the calling
+process stays the single writer, so faiss ids and docstore rows keep one order.
+"""
+
+class IngestManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.rows: Dict[str, int] = {}  # per store: docstore rows covered by the last checkpoint
+        if Path(path).exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if "files" in data and isinstance(data["files"], dict):
+                self.files, rows = data["files"], data.get("rows")
+                self.rows = {"text": rows} if isinstance(rows, int) else (rows or {})
+            else:  # first format: the files mapping only
+                self.files = data
+
+    def bootstrap(self, vec) -> None:
+        """Adopt chunks ingested before the manifest existed, so the next run replaces them instead of duplicating."""
+        for fid, m in vec.docstore.items():
+            entry = self.files.setdefault(m["source"], {"hash": None, "params": None, "fids": []})
+            entry["fids"].append(fid)
+
+    def save(self) -> None:
+        write_json_atomic(self.path, {"files": self.files, "rows": self.rows})
+
+def _text_params(vec, chunk_size: int, chunk_overlap: int, chunker: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Text chunking parameters: characters (simple) or embedder tokens sized to its window (token)."""
+    if not chunker or chunker["type"] == "simple":
+        return _simple_params(chunk_size, chunk_overlap)
+    return {"kind": "text", "chunker": "token", "version": CHUNKER_VERSIONS["token"],
+            "size": chunker["max_tokens"], "overlap": chunker["overlap_tokens"],
+            "model": vec.model_name, "window": vec.model.max_seq_length, "boundary": chunker["boundary"]}
+
+def _simple_params(chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+    return {"kind": "text", "chunker": "simple", "version": CHUNKER_VERSIONS["simple"],
+            "size": chunk_size, "overlap": chunk_overlap}
+
+def _file_params(p: Path, chunk_size: int, chunk_overlap: int, image_model: Optional[str],
+                 audio=None, text: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    ext = p.suffix.lower()
+    if ext in TEXT_EXTS:
+        return text or _simple_params(chunk_size, chunk_overlap)
+    if ext in IMAGE_EXTS and image_model:
+        return {"kind": "image", "model": image_model}
+    if ext in AUDIO_EXTS and audio is not None:
+        return audio.params(chunk_size, chunk_overlap)
+    return None
+
+def _kind(entry: Dict[str, Any]) -> str:
+    # entries adopted by bootstrap() have no params; they were text-store chunks
+    return (entry.get("params") or {}).get("kind", "text")
+
+def _store_kind(kind: str) -> str:
+    return "text" if kind == "audio" else kind  # transcripts are searched as text
+
+def _remove(stores, entry: Dict[str, Any]) -> int:
+    store = stores.get(_store_kind(_kind(entry)))
+    return store.remove(entry["fids"], save=False) if store is not None else 0
+
+def _file_docs(p: Path, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if params["kind"] == "text":
+        return text_file_docs(p, size=params["size"], overlap=params["overlap"], chunker=params["chunker"],
+                              model=params.get("model"), window=params.get("window"),
+                              boundary=params.get("boundary", "sentence"))
+    return image_file_docs(p)
+
+# ---------- pipeline stages ----------
+def discover(raw_dir: str, chunk_size: int, chunk_overlap: int, image_model: Optional[str] = None,
+             audio=None, text: Optional[Dict[str, Any]] = None) -> List[Tuple[Path, Dict[str, Any]]]:
+    """Ingestable files under raw_dir with the parameters they would be chunked with (paths only, nothing read)."""
+    out = []
+    for p in sorted(Path(raw_dir).rglob("*")):
+        params = _file_params(p, chunk_size, chunk_overlap, image_model, audio, text) if p.is_file() else None
+        if params is not None:
+            out.append((p, params))
+    return out
+
+def _changed(files, manifest: IngestManifest, stats) -> Iterator[Tuple[Path, Dict[str, Any], str, Any]]:
+    """Yield files whose content or parameters differ from the manifest; count the rest as skipped."""
+    for p, params in files:
+        st = p.stat()
+        entry = manifest.files.get(str(p))
+        if entry and entry.get("params") == params and not entry.get("partial"):
+            # cheap check first: size + mtime unchanged means content unchanged
+            if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+                stats["files_skipped"] += 1
+                continue
+            digest = file_sha1(p)
+            if entry.get("hash") == digest:
+                entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+                stats["files_skipped"] += 1
+                continue
+        else:
+            digest = file_sha1(p)
+        yield p, params, digest, st
+
+def _done(value) -> Future:
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+def _parsed(changed, workers: int = 0, audio=None):
+    """
+    Attach each changed file's chunk docs (order kept): text/images are read and chunked in
+    a process pool when workers > 0, audio is transcribed by the AudioPool.
+    """
+    pool = ProcessPoolExecutor(workers) if workers > 0 else None
+    limit = max(workers, audio.workers if audio is not None else 0, 1) * 4
+    window = deque()  # bounded read-ahead so finished files don't pile up in memory
+    try:
+        for c in changed:
+            p, params = c[0], c[1]
+            if params["kind"] == "audio":
+                fut = audio.submit(p, c[2], params)
+            elif pool is not None:
+                fut = pool.submit(_file_docs, p, params)
+            else:
+                fut = _done(_file_docs(p, params))
+            window.append((c, fut))
+            while window and (len(window) >= limit or window[0][1].done()):
+                c, fut = window.popleft()
+                yield c, fut.result()
+        while window:
+            c, fut = window.popleft()
+            yield c, fut.result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def _chunks(parsed, stores, manifest: IngestManifest, stats) -> Iterator[Tuple[str, Dict[str, Any], bool]]:
+    """Yield (source, doc, is_last_chunk_of_file), retiring each file's old chunks before its new ones."""
+    for (p, params, digest, st), docs in parsed:
+        src = str(p)
+        entry = manifest.files.get(src)
+        if entry:
+            stats["chunks_removed"] += _remove(stores, entry)
+            stats["files_updated"] += 1
+        else:
+            stats["files_added"] += 1
+        manifest.files[src] = {"hash": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                               "params": params, "fids": []}
+        if docs:
+            manifest.files[src]["partial"] = True
+        for i, d in enumerate(docs):
+            yield src, d, i == len(docs) - 1
+
+def _batches(items, sizes):
+    """Group (source, doc, last) items into per-store batches: yields (kind, batch)."""
+    bufs = {kind: [] for kind in sizes}
+    for item in items:
+        kind = "image" if item[1]["type"] == "image" else "text"  # audio transcripts embed as text
+        bufs[kind].append(item)
+        if len(bufs[kind]) >= sizes[kind]:
+            yield kind, bufs[kind]
+            bufs[kind] = []
+    for kind, batch in bufs.items():
+        if batch:
+            yield kind, batch
+
+def _embed(kind, store, docs):
+    """Embeddings for docs plus the indices of the docs they belong to (undecodable images are dropped)."""
+    if kind == "image":
+        return store.model.embedder.encode_paths([d["source"] for d in docs])
+    return store.encode([d["text"] for d in docs]), list(range(len(docs)))
+
+def _checkpoint(stores, manifest: IngestManifest, save_index: bool = True, publish: bool = False) -> None:
+    for kind, store in stores.items():
+        if store is None:
+            continue
+        # index first: the manifest must never reference vectors that were not persisted
+        if publish and (save_index or store.snapshot is None):
+            store.publish()
+        elif save_index:
+            store.save()
+        manifest.rows[kind] = store.docstore.n
+    manifest.save()
+
+def ingest_dir(vec, raw_dir: str, manifest_path: str, chunk_size: int = 800, chunk_overlap: int = 120,
+               batch_size: int = 256, checkpoint_every: int = 16, progress_every_s: float = 5.0,
+               workers: int = 0, embed_workers: int = 0, threads_per_embed_worker: int = 0,
+               img_vec=None, audio=None, chunker: Optional[Dict[str, Any]] = None,
+               progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Bring the vector store in line with raw_dir, touching only files that changed.
+    workers: processes reading/chunking files; embed_workers: embedding processes (0 = in-process).
+    img_vec: CLIP image store (see ingest_image.build_image_memory); images are skipped without it.
+    audio: AudioPool (see ingest_audio.build_audio_pool); audio files are skipped without it.
+    chunker: retrieval.chunker config; type "token" sizes text chunks in the embedder's tokens
+    (chunk_size / chunk_overlap stay in characters for the simple chunker and audio transcripts).
+    progress: called after every batch (and once at the end) with the counters so far plus
+    files_total / files_done, e.g. to report a background job's state.
+    Returns counters: files_added, files_updated, files_removed, files_skipped,
+    chunks_added, chunks_removed, seconds, chunks_per_s.
+    """
+    t0 = last_report = time.perf_counter()
+    manifest = IngestManifest(manifest_path)
+    stores = {"text": vec, "image": img_vec}
+    if not manifest.files and len(vec.docstore):
+        manifest.bootstrap(vec)
+    for kind, store in stores.items():
+        rows = manifest.rows.get(kind)
+        if store is not None and rows is not None and store.docstore.n > rows:
+            # rows appended after the last checkpoint of an interrupted run
+            store.remove(range(rows, store.docstore.n), save=False)
+
+    stats = dict(files_added=0, files_updated=0, files_removed=0, files_skipped=0, chunks_added=0, chunks_removed=0)
+    image_model = img_vec.model.embedder.model_name if img_vec is not None else None
+    text = _text_params(vec, chunk_size, chunk_overlap, chunker)
+    files = discover(raw_dir, chunk_size, chunk_overlap, image_model, audio, text)
+    stream = _chunks(_parsed(_changed(files, manifest, stats), workers, audio), stores, manifest, stats)
+    if embed_workers > 0:
+        vec.start_encode_pool(embed_workers, threads_per_embed_worker)
+        batch_size *= embed_workers  # keep every embedding worker busy per step
+    sizes = {"text": batch_size, "image": img_vec.model.embedder.batch_size * 4 if img_vec is not None else 1}
+    try:
+        for n, (kind, batch) in enumerate(_batches(stream, sizes), start=1):
+            store = stores[kind]
+            embs, kept = _embed(kind, store, [d for _, d, _ in batch])
+            fids = store.add_embeddings([batch[i][1] for i in kept], embs, save=False)
+            fid_of = dict(zip(kept, fids))
+            for i, (src, _, last) in enumerate(batch):
+                entry = manifest.files[src]
+                if i in fid_of:
+                    entry["fids"].append(fid_of[i])
+                if last:
+                    entry.pop("partial", None)
+            stats["chunks_added"] += len(fids)
+            if n % checkpoint_every == 0:
+                _checkpoint(stores, manifest)
+            if progress is not None:
+                progress(_progress(stats, len(files)))
+            if time.perf_counter() - last_report >= progress_every_s:
+                last_report = time.perf_counter()
+                _report(stats, len(files), last_report - t0)
+    finally:
+        stream.close()
+        vec.stop_encode_pool()
+        if audio is not None:
+            audio.close()
+
+    seen = {str(p) for p, _ in files}
+    # entries of a disabled kind stay put, so re-enabling it does not duplicate their vectors
+    enabled = {"text", "image" if img_vec is not None else None, "audio" if audio is not None else None}
+    for src in [s for s, e in manifest.files.items() if s not in seen and _kind(e) in enabled]:
+        stats["chunks_removed"] += _remove(stores, manifest.files.pop(src))
+        stats["files_removed"] += 1
+
+    _checkpoint(stores, manifest, save_index=bool(stats["chunks_added"] or stats["chunks_removed"]), publish=True)
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    stats["chunks_per_s"] = round(stats["chunks_added"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    if progress is not None:
+        progress(_progress(stats, len(files)))
+    return stats
+
+def _progress(stats, n_files):
+    done = stats["files_added"] + stats["files_updated"] + stats["files_skipped"]
+    return dict(stats, files_total=n_files, files_done=done)
+
+def _report(stats, n_files, elapsed):
+    done = _progress(stats, n_files)["files_done"]
+    print(f"[ingest] files {done}/{n_files}  chunks +{stats['chunks_added']} -{stats['chunks_removed']}  "
+          f"{stats['chunks_added'] / elapsed:.1f} chunks/s")
@@ -1,13 +1,26 @@
 from __future__ import annotations
-import os
+import json
+import multiprocessing as mp
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 
-from .utils import sha1
-from .ingest_text import simple_chunks
+from .utils import sha1, file_sha1, ensure_dir, write_json_atomic
 
 AUDIO_EXTS = {".wav", ".mp3", ".m4a", ".flac", ".ogg"}
 
+def _has_cuda() -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+def decode_settings(device: Optional[str] = None, compute_type: Optional[str] = None) -> Tuple[str, str]:
+    """(device, compute_type) a transcriber runs with, None meaning auto: CUDA in float16 if present, else CPU int8."""
+    device = device or ("cuda" if _has_cuda() else "cpu")
+    return device, compute_type or ("float16" if device == "cuda" else "int8")
+
 class AudioTranscriber:
     """
     Minimal wrapper that prefers faster-whisper (GPU/CPU), falls back to openai-whisper.
@@ -15,17 +28,20 @@ class AudioTranscriber:
         tr = AudioTranscriber(model_size="base")
         text, segments = tr.transcribe("/path/audio.mp3")
     """
-    def __init__(self, model_size: str = "base", device: Optional[str] = None):
+    def __init__(self, model_size: str = "base", device: Optional[str] = None, beam_size: int = 1,
+                 cpu_threads: int = 0, compute_type: Optional[str] = None):
         self.backend = None
         self.model = None
         self.model_size = model_size
-        self.device = device  # "cuda", "cpu", or None to auto
+        # device: "cuda", "cpu", or None to auto; compute_type (faster-whisper only): None to auto
+        self.device, self.compute_type = decode_settings(device, compute_type)
+        self.beam_size = beam_size
 
         # Try faster-whisper first (fast, lighter)
         try:
             from faster_whisper import WhisperModel  # type: ignore
-            compute_type = "float16" if (self._has_cuda() and (device in (None, "cuda"))) else "int8"
-            self.model = WhisperModel(model_size, device=self._pick_device(), compute_type=compute_type)
+            self.model = WhisperModel(model_size, device=self.device, compute_type=self.compute_type,
+                                      cpu_threads=cpu_threads)
             self.backend = "faster-whisper"
             return
         except Exception:
@@ -34,7 +50,10 @@ class AudioTranscriber:
         # Fallback: openai-whisper (reference implementation)
         try:
             import whisper  # type: ignore
-            self.model = whisper.load_model(model_size, device=self._pick_device())
+            if cpu_threads:
+                import torch
+                torch.set_num_threads(cpu_threads)
+            self.model = whisper.load_model(model_size, device=self.device)
             self.backend = "whisper"
             return
         except Exception as e:
@@ -46,25 +65,13 @@ class AudioTranscriber:
                 f"Original error: {type(e).__name__}: {e}"
             )
 
-    def _has_cuda(self) -> bool:
-        try:
-            import torch
-            return torch.cuda.is_available()
-        except Exception:
-            return False
-
-    def _pick_device(self) -> str:
-        if self.device:
-            return self.device
-        return "cuda" if self._has_cuda() else "cpu"
-
     def transcribe(self, path: str) -> Tuple[str, List[Dict[str, float]]]:
         """
         Returns:
             transcript_text, segments (each has start, end, text if available)
         """
         if self.backend == "faster-whisper":
-            segments, info = self.model.transcribe(path, beam_size=1)
+            segments, info = self.model.transcribe(path, beam_size=self.beam_size)
             segs = []
             full = []
             for s in segments:
@@ -75,7 +82,7 @@ class AudioTranscriber:
         # openai-whisper
         if self.backend == "whisper":
             import whisper
-            out = self.model.transcribe(path)  # type: ignore[attr-defined]
+            out = self.model.transcribe(path, beam_size=self.beam_size)  # type: ignore[attr-defined]
             text = out.get("text", "").strip()
             segs = [
                 {"start": float(s.get("start", 0.0)), "end": float(s.get("end", 0.0)), "text": s.get("text", "")}
@@ -85,34 +92,181 @@ class AudioTranscriber:
 
         raise RuntimeError("No transcription backend initialized.")
 
-def prepare_audio_docs(raw_dir: str, model_size: str = "base", device: Optional[str] = None,
-                       chunk_size: int = 800, chunk_overlap: int = 120) -> List[Dict[str, Any]]:
+def segment_chunks(segments: List[Dict[str, Any]], size: int = 800, overlap: int = 120) -> List[Dict[str, Any]]:
     """
-    Walks data/raw for audio files, transcribes, chunks, and returns doc dicts
-    compatible with VectorMemory.add_texts().
+    Group consecutive Whisper segments into chunks of about `size` characters, never
+    splitting a segment; up to `overlap` characters of trailing segments are repeated at
+    the start of the next chunk. Each chunk keeps its start/end time and segment spans.
     """
-    transcriber = AudioTranscriber(model_size=model_size, device=device)
-    docs: List[Dict[str, Any]] = []
-    for p in Path(raw_dir).rglob("*"):
-        if p.suffix.lower() in AUDIO_EXTS:
+    chunks, buf = [], []
+    n = 0
+    for s in segments:
+        if not s["text"].strip():
+            continue
+        buf.append(s)
+        n += len(s["text"])
+        if n >= size:
+            chunks.append(buf)
+            keep = 0
+            for i in range(len(buf) - 1, 0, -1):  # the carried tail must be shorter than the chunk
+                if keep + len(buf[i]["text"]) > overlap:
+                    break
+                keep += len(buf[i]["text"])
+            else:
+                i = 0
+            buf, n = buf[i + 1:], keep
+    if buf and (not chunks or buf[-1] is not chunks[-1][-1]):
+        chunks.append(buf)
+    return [{
+        "text": " ".join(s["text"].strip() for s in c),
+        "start": c[0]["start"],
+        "end": c[-1]["end"],
+        "segments": [[s["start"], s["end"]] for s in c],
+    } for c in chunks]
+
+def audio_file_docs(p, transcript: Dict[str, Any], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    segments = transcript["segments"] or [{"start": 0.0, "end": 0.0, "text": transcript["text"]}]
+    return [{
+        "id": sha1(f"{p}:{i}:audio"),
+        "source": str(p),
+        "type": "audio",
+        "text": c["text"],
+        "meta": {
+            "backend": transcript["backend"],
+            "model_size": params["model"],
+            "start": c["start"],
+            "end": c["end"],
+            "segments": c["segments"],
+        }
+    } for i, c in enumerate(segment_chunks(segments, size=params["size"], overlap=params["overlap"]))]
+
+class TranscriptCache:
+    """Transcripts on disk keyed by audio content hash + transcription settings, one JSON file each."""
+    def __init__(self, cache_dir: str):
+        self.dir = Path(cache_dir)
+        ensure_dir(self.dir)
+
+    @staticmethod
+    def key(digest: str, settings: Dict[str, Any]) -> str:
+        return sha1(json.dumps({"hash": digest, **settings}, sort_keys=True))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        p = self.dir / f"{key}.json"
+        if not p.exists():
+            return None
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key: str, transcript: Dict[str, Any]) -> None:
+        write_json_atomic(str(self.dir / f"{key}.json"), transcript)
+
+# ---------- worker processes ----------
+_worker: Optional[AudioTranscriber] = None
+
+def _init_worker(model_size, device, compute_type, beam_size, threads):
+    global _worker
+    _worker = AudioTranscriber(model_size, device, beam_size=beam_size, cpu_threads=threads,
+                               compute_type=compute_type)
+
+def _transcribe(path: str) -> Dict[str, Any]:
+    text, segments = _worker.transcribe(path)
+    return {"text": text, "segments": segments, "backend": _worker.backend}
+
+class AudioPool:
+    """
+    Transcribes audio files for ingest: cached transcripts are reused, misses run on
+    `workers` processes (each with its own model and `threads_per_worker` CPU threads),
+    or in-process when workers is 0.
+    Usage:
+        pool = AudioPool(cfg["audio"])
+        docs = pool.submit(path, file_hash, params).result()
+        pool.close()
+    """
+    def __init__(self, cfg: Dict[str, Any]):
+        self.cfg = cfg
+        self.workers = cfg["workers"]
+        self.cache = TranscriptCache(cfg["cache_dir"])
+        # settings that change the transcript (chunking does not: it is redone from cached segments);
+        # device and precision resolved here, so "auto" on a GPU and on a CPU host never share a key
+        device, compute_type = decode_settings(cfg["device"], cfg["compute_type"])
+        self.settings = {"model": cfg["model_size"], "beam_size": cfg["beam_size"],
+                         "device": device, "compute_type": compute_type}
+        self._pool = None
+        self._local = None
+
+    def params(self, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+        return {"kind": "audio", **self.settings, "size": chunk_size, "overlap": chunk_overlap}
+
+    def submit(self, p: Path, digest: str, params: Dict[str, Any]) -> Future:
+        """Future of the file's chunk docs ([] if it cannot be transcribed)."""
+        out = Future()
+        key = TranscriptCache.key(digest, self.settings)
+        cached = self.cache.get(key)
+        if cached is not None:
+            out.set_result(audio_file_docs(p, cached, params))
+            return out
+
+        def finish(transcript=None, error=None):
+            if error is not None:
+                # non-fatal: the file is skipped, as before
+                print(f"[ingest_audio] Failed {p.name}: {type(error).__name__}: {error}")
+                out.set_result([])
+                return
             try:
-                transcript, segments = transcriber.transcribe(str(p))
-                if not transcript:
-                    continue
-                for i, chunk in enumerate(simple_chunks(transcript, size=chunk_size, overlap=chunk_overlap)):
-                    docs.append({
-                        "id": sha1(f"{p}:{i}:audio"),
-                        "source": str(p),
-                        "type": "audio",
-                        "text": chunk,
-                        "meta": {
-                            "backend": transcriber.backend,
-                            "model_size": model_size,
-                            # keep a small sample of segments for traceability (optional)
-                            "segments_sample": segments[:5] if segments else [],
-                        }
-                    })
+                self.cache.put(key, transcript)
+                out.set_result(audio_file_docs(p, transcript, params) if transcript["text"] else [])
             except Exception as e:
-                # Non-fatal: skip file but print a helpful message
-                print(f"[ingest_audio] Failed {p.name}: {type(e).__name__}: {e}")
-    return docs
+                out.set_exception(e)
+
+        if self.workers <= 0:
+            try:
+                if self._local is None:
+                    c, s = self.cfg, self.settings
+                    self._local = AudioTranscriber(c["model_size"], s["device"], beam_size=c["beam_size"],
+                                                   cpu_threads=c["threads_per_worker"],
+                                                   compute_type=s["compute_type"])
+                text, segments = self._local.transcribe(str(p))
+            except Exception as e:
+                finish(error=e)
+                return out
+            finish({"text": text, "segments": segments, "backend": self._local.backend})
+            return out
+        if self._pool is None:
+            # spawn: forked children would inherit the parent's torch/OpenMP thread state
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=mp.get_context("spawn"),
+                                             initializer=_init_worker,
+                                             initargs=(self.cfg["model_size"], self.settings["device"],
+                                                       self.settings["compute_type"], self.cfg["beam_size"],
+                                                       self.cfg["threads_per_worker"]))
+        fut = self._pool.submit(_transcribe, str(p))
+        fut.add_done_callback(lambda f: finish(error=f.exception()) if f.exception() else finish(f.result()))
+        return out
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+def build_audio_pool(cfg) -> Optional[AudioPool]:
+    """AudioPool from the `audio` config section, or None if audio ingest is disabled."""
+    return AudioPool(cfg["audio"]) if cfg["audio"]["enabled"] else None
+
+def prepare_audio_docs(raw_dir: str, model_size: str = "base", device: Optional[str] = None,
+                       chunk_size: int = 800, chunk_overlap: int = 120, beam_size: int = 1,
+                       workers: int = 0, threads_per_worker: int = 0,
+                       cache_dir: str = "./data/processed/transcripts",
+                       compute_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Walks data/raw for audio files, transcribes (cached, optionally in parallel), chunks
+    along segment boundaries, and returns doc dicts compatible with VectorMemory.add_texts().
+    """
+    pool = AudioPool({"model_size": model_size, "device": device, "compute_type": compute_type,
+                      "beam_size": beam_size, "workers": workers,
+                      "threads_per_worker": threads_per_worker, "cache_dir": cache_dir})
+    params = pool.params(chunk_size, chunk_overlap)
+    try:
+        futs = [pool.submit(p, file_sha1(p), params)
+                for p in sorted(Path(raw_dir).rglob("*")) if p.suffix.lower() in AUDIO_EXTS]
+        return [d for f in futs for d in f.result()]
+    finally:
+        pool.close()
@@ -1,30 +1,105 @@
-from PIL import Image
 from pathlib import Path
-import torch
-from transformers import CLIPProcessor, CLIPModel
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from .utils import sha1
 
+# PIL / torch / transformers are imported where they are used, so importing this module
+# (ingest, app) stays cheap on nodes that never embed images
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg"}
+
+def _load_rgb(path):
+    from PIL import Image
+    try:
+        with Image.open(path) as im:
+            return im.convert("RGB")
+    except Exception as e:
+        print(f"[ingest_image] Failed {Path(path).name}: {type(e).__name__}: {e}")
+        return None
+
 class ImageEmbedder:
-    def __init__(self, model_name="openai/clip-vit-base-patch32"):
+    def __init__(self, model_name="openai/clip-vit-base-patch32", batch_size=32, decode_workers=4):
+        import torch
+        from transformers import CLIPProcessor, CLIPModel
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
+        self.model = CLIPModel.from_pretrained(model_name).to(self.device).eval()
         self.proc = CLIPProcessor.from_pretrained(model_name)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.dim = self.model.config.projection_dim
 
     def encode(self, images):
+        import torch
         inputs = self.proc(images=images, return_tensors="pt").to(self.device)
         with torch.no_grad():
             embs = self.model.get_image_features(**inputs)
             embs = torch.nn.functional.normalize(embs, p=2, dim=-1)
         return embs.cpu().numpy()
 
+    def encode_text(self, texts):
+        """Queries through the CLIP text tower, in the same space as encode()."""
+        import torch
+        inputs = self.proc(text=list(texts), return_tensors="pt", padding=True, truncation=True).to(self.device)
+        with torch.no_grad():
+            embs = self.model.get_text_features(**inputs)
+            embs = torch.nn.functional.normalize(embs, p=2, dim=-1)
+        return embs.cpu().numpy()
+
+    def encode_paths(self, paths):
+        """
+        Decode images on `decode_workers` threads while encoding in batches of `batch_size`.
+        Returns (embeddings, kept) where kept are the indices of paths that decoded.
+        """
+        out, kept = [], []
+        with ThreadPoolExecutor(max(1, self.decode_workers)) as pool:
+            for start in range(0, len(paths), self.batch_size):
+                chunk = list(pool.map(_load_rgb, paths[start:start + self.batch_size]))
+                ok = [i for i, im in enumerate(chunk) if im is not None]
+                if ok:
+                    out.append(self.encode([chunk[i] for i in ok]))
+                    kept += [start + i for i in ok]
+        embs = np.vstack(out).astype("float32") if out else np.zeros((0, self.dim), dtype="float32")
+        return embs, kept
+
+class ClipTextEncoder:
+    """SentenceTransformer-shaped adapter so a VectorMemory over image vectors can encode text queries."""
+    def __init__(self, embedder: ImageEmbedder):
+        self.embedder = embedder
+
+    def get_sentence_embedding_dimension(self):
+        return self.embedder.dim
+
+    def encode(self, texts, batch_size=64, normalize_embeddings=True, show_progress_bar=False):
+        return np.vstack([self.embedder.encode_text(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+def image_file_docs(p):
+    return [{
+        "id": sha1(str(p)),
+        "source": str(p),
+        "type": "image",
+        "text": f"[IMAGE] {p.name}"  # display caption; the vector comes from CLIP pixels
+    }]
+
 def prepare_image_docs(raw_dir):
-    paths = [p for p in Path(raw_dir).rglob("*") if p.suffix.lower() in {".png",".jpg",".jpeg"}]
+    paths = [p for p in Path(raw_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTS]
     docs = []
     for p in paths:
-        docs.append({
-            "id": sha1(str(p)),
-            "source": str(p),
-            "type": "image",
-            "text": f"[IMAGE] {p.name} (visual semantics via CLIP)"  # textual proxy for indexing
-        })
+        docs += image_file_docs(p)
     return docs
+
+def build_image_memory(cfg, read_only=False):
+    """VectorMemory over CLIP image vectors (queried through the CLIP text tower), or None if disabled."""
+    from .memory import VectorMemory, unpublished
+    icfg = cfg["images"]
+    if not icfg["enabled"]:
+        return None
+    embedder = ImageEmbedder(cfg["models"]["clip_vision"], icfg["batch_size"], icfg["decode_workers"])
+    paths = cfg["paths"]["image_index"], cfg["paths"]["image_docstore"]
+    if read_only and unpublished(*paths):
+        # data from before snapshots: migrate and publish it once so the reader below sees it
+        writer = VectorMemory(*paths, cfg["models"]["clip_vision"], icfg["index"], model=ClipTextEncoder(embedder))
+        writer.publish()
+        writer.close()
+    return VectorMemory(*paths, cfg["models"]["clip_vision"], icfg["index"], model=ClipTextEncoder(embedder),
+                        read_only=read_only)
@@ -1,7 +1,16 @@
 import re, os
+from functools import lru_cache
 from pathlib import Path
+import numpy as np
 from .utils import sha1
+
+TEXT_EXTS = {".txt", ".md"}
+# recorded in the ingest manifest's params: bump a chunker's version when its boundaries change,
+# so the next ingest re-chunks the files it chunked before
+CHUNKER_VERSIONS = {"simple": 2, "token": 1}
+
 def simple_chunks(text, size=800, overlap=120):
+    """Character-sized chunks split on whitespace; up to `overlap` characters carry into the next chunk."""
     tokens = re.split(r'(\s+)', text)
     buf, out, n = [], [], 0
     for t in tokens:
@@ -9,21 +18,110 @@ def simple_chunks(text, size=800, overlap=120):
         n += len(t)
         if n >= size:
             out.append("".join(buf))
-            buf = buf[-overlap//2:]
-            n = sum(len(x) for x in buf)
-    if buf: out.append("".join(buf))
+            keep = 0
+            for i in range(len(buf) - 1, 0, -1):  # longest tail within `overlap` characters
+                if keep + len(buf[i]) > overlap:
+                    break
+                keep += len(buf[i])
+            else:
+                i = 0
+            buf, n = buf[i + 1:], keep
+    if buf and "".join(buf).strip(): out.append("".join(buf))
     return out
 
-def prepare_text_docs(raw_dir):
+# ---------- tokenizer-aware chunking ----------
+_BOUNDARIES = {
+    "sentence": re.compile(r"[.!?][\"')\]]*\s+|\n\s*\n"),
+    "paragraph": re.compile(r"\n\s*\n"),
+    "none": None,
+}
+
+def _last_true(mask):
+    """For each i, the largest j <= i with mask[j] (mask[0] must be True)."""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), 0))
+
+class TokenChunker:
+    """
+    Chunks measured in the embedder's own tokens, so none exceed its window.
+
+    The text is tokenized once (offsets only). Chunks end at the last sentence or
+    paragraph boundary in the second half of the token budget, else at a word
+    start, and the next chunk begins `overlap` tokens earlier (on a word start).
+    Every step is O(1) on precomputed arrays, so chunking is linear in the text.
+    Usage:
+        ch = TokenChunker(model.tokenizer, max_tokens=254, overlap=32, boundary="sentence")
+        chunks = ch.chunks(text)
+    """
+    def __init__(self, tokenizer, max_tokens=254, overlap=32, boundary="sentence"):
+        if boundary not in _BOUNDARIES:
+            raise ValueError(f"Unknown chunk boundary {boundary!r}; expected one of {tuple(_BOUNDARIES)}")
+        self.tok = tokenizer
+        self.max_tokens = max(1, max_tokens)
+        self.overlap = min(max(0, overlap), self.max_tokens // 2)
+        self.boundary = _BOUNDARIES[boundary]
+
+    def spans(self, text):
+        """[(char_start, char_end, n_tokens), ...] for each chunk of text."""
+        offs = self.tok(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)["offset_mapping"]
+        n = len(offs)
+        if not n:
+            return []
+        offs = np.asarray(offs, dtype="int64")
+        starts, ends = offs[:, 0], offs[:, 1]
+        word = np.ones(n + 1, dtype=bool)
+        word[1:n] = starts[1:] > ends[:-1]  # whitespace (or any gap) before token i
+        brk = np.zeros(n + 1, dtype=bool)
+        brk[0] = brk[n] = True
+        if self.boundary is not None:
+            pos = np.fromiter((m.end() for m in self.boundary.finditer(text)), dtype="int64")
+            brk[np.searchsorted(starts, pos)] = True  # first token at/after each boundary
+        last_brk, last_word = _last_true(brk), _last_true(word)
+
+        out, s, m = [], 0, self.max_tokens
+        while s < n:
+            e = min(s + m, n)
+            if e < n:
+                if last_brk[e] > s + m // 2:
+                    e = last_brk[e]
+                elif last_word[e] > s:
+                    e = last_word[e]
+            out.append((int(starts[s]), int(ends[e - 1]), e - s))
+            if e >= n:
+                break
+            nxt = max(e - self.overlap, s + 1)
+            s = last_word[nxt] if last_word[nxt] > s else nxt
+        return out
+
+    def chunks(self, text):
+        return [text[a:b] for a, b, _ in self.spans(text)]
+
+@lru_cache(maxsize=8)
+def token_chunker(model_name, window, size, overlap, boundary="sentence"):
+    """
+    TokenChunker for an embedding model (cached per process, so pool workers load the
+    tokenizer once): chunks hold at most min(size, window - special tokens) tokens.
+    """
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(model_name)
+    budget = min(size, window - tok.num_special_tokens_to_add(pair=False))
+    return TokenChunker(tok, budget, overlap, boundary)
+
+def text_file_docs(p, size=800, overlap=120, chunker="simple", model=None, window=None, boundary="sentence"):
+    text = Path(p).read_text(encoding="utf-8", errors="ignore")
+    if chunker == "token":
+        chunks = token_chunker(model, window, size, overlap, boundary).chunks(text)
+    else:
+        chunks = simple_chunks(text, size=size, overlap=overlap)
+    return [{
+        "id": sha1(f"{p}:{i}"),
+        "source": str(p),
+        "type": "text",
+        "text": chunk
+    } for i, chunk in enumerate(chunks)]
+
+def prepare_text_docs(raw_dir, size=800, overlap=120, **chunker):
     docs = []
     for p in Path(raw_dir).rglob("*"):
-        if p.suffix.lower() in {".txt", ".md"}:
-            text = p.read_text(encoding="utf-8", errors="ignore")
-            for i, chunk in enumerate(simple_chunks(text)):
-                docs.append({
-                    "id": sha1(f"{p}:{i}"),
-                    "source": str(p),
-                    "type": "text",
-                    "text": chunk
-                })
+        if p.suffix.lower() in TEXT_EXTS:
+            docs += text_file_docs(p, size=size, overlap=overlap, **chunker)
     return docs
@@ -0,0 +1,85 @@
+import itertools, os, queue, threading, time, traceback
+from collections import OrderedDict
+
+"""
+Background jobs for the app (ingest), run one at a time off the request path.
+
+A job is a plain dict, returned by status() / jobs() as a copy:
+  {"id", "kind", "state": queued | running | done | failed, "submitted_at",
+   "started_at", "finished_at", "progress": {...}, "result": {...}, "error"}
+The job function gets a report(progress_dict) callback and returns the result.
+"""
+
+class JobQueue:
+    """
+    Single worker thread draining a FIFO of jobs. Submitting a kind that is already queued
+    (not yet running) returns that job instead of queuing a second one: a queued ingest
+    will see every file written before it starts anyway. The worker thread runs at a
+    lower CPU priority (`nice`, Linux), so a long ingest leaves the cores to queries.
+    Usage:
+        jobs = JobQueue(nice=10)
+        job = jobs.submit("ingest", lambda report: ingest_dir(..., progress=report))
+        jobs.status(job["id"])   # {"state": "running", "progress": {"files_done": 12, ...}, ...}
+    """
+    def __init__(self, nice=0, keep=100, name="jobs"):
+        self.nice = nice
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._fns = {}
+        self._q = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=f"{name}-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind, fn):
+        with self._lock:
+            for job in self._jobs.values():
+                if job["kind"] == kind and job["state"] == "queued":
+                    return dict(job)
+            job = {"id": str(next(self._ids)), "kind": kind, "state": "queued", "submitted_at": time.time(),
+                   "started_at": None, "finished_at": None, "progress": {}, "result": None, "error": None}
+            self._jobs[job["id"]] = job
+            self._fns[job["id"]] = fn
+            while len(self._jobs) > self.keep:
+                old = next(iter(self._jobs.values()))
+                if old["state"] in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+            self._q.put(job["id"])
+            return dict(job)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, progress=dict(job["progress"])) if job is not None else None
+
+    def jobs(self):
+        with self._lock:
+            return [dict(j, progress=dict(j["progress"])) for j in reversed(self._jobs.values())]
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _loop(self):
+        if self.nice and hasattr(os, "setpriority"):
+            try:
+                # Linux applies the nice value per thread (native id), not to the whole process
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+            except OSError as e:
+                print(f"[jobs] Could not lower the worker's priority: {e}")
+        while True:
+            job_id = self._q.get()
+            with self._lock:
+                job, fn = self._jobs.get(job_id), self._fns.pop(job_id, None)
+            if job is None or fn is None:
+                continue
+            self._update(job, state="running", started_at=time.time())
+            try:
+                result = fn(lambda progress: self._update(job, progress=dict(progress)))
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job, state="failed", error=f"{type(e).__name__}: {e}", finished_at=time.time())
+            else:
+                self._update(job, state="done", result=result, finished_at=time.time())
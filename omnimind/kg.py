@@ -1,18 +1,38 @@
 import spacy, networkx as nx
+import json, os
 from pathlib import Path
-from .utils import load_jsonl
-import pickle
+from .docstore import DocStore
+from .kgstore import KGStore
+
+"""
+Incremental knowledge-graph build.
+
+Per-chunk extraction results are kept in an append-only JSONL log keyed by docstore
+row (faiss id), one record per row:
+
+  {"fid": 12, "doc_id": "...", "source": "...", "ents": [[text, label], ...], "triples": [[s, v, o], ...]}
+  {"fid": 12, "deleted": true}
+
+Re-ingesting a changed file gives its chunks new rows, so on each run only rows that
+are live in the docstore but not in the log are parsed, and rows that are no longer
+live get a deletion record; the graph is replayed from the log. The log is rewritten
+only when deleted records outnumber live ones. Query-time lookups use the compact
+store built from the same records (see kgstore.py).
+"""
+
+# components extract_triples reads: entities, dependencies/sentences, POS and lemmas
+_KEEP = {"tok2vec", "tagger", "attribute_ruler", "lemmatizer", "parser", "ner"}
 
 # english core
 _nlp = None
 def nlp():
     global _nlp
     if _nlp is None:
-        _nlp = spacy.load("en_core_web_sm")
+        name = "en_core_web_sm"
+        _nlp = spacy.load(name, exclude=[c for c in spacy.info(name)["pipeline"] if c not in _KEEP])
     return _nlp
 
-def extract_triples(text):
-    doc = nlp()(text)
+def _triples(doc):
     ents = [(e.text, e.label_) for e in doc.ents]
     triples = []
     # very simple SVO-style pattern (MVP); refine later
@@ -26,21 +46,106 @@ def extract_triples(text):
             triples.append((subj, verb, obj))
     return ents, triples
 
+def extract_triples(text):
+    return _triples(nlp()(text))
+
+def _replay(log_path):
+    """(live records by fid, log line count); drops a torn last line left by an interrupted run."""
+    records, lines = {}, 0
+    if not Path(log_path).exists():
+        return records, lines
+    good = 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            good += len(line)
+            lines += 1
+            r = json.loads(line)
+            if r.get("deleted"):
+                records.pop(r["fid"], None)
+            else:
+                records[r["fid"]] = r
+    if good != os.path.getsize(log_path):
+        with open(log_path, "r+b") as f:
+            f.truncate(good)
+    return records, lines
 
+def _compact(log_path, records):
+    tmp = f"{log_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for fid in sorted(records):
+            f.write(json.dumps(records[fid], ensure_ascii=False) + "\n")
+    os.replace(tmp, log_path)
 
-def build_graph(docstore_path, out_path):
+def graph_from_records(records):
     G = nx.MultiDiGraph()
-    texts = [d for d in load_jsonl(docstore_path) if d.get("type") == "text"]
-    for d in texts:
-        ents, triples = extract_triples(d["text"])
-        for e, label in ents:
+    for r in records.values():
+        for e, label in r["ents"]:
             G.add_node(e, label=label)
-        for s, v, o in triples:
-            G.add_edge(s, o, rel=v, source=d["source"], doc_id=d["id"])
-    
-    # --- Save graph safely (NetworkX 3.x fix) ---
-    with open(out_path, "wb") as f:
-        pickle.dump(G, f)
-    print(f"Knowledge graph saved to {out_path}")
+        for s, v, o in r["triples"]:
+            G.add_edge(s, o, rel=v, source=r["source"], doc_id=r["doc_id"])
     return G
 
+def load_graph(log_path):
+    return graph_from_records(_replay(log_path)[0])
+
+def _open_docstore(docstore_path, index_path=None):
+    """
+    The docstore read-only (a writable open would repair away the appends of an ingest in
+    progress), pinned to the last snapshot published next to index_path when there is one.
+    """
+    store = DocStore(docstore_path, read_only=True)
+    if not Path(store.offsets_path).exists():
+        # no rows yet, or a legacy docstore.jsonl only a writer migrates: never mistake it for "all deleted"
+        raise FileNotFoundError(f"{store.offsets_path} not found; run scripts/ingest.py (or start the API) first")
+    pointer = f"{index_path}.snapshot" if index_path else None
+    if pointer and Path(pointer).exists():
+        with open(pointer, "r", encoding="utf-8") as f:
+            snap = json.load(f)
+        store.refresh(snap["rows"], os.path.join(os.path.dirname(store.alive_path), snap["alive"]))
+    return store
+
+def update_graph(docstore_path, log_path, batch_size=64, n_process=1, index_path=None):
+    """
+    Bring the triple log in line with the docstore (its published snapshot, given the
+    vector index_path): parse only rows not seen before (nlp.pipe, batch_size docs per
+    batch across n_process processes) and retire rows that were deleted.
+    Returns (records by fid, counters).
+    """
+    store = _open_docstore(docstore_path, index_path)
+    records, lines = _replay(log_path)
+    live = set(int(f) for f in store.live_ids())
+    removed = [fid for fid in records if fid not in live]
+    new = sorted(live - records.keys())
+
+    with open(log_path, "a", encoding="utf-8") as log:
+        for fid in removed:
+            del records[fid]
+            log.write(json.dumps({"fid": fid, "deleted": True}) + "\n")
+
+        def rows():
+            for fid in new:
+                m = store.get(fid)
+                yield (m["text"] if m.get("type") == "text" else ""), (fid, m)
+
+        for doc, (fid, m) in nlp().pipe(rows(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+            ents, triples = _triples(doc) if len(doc) else ([], [])
+            r = {"fid": fid, "doc_id": m["id"], "source": m["source"], "ents": ents, "triples": triples}
+            records[fid] = r
+            log.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    lines += len(removed) + len(new)  # deletion markers + new records
+    if lines - len(records) > len(records):
+        _compact(log_path, records)
+    return records, {"docs_added": len(new), "docs_removed": len(removed), "docs": len(records)}
+
+def build_graph(docstore_path, out_path, batch_size=64, n_process=1, store_path=None, index_path=None):
+    """Update the triple log, publish the compact query-time store (if store_path) and return the graph."""
+    records, stats = update_graph(docstore_path, out_path, batch_size, n_process, index_path)
+    G = graph_from_records(records)
+    print(f"Knowledge graph updated in {out_path}: +{stats['docs_added']} -{stats['docs_removed']} docs")
+    if store_path and (stats["docs_added"] or stats["docs_removed"] or not (Path(store_path) / "CURRENT").exists()):
+        meta = KGStore.write(store_path, records)
+        print(f"Compact graph published to {store_path}: {meta['entities']} entities, {meta['edges']} edges")
+    return G
@@ -0,0 +1,201 @@
+import json, os, shutil, time
+from bisect import bisect_left
+import numpy as np
+from pathlib import Path
+from .utils import ensure_dir, write_json_atomic
+from .lexical import tokenize
+
+"""
+Compact, memory-mapped knowledge graph for query-time use.
+
+A generation directory <base>/gen-<n>/ holds flat arrays:
+  entities.blob / entities.offsets   interned entity names (normalised, sorted), uint64 end offsets
+  adj.indptr / adj.nbrs              CSR adjacency, entity id -> neighbour entity ids (both directions of each triple)
+  post.indptr / post.fids            CSR postings, entity id -> docstore rows mentioning it
+
+<base>/CURRENT names the live generation and is replaced atomically after a build, so
+readers never see a half-written graph; the last `keep` generations stay on disk for
+readers that have not switched yet. Everything is opened read-only with mmap,
+costs nothing to load and is shared between processes through the page cache.
+Entity names are normalised with lexical.tokenize, so a lookup is a binary search
+over the sorted table and linking a query is one lookup per token n-gram.
+"""
+
+def normalize_entity(name):
+    return " ".join(tokenize(name))
+
+def _map(path, dtype):
+    return np.memmap(path, dtype=dtype, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=dtype)
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def _csr(rows, cols, n):
+    """Deduplicated CSR (indptr, cols) for the pairs (rows[i], cols[i])."""
+    pairs = np.unique(np.stack([rows, cols], axis=1), axis=0) if len(rows) else np.zeros((0, 2), dtype="int64")
+    indptr = np.zeros(n + 1, dtype="<i8")
+    np.cumsum(np.bincount(pairs[:, 0], minlength=n), out=indptr[1:])
+    return indptr, pairs[:, 1]
+
+class KGStore:
+    def __init__(self, path, reload_check_s=0.0):
+        self.base = str(path)
+        self.reload_check_s = reload_check_s
+        self.gen, self._current_stat, self._checked = None, None, 0.0
+        self._empty()
+        self.refresh(force=True)
+
+    # ---------- files ----------
+    def _empty(self):
+        self.meta, self.n = {"gen": None}, 0
+        self._ends = np.zeros(0, dtype="<u8")
+        self._blob = b""
+        self._adj = self._post = (np.zeros(1, dtype="<i8"), np.zeros(0, dtype="<i8"))
+
+    def refresh(self, force=False):
+        """
+        Re-open if a newer generation was published. Checks CURRENT at most every
+        reload_check_s; a generation pruned before it could be mapped keeps the current one.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_check_s:
+            return False
+        self._checked = now
+        current = Path(self.base) / "CURRENT"
+        st = _stat(current)
+        if st == self._current_stat:
+            return False
+        if st is None:
+            return False  # nothing published yet (or CURRENT mid-replace); keep what is open
+        try:
+            meta = json.loads(current.read_text(encoding="utf-8"))
+            d = Path(self.base) / f"gen-{meta['gen']}"
+            ends = _map(d / "entities.offsets", "<u8")
+            blob = _map(d / "entities.blob", "u1")
+            adj = (_map(d / "adj.indptr", "<i8"), _map(d / "adj.nbrs", "<i8"))
+            post = (_map(d / "post.indptr", "<i8"), _map(d / "post.fids", "<i8"))
+        except FileNotFoundError:
+            return False  # superseded and pruned meanwhile; the next check sees the newer CURRENT
+        self.meta, self.gen, self._current_stat = meta, meta["gen"], st
+        self._ends, self._blob, self._adj, self._post, self.n = ends, blob, adj, post, len(ends)
+        return True
+
+    @staticmethod
+    def write(path, records, keep=3):
+        """
+        Build a new generation from kg triple-log records ({"fid", "ents", "triples"}) and
+        publish it; generations older than the last `keep` are removed. Returns the counts
+        stored in CURRENT.
+        """
+        base = Path(path)
+        ensure_dir(base)
+        mentions = []
+        for r in records.values():
+            names = [e for e, _ in r["ents"]] + [x for s, _, o in r["triples"] for x in (s, o)]
+            mentions.append([normalize_entity(x) for x in names])
+        names = sorted({x for m in mentions for x in m if x})
+        ids = {x: i for i, x in enumerate(names)}
+
+        post_e, post_f, src, dst = [], [], [], []
+        for r, m in zip(records.values(), mentions):
+            for x in set(m):
+                if x:
+                    post_e.append(ids[x])
+                    post_f.append(r["fid"])
+            for s, _, o in r["triples"]:
+                s, o = normalize_entity(s), normalize_entity(o)
+                if s and o and s != o:
+                    src += [ids[s], ids[o]]
+                    dst += [ids[o], ids[s]]
+
+        old = json.loads((base / "CURRENT").read_text(encoding="utf-8")) if (base / "CURRENT").exists() else {}
+        gen = (old.get("gen") or 0) + 1
+        d = base / f"gen-{gen}"
+        shutil.rmtree(d, ignore_errors=True)
+        ensure_dir(d)
+        blobs = [x.encode("utf-8") for x in names]
+        with open(d / "entities.blob", "wb") as f:
+            f.write(b"".join(blobs))
+        np.cumsum([len(b) for b in blobs], dtype="<u8").tofile(d / "entities.offsets")
+        n = len(names)
+        for name, (rows, cols) in (("adj", (src, dst)), ("post", (post_e, post_f))):
+            indptr, cols = _csr(np.array(rows, dtype="int64"), np.array(cols, dtype="int64"), n)
+            indptr.tofile(d / f"{name}.indptr")
+            cols.astype("<i8").tofile(d / f"{name}.{'nbrs' if name == 'adj' else 'fids'}")
+        meta = {"gen": gen, "entities": n, "edges": len(src) // 2, "postings": len(post_e)}
+        write_json_atomic(str(base / "CURRENT"), meta)
+        for p in base.glob("gen-*"):
+            if p.name[4:].isdigit() and int(p.name[4:]) <= gen - keep:
+                shutil.rmtree(p, ignore_errors=True)  # readers still mapping one keep their pages
+        return meta
+
+    # ---------- API ----------
+    def __len__(self):
+        return self.n
+
+    def entity(self, i):
+        start = int(self._ends[i - 1]) if i else 0
+        return bytes(self._blob[start:int(self._ends[i])]).decode("utf-8")
+
+    def lookup(self, name):
+        """Entity id of a (normalised) name, or -1."""
+        key = normalize_entity(name)
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entity(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n and self.entity(lo) == key else -1
+
+    def neighbors(self, i):
+        indptr, nbrs = self._adj
+        return nbrs[indptr[i]:indptr[i + 1]]
+
+    def docs(self, i):
+        indptr, fids = self._post
+        return fids[indptr[i]:indptr[i + 1]]
+
+    def link(self, text, max_ngram=3):
+        """Entity ids mentioned in text: every token n-gram up to max_ngram that names an entity."""
+        if not self.n:
+            return []
+        toks = tokenize(text)
+        found = []
+        for size in range(min(max_ngram, len(toks)), 0, -1):  # longer names first
+            for i in range(len(toks) - size + 1):
+                eid = self.lookup(" ".join(toks[i:i + size]))
+                if eid >= 0 and eid not in found:
+                    found.append(eid)
+        return found
+
+    def expand(self, seeds, hops=2, max_docs=8, max_fanout=16):
+        """
+        Docstore rows reachable from seed entities within `hops` (0 = the seeds' own docs),
+        breadth first, at most max_fanout docs / neighbours per entity: [(fid, hop), ...].
+        """
+        out, seen_docs, seen = [], set(), set(seeds)
+        frontier = list(seeds)
+        for hop in range(hops + 1):
+            nxt = []
+            for e in frontier:
+                for fid in self.docs(e)[:max_fanout]:
+                    fid = int(fid)
+                    if fid not in seen_docs:
+                        seen_docs.add(fid)
+                        out.append((fid, hop))
+                        if len(out) >= max_docs:
+                            return out
+                if hop < hops:
+                    for nb in self.neighbors(e)[:max_fanout]:
+                        nb = int(nb)
+                        if nb not in seen:
+                            seen.add(nb)
+                            nxt.append(nb)
+            frontier = nxt
+        return out
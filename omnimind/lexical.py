@@ -0,0 +1,218 @@
+import math, os, re, threading
+import numpy as np
+from pathlib import Path
+from .utils import ensure_dir
+
+"""
+BM25 inverted index over the text of a DocStore, keyed by the same row ids (== faiss ids).
+
+Append-only on disk, like the docstore it shadows:
+  <base>.vocab     one term per line; line i is term id i
+  <base>.postings  packed (term id, row id, term frequency) records, in row order
+  <base>.doclen    uint32 token count of each row (its length is the number of rows indexed)
+
+Deletes are not written here: queries skip rows the docstore marks dead, and the
+live-document count / total length used for BM25 are kept up to date in memory.
+Rows appended to the docstore but missing here (an interrupted run, or an index
+that predates this one) are indexed from the docstore text on open. Only the
+docstore's writer (see docstore.py) opens this index writable, so rows are saved
+by one process, in docstore order; an index holding more rows than its docstore
+is rebuilt from it.
+
+In memory, postings are a few CSR segments (term -> row ids, tfs); appends go to a
+pending buffer that becomes a new segment at the next search, and segments are
+merged once there are more than `max_segments`.
+
+With read_only=True (serving processes) the files are neither created nor repaired,
+and rows missing from them are indexed in memory only; max_rows pins the index to
+the rows of a published snapshot.
+"""
+
+_POSTING = np.dtype([("term", "<u4"), ("fid", "<u4"), ("tf", "<u2")])
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+def _segment(postings, n_terms):
+    order = np.argsort(postings["term"], kind="stable")  # stable: row ids stay ascending per term
+    p = postings[order]
+    indptr = np.zeros(n_terms + 1, dtype="int64")
+    np.cumsum(np.bincount(p["term"], minlength=n_terms), out=indptr[1:])
+    return indptr, p["fid"].astype("int64"), p["tf"].astype("float32")
+
+class BM25Index:
+    def __init__(self, path, docstore, max_segments=8, read_only=False, max_rows=None):
+        self.base = str(path)
+        self.read_only = read_only
+        self.max_rows = max_rows
+        self.vocab_path = self.base + ".vocab"
+        self.postings_path = self.base + ".postings"
+        self.doclen_path = self.base + ".doclen"
+        self.docstore = docstore
+        self.max_segments = max_segments
+        self._lock = threading.Lock()  # guards pending/segments between ingest and concurrent searches
+        if not read_only:
+            ensure_dir(Path(self.base).parent)
+            for p in (self.vocab_path, self.postings_path, self.doclen_path):
+                if not Path(p).exists():
+                    open(p, "wb").close()
+            rows = os.path.getsize(self.doclen_path) // 4
+            if rows > docstore.n:
+                print(f"[lexical] {self.base} has {rows} rows, its docstore {docstore.n}; re-indexing")
+                for p in (self.vocab_path, self.postings_path, self.doclen_path):
+                    open(p, "wb").close()
+        self._load()
+        self._catch_up()
+
+    # ---------- files ----------
+    def _read(self, path, dtype=None):
+        if not Path(path).exists():  # read-only open before anything was written
+            return b"" if dtype is None else np.zeros(0, dtype=dtype)
+        if dtype is None:
+            with open(path, "rb") as f:
+                return f.read()
+        return np.fromfile(path, dtype=dtype, count=os.path.getsize(path) // np.dtype(dtype).itemsize)
+
+    def _load(self):
+        data = self._read(self.vocab_path)
+        # a term line without its newline is a torn append; no committed posting can reference it
+        data = data[:data.rfind(b"\n") + 1]
+        self.terms = data.decode("utf-8").split("\n")[:-1]
+        self.term_ids = {t: i for i, t in enumerate(self.terms)}
+        self.doclen = self._read(self.doclen_path, "<u4").astype("int64")[:self.max_rows]
+        self.n = len(self.doclen)
+        postings = self._read(self.postings_path, _POSTING)
+        # .doclen is written last, so postings past its end belong to rows that were never committed
+        postings = postings[postings["fid"] < self.n]
+        if not self.read_only:
+            with open(self.vocab_path, "r+b") as f:
+                f.truncate(len(data))
+            with open(self.postings_path, "r+b") as f:
+                f.truncate(postings.nbytes)
+        self.segments = [_segment(postings, len(self.terms))] if len(postings) else []
+        self._pending, self._unsaved = [], []
+        self._saved_terms, self._saved_n = len(self.terms), self.n
+        alive = self.docstore.alive_mask()[:self.n].astype(bool)
+        self.live = int(alive.sum())
+        self.total_len = int(self.doclen[alive].sum())
+
+    def _catch_up(self, batch=10000):
+        stop = self.docstore.n
+        for start in range(self.n, stop, batch):
+            fids = list(range(start, min(start + batch, stop)))
+            self.add(fids, [(m or {}).get("text", "") for m in self.docstore.get_many(fids)],
+                     alive=self.docstore.alive_mask()[start:start + len(fids)])
+        if self.n > self._saved_n and not self.read_only:
+            print(f"[lexical] Indexed {self.n - self._saved_n} rows missing from {self.base}")
+            self.save()
+
+    def save(self):
+        """Append everything added since the last save; .doclen last, it commits the rows."""
+        if self.n == self._saved_n or self.read_only:
+            return
+        with open(self.vocab_path, "a", encoding="utf-8") as f:
+            f.write("".join(t + "\n" for t in self.terms[self._saved_terms:]))
+        with open(self.postings_path, "ab") as f:
+            for p in self._unsaved:
+                f.write(p.tobytes())
+        with open(self.doclen_path, "ab") as f:
+            f.write(self.doclen[self._saved_n:].astype("<u4").tobytes())
+        self._saved_terms, self._saved_n, self._unsaved = len(self.terms), self.n, []
+
+    # ---------- updates ----------
+    def _term_id(self, t):
+        tid = self.term_ids.get(t)
+        if tid is None:
+            tid = self.term_ids[t] = len(self.terms)
+            self.terms.append(t)
+        return tid
+
+    def add(self, fids, texts, alive=None):
+        """Index texts of rows fids (the rows right after the last indexed one)."""
+        if not fids:
+            return
+        if fids[0] != self.n:
+            raise ValueError(f"lexical index expects row {self.n}, got {fids[0]}")
+        terms, rows, tfs, lens = [], [], [], []
+        for fid, text in zip(fids, texts):
+            counts = {}
+            for t in tokenize(text):
+                counts[t] = counts.get(t, 0) + 1
+            lens.append(sum(counts.values()))
+            for t, c in counts.items():
+                terms.append(self._term_id(t))
+                rows.append(fid)
+                tfs.append(min(c, 65535))
+        p = np.empty(len(terms), dtype=_POSTING)
+        p["term"], p["fid"], p["tf"] = terms, rows, tfs
+        with self._lock:
+            self._pending.append(p)
+            self._unsaved.append(p)
+        lens = np.array(lens, dtype="int64")
+        self.doclen = np.concatenate([self.doclen, lens])
+        self.n += len(fids)
+        live = np.ones(len(fids), dtype=bool) if alive is None else np.asarray(alive).astype(bool)
+        self.live += int(live.sum())
+        self.total_len += int(lens[live].sum())
+
+    def delete(self, fids):
+        """Account for rows the docstore just deleted (fids must have been live)."""
+        fids = [f for f in fids if f < self.n]
+        self.live -= len(fids)
+        self.total_len -= int(self.doclen[fids].sum()) if fids else 0
+
+    # ---------- search ----------
+    def _flush(self):
+        with self._lock:
+            if self._pending:
+                self.segments.append(_segment(np.concatenate(self._pending), len(self.terms)))
+                self._pending = []
+            if len(self.segments) > self.max_segments:
+                segs = self.segments
+                p = np.empty(sum(len(s[1]) for s in segs), dtype=_POSTING)
+                p["term"] = np.concatenate([np.repeat(np.arange(len(s[0]) - 1), np.diff(s[0])) for s in segs])
+                p["fid"], p["tf"] = np.concatenate([s[1] for s in segs]), np.concatenate([s[2] for s in segs])
+                self.segments = [_segment(p, len(self.terms))]
+
+    def _postings(self, tid):
+        fids, tfs = [], []
+        for indptr, sf, st in self.segments:
+            if tid + 1 < len(indptr):
+                lo, hi = indptr[tid], indptr[tid + 1]
+                fids.append(sf[lo:hi])
+                tfs.append(st[lo:hi])
+        if not fids:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        return np.concatenate(fids), np.concatenate(tfs)
+
+    def search(self, query, k=10, k1=1.2, b=0.75, mask=None):
+        """Top-k live rows for query by BM25: (row ids, scores), best first. mask: bool per row to restrict to."""
+        self._flush()
+        tids = {self.term_ids[t] for t in tokenize(query) if t in self.term_ids}
+        if not tids or not self.live:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        alive = self.docstore.alive_mask()
+        if mask is not None and len(mask) < self.n:  # rows newer than the mask never match
+            mask = np.concatenate([mask, np.zeros(self.n - len(mask), dtype=bool)])
+        avgdl = self.total_len / self.live or 1.0
+        all_fids, all_scores = [], []
+        for tid in tids:
+            fids, tf = self._postings(tid)
+            keep = alive[fids].astype(bool)
+            if mask is not None:
+                keep &= mask[fids]
+            fids, tf = fids[keep], tf[keep]
+            if not len(fids):
+                continue
+            idf = math.log(1.0 + (self.live - len(fids) + 0.5) / (len(fids) + 0.5))
+            norm = k1 * (1.0 - b + b * self.doclen[fids] / avgdl)
+            all_fids.append(fids)
+            all_scores.append(idf * tf * (k1 + 1.0) / (tf + norm))
+        if not all_fids:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        fids, inv = np.unique(np.concatenate(all_fids), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(all_scores))
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return fids[top], scores[top].astype("float32")
@@ -1,54 +1,439 @@
-import faiss, json, os
+import faiss, json, os, shutil, time
 import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from .utils import ensure_dir, append_jsonl
+from .utils import ensure_dir, append_jsonl, write_json_atomic
+from .docstore import DocStore, _base
+from .lexical import BM25Index
+from .attrs import AttributeIndex
+from .embstore import EmbeddingStore, PROBE
+from .batching import MicroBatcher
+from .cache import TTLCache, normalize_query
+from .timing import StageTimer
+from . import indexes, inference
 
 class VectorMemory:
-    def __init__(self, index_path, docstore_path, model_name):
+    def __init__(self, index_path, docstore_path, model_name, index_cfg=None, model=None, lexical_path=None,
+                 backend_cfg=None, read_only=False, reload_check_s=2.0, reset_vectors=False):
         self.index_path = index_path
         self.docstore_path = docstore_path
-        ensure_dir(Path(index_path).parent)
-        ensure_dir(Path(docstore_path).parent)
-        self.model = SentenceTransformer(model_name)
+        self.lexical_path = lexical_path
+        self.model_name = model_name
+        self.index_cfg = index_cfg
+        self.backend_cfg = backend_cfg
+        # read_only: serving worker next to a separate ingest process; the index is memory-mapped,
+        # nothing is written, and refresh() reopens everything once a new index is published
+        self.read_only = read_only
+        self.reload_check_s = reload_check_s
+        self._index_stat, self._checked = None, 0.0
+        # publish() names the current snapshot in <index>.snapshot; readers follow that pointer
+        self.snapshot_path = f"{index_path}.snapshot"
+        self._snapshot_stat = None
+        pointer = _read_json(self.snapshot_path)
+        self.snapshot = pointer["version"] if pointer and not read_only else None  # version served / last published
+        if not read_only:
+            ensure_dir(Path(index_path).parent)
+            ensure_dir(Path(docstore_path).parent)
+        # any SentenceTransformer-shaped encoder may be passed in (e.g. the CLIP text tower for images)
+        self.model = model if model is not None else inference.load_embedder(model_name, backend_cfg)
         self.dim = self.model.get_sentence_embedding_dimension()
-        self.index = faiss.IndexFlatIP(self.dim)
-        self.ids = []  # match ordering with FAISS
-        self.meta = [] # doc metadata
+        self.spec = indexes.index_spec(index_cfg)
+        # ID-mapped so chunks can be removed/replaced without rebuilding the index
+        self.index = indexes.build_index(self.dim, self.spec)
+        self.docstore = DocStore(docstore_path, read_only)  # row i = faiss id i, memory-mapped
+        # BM25 over the same rows, kept in step with every append (None: dense-only)
+        self.lexical = None
+        if lexical_path and not (read_only and pointer):  # a snapshot reader opens it in refresh() below
+            self.lexical = BM25Index(lexical_path, self.docstore, read_only=read_only)
+        # type / source of every row, for filtered search (see attrs.py)
+        self.attrs = None if read_only and pointer else AttributeIndex(self.docstore.base, self.docstore, read_only)
+        # raw embeddings of every row, so rebuild() never has to re-encode (writers only; see embstore.py).
+        # reset_vectors: ingest / rebuild, which may replace vectors another encoder stored
+        self.vectors = None
+        if not read_only and self.spec["vectors"] != "none":
+            try:
+                self.vectors = EmbeddingStore(self.docstore.base, self._model_tag(), self.spec["vectors"],
+                                              reset=reset_vectors)
+            except ValueError as e:
+                print(f"[memory] {e}; leaving them as they are")
+        self.query_batcher = None  # set by enable_batching() when serving concurrent requests
+        self.embed_cache = None    # set by enable_cache(): query text -> embedding
+        self.encode_pool = None    # set by start_encode_pool() for parallel ingest
+        self.version = 0           # bumped on every index change; keys downstream caches
+        self.timer = StageTimer()  # query-path stage timings (embed, search, fetch, lexical)
 
-        if Path(index_path).exists() and Path(docstore_path).exists():
+        if read_only:
+            self.refresh(force=True)  # the published snapshot (or, before any, the index file as is)
+        elif Path(index_path).exists():
             self._load()
+        indexes.set_search_params(self.index, self.spec)
+
+    @property
+    def ids(self):
+        return [m["id"] for _, m in self.docstore.items()]
 
     def _load(self):
-        self.index = faiss.read_index(self.index_path)
-        with open(self.docstore_path, "r", encoding="utf-8") as f:
-            self.meta = [json.loads(line) for line in f if line.strip()]
-        self.ids = [m["id"] for m in self.meta]
-
-    def _save(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.docstore_path, "w", encoding="utf-8") as f:
-            for m in self.meta:
-                f.write(json.dumps(m, ensure_ascii=False) + "\n")
-
-    def add_texts(self, docs):
-        texts = [d["text"] for d in docs]
-        embs = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
-        embs = np.array(embs).astype("float32")
-        self.index.add(embs)
-        for d in docs:
-            self.meta.append(d)
-            self.ids.append(d["id"])
-        self._save()
-
-    def search(self, query, k=10):
-        q = self.model.encode([query], normalize_embeddings=True)
-        D, I = self.index.search(np.array(q).astype("float32"), k)
-        out = []
-        for dist, idx in zip(D[0], I[0]):
-            if idx == -1: continue
-            m = self.meta[idx]
-            m = dict(m)  # copy
-            m["_score"] = float(dist)
-            out.append(m)
-        return out
+        self._index_stat = _stat(self.index_path)
+        self.index = self._read_index(self.index_path)
+
+    def _read_index(self, path):
+        if self.read_only:
+            # IVF lists / flat codes stay in the page cache, shared by every worker mapping the file
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        else:
+            index = faiss.read_index(path)
+        if isinstance(index, faiss.IndexFlat):
+            # migrate a plain index (sequential ids) to an ID-mapped one
+            vecs = index.reconstruct_n(0, index.ntotal)
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+            index.add_with_ids(vecs, np.arange(len(vecs), dtype="int64"))
+        if indexes.index_type(index) != self.spec["type"]:
+            print(f"[memory] {path} is {indexes.index_type(index)}, config asks for {self.spec['type']}; "
+                  "run `python scripts/build_index.py` to rebuild.")
+        return index
+
+    def save(self):
+        # the docstore persists its own appends/deletes; only the index needs writing
+        if self.read_only:
+            raise RuntimeError(f"{self.index_path} is open read-only")
+        # new file + rename: read-only workers keep their mapping of the old one until they refresh()
+        tmp = f"{self.index_path}.tmp"
+        faiss.write_index(self.index, tmp)
+        os.replace(tmp, self.index_path)
+        if self.lexical is not None:
+            self.lexical.save()
+        self.attrs.save()
+        if self.vectors is not None:
+            self.vectors.flush()
+
+    def close(self):
+        """Writers: release the docstore's writer lock once done writing (see docstore.py)."""
+        self.docstore.close()
+
+    def publish(self, keep=3):
+        """
+        Save, then make the current state the snapshot readers serve: a hard link of the index
+        file (save() always writes a new one), a frozen copy of the docstore's alive flags and
+        the row count, named by one pointer file renamed into place. Snapshots older than the
+        last `keep` are pruned (readers still mapping one keep it until they switch).
+        Returns the new snapshot version.
+        """
+        self.save()
+        prev = _read_json(self.snapshot_path)
+        version = (prev["version"] if prev else 0) + 1
+        tag = f"v{version}"
+        index_file = f"{self.index_path}.{tag}"
+        _link(self.index_path, index_file)
+        alive_file = self.docstore.snapshot_alive(tag)
+        write_json_atomic(self.snapshot_path, {
+            "version": version,
+            "index": os.path.basename(index_file),
+            "alive": os.path.basename(alive_file),
+            "rows": self.docstore.n,
+            "published_at": time.time(),
+        })
+        self.snapshot = version
+        _prune(self.index_path, version - keep + 1)
+        _prune(self.docstore.alive_path, version - keep + 1)
+        return version
+
+    def writer(self, reset_vectors=False):
+        """A writable VectorMemory over the same files, sharing this one's encoder (background ingest)."""
+        return VectorMemory(self.index_path, self.docstore_path, self.model_name, self.index_cfg,
+                            model=self.model, lexical_path=self.lexical_path, backend_cfg=self.backend_cfg,
+                            reset_vectors=reset_vectors)
+
+    def refresh(self, force=False):
+        """
+        Read-only mode: once a writer publish()es a new snapshot, open it off to the side
+        (index file, docstore rows and alive flags, BM25 over those rows) and swap it in whole,
+        so in-flight searches finish on the old one; bump `version` so downstream caches drop.
+        Without any snapshot, reload when a new index is renamed into place by save().
+        Checks at most every reload_check_s. Returns whether anything was reloaded.
+        """
+        if not self.read_only:
+            return False
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_check_s:
+            return False
+        self._checked = now
+        pointer = _stat(self.snapshot_path)
+        if pointer is not None:
+            if pointer == self._snapshot_stat:
+                return False
+            try:
+                self._open_snapshot(_read_json(self.snapshot_path))
+            except FileNotFoundError:
+                return False  # pruned by a newer publish while opening; its pointer is seen next check
+            self._snapshot_stat = pointer
+            return True
+        if _stat(self.index_path) == self._index_stat:
+            return False
+        self.docstore.refresh()  # rows first: the new index may reference them
+        if self.lexical_path:
+            self.lexical = BM25Index(self.lexical_path, self.docstore, read_only=True)
+        self.attrs = AttributeIndex(self.docstore.base, self.docstore, read_only=True)
+        if Path(self.index_path).exists():
+            self._load()
+            indexes.set_search_params(self.index, self.spec)
+        self.version += 1
+        return True
+
+    def _open_snapshot(self, snap):
+        docstore = DocStore(self.docstore_path, read_only=True)
+        docstore.refresh(snap["rows"], os.path.join(os.path.dirname(docstore.alive_path), snap["alive"]))
+        lexical = BM25Index(self.lexical_path, docstore, read_only=True, max_rows=snap["rows"]) if self.lexical_path else None
+        attrs = AttributeIndex(docstore.base, docstore, read_only=True, max_rows=snap["rows"])
+        index = self._read_index(os.path.join(os.path.dirname(self.index_path), snap["index"]))
+        indexes.set_search_params(index, self.spec)
+        self.docstore, self.lexical, self.attrs, self.index = docstore, lexical, attrs, index
+        self.snapshot = snap["version"]
+        self.version += 1
+
+    def encode(self, texts, batch_size=64):
+        if self.encode_pool is not None:
+            embs = self.model.encode_multi_process(texts, self.encode_pool, batch_size=batch_size)
+            embs = np.array(embs).astype("float32")
+            return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+        embs = self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+        return np.array(embs).astype("float32")
+
+    def start_encode_pool(self, workers, threads_per_worker=0):
+        """
+        Spread encode() over `workers` CPU processes, each pinned to `threads_per_worker`
+        torch threads (default: cores / workers) so they don't oversubscribe the machine.
+        """
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        prev = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(threads)  # read by torch in the spawned workers
+        try:
+            self.encode_pool = self.model.start_multi_process_pool(target_devices=["cpu"] * workers)
+        finally:
+            if prev is None:
+                os.environ.pop("OMP_NUM_THREADS", None)
+            else:
+                os.environ["OMP_NUM_THREADS"] = prev
+
+    def stop_encode_pool(self):
+        if self.encode_pool is not None:
+            self.model.stop_multi_process_pool(self.encode_pool)
+            self.encode_pool = None
+
+    def enable_batching(self, max_batch_size=64, max_wait_ms=5.0):
+        """Route query encoding through a MicroBatcher so concurrent searches share forward passes."""
+        self.query_batcher = MicroBatcher(self.encode, max_batch_size, max_wait_ms, name="embed")
+
+    def enable_cache(self, max_entries=10000, ttl_s=3600.0):
+        self.embed_cache = TTLCache(max_entries, ttl_s, name="embeddings")
+
+    def _encode_uncached(self, queries):
+        if self.query_batcher is not None:
+            return np.asarray(self.query_batcher(queries), dtype="float32")
+        return self.encode(queries)
+
+    def encode_queries(self, queries):
+        if self.embed_cache is None:
+            return self._encode_uncached(queries)
+        keys = [normalize_query(q) for q in queries]
+        cached = [self.embed_cache.get(k) for k in keys]
+        miss = [i for i, v in enumerate(cached) if v is None]
+        if miss:
+            for i, v in zip(miss, self._encode_uncached([queries[i] for i in miss])):
+                v = v.copy()  # don't pin the whole batch array in the cache
+                self.embed_cache.put(keys[i], v)
+                cached[i] = v
+        return np.vstack(cached).astype("float32")
+
+    def add_texts(self, docs, save=True):
+        """Embed and append docs; returns the faiss ids assigned to them."""
+        if not docs:
+            return []
+        return self.add_embeddings(docs, self.encode([d["text"] for d in docs]), save=save)
+
+    def add_embeddings(self, docs, embs, save=True):
+        if not docs:
+            return []
+        if self.read_only:
+            raise RuntimeError(f"{self.index_path} is open read-only")
+        indexes.train(self.index, embs, self.spec)  # no-op once trained
+        fids = self.docstore.append(docs)
+        self.index.add_with_ids(embs, np.array(fids, dtype="int64"))
+        if self.lexical is not None:
+            self.lexical.add(fids, [d["text"] for d in docs])
+        self.attrs.add(fids, docs)
+        if self.vectors is not None:
+            self.vectors.put(fids, [d["id"] for d in docs], embs)
+        self.version += 1
+        if save:
+            self.save()
+        return fids
+
+    def remove(self, fids, save=True):
+        """Drop the given faiss ids from the index and docstore; returns how many were removed."""
+        fids = [int(f) for f in fids]
+        live = self.docstore.delete(fids)
+        if self.lexical is not None:
+            self.lexical.delete(live)
+        self.attrs.delete(live)
+        if indexes.supports_remove(self.index) and fids:
+            # all ids, not only live rows: after a crash the saved index can hold vectors of rows already deleted
+            self.index.remove_ids(np.array(fids, dtype="int64"))
+        # else: HNSW keeps the vectors; dead docstore rows filter them out until rebuild()
+        if not live:
+            return 0
+        self.version += 1
+        if save:
+            self.save()
+        return len(live)
+
+    def _model_tag(self):
+        try:
+            probe = np.asarray(self.model.encode([PROBE], normalize_embeddings=True, show_progress_bar=False),
+                               dtype="float32")[0]
+            fingerprint = [round(float(x), 6) for x in probe]
+        except RuntimeError:  # an encoder stand-in (shards.VectorsOnly)
+            fingerprint = None
+        return {"model": self.model_name, "backend": inference.backend_spec(self.backend_cfg)["backend"],
+                "dim": self.dim, "fingerprint": fingerprint}
+
+    def vectors_for(self, fids, batch_size=256):
+        """
+        Embeddings of docstore rows fids, from the cheapest exact source: the embedding store,
+        else the index when it keeps vectors exactly, else the encoder. Rows the store was
+        missing are written back to it, so this is paid once.
+        """
+        fids = np.asarray(fids, dtype="int64")
+        ids = [m["id"] for m in self.docstore.get_many(fids)]
+        if self.vectors is not None:
+            vecs, ok = self.vectors.get(fids, ids)
+        else:
+            vecs, ok = np.zeros((len(fids), self.dim), dtype="float32"), np.zeros(len(fids), dtype=bool)
+        miss = np.flatnonzero(~ok)
+        from_index = len(miss) and not indexes.is_lossy(self.index) and self.index.ntotal > 0
+        if from_index:
+            vecs[miss] = indexes.reconstruct(self.index, fids[miss])
+        else:
+            for i in range(0, len(miss), batch_size):
+                part = miss[i:i + batch_size]
+                vecs[part] = self.encode([d["text"] for d in self.docstore.get_many(fids[part])])
+        if len(miss):
+            print(f"[memory] {len(fids) - len(miss)} vectors from the embedding store, {len(miss)} "
+                  f"{'copied from the index' if from_index else 're-encoded'}")
+            if self.vectors is not None:
+                self.vectors.put(fids[miss], [ids[i] for i in miss], vecs[miss])
+        return vecs
+
+    def rebuild(self, index_cfg=None, batch_size=256):
+        """
+        Rebuild the index (optionally as a different type) over all live chunks, from the
+        stored embeddings (see vectors_for); nothing is re-encoded once they are all stored.
+        """
+        spec = indexes.index_spec(index_cfg) if index_cfg is not None else self.spec
+        fids = self.docstore.live_ids()
+        vecs = self.vectors_for(fids, batch_size)
+        index = indexes.build_index(self.dim, spec)
+        indexes.train(index, vecs, spec)
+        index.add_with_ids(vecs, fids)
+        indexes.set_search_params(index, spec)
+        self.index, self.spec = index, spec
+        self.version += 1
+        self.publish()
+        return len(fids)
+
+    def search(self, query, k=10, filter=None):
+        return self.search_batch([query], k, filter)[0]
+
+    def search_batch(self, queries, k=10, filter=None):
+        """
+        One encode pass and one index.search for all queries; returns a hit list per query.
+        filter: {"type": ..., "source": ...} (see attrs.py) restricts hits to matching chunks.
+        """
+        if not queries:
+            return []
+        with self.timer.stage("embed", len(queries)):
+            q = self.encode_queries(list(queries))
+        return self.search_vectors(q, k, filter)
+
+    def search_vectors(self, q, k=10, filter=None):
+        """search_batch for queries already encoded (normalized float32 rows), e.g. by a shard coordinator."""
+        index, attrs = self.index, self.attrs  # refresh() may swap them in the meantime
+        mask = attrs.mask(filter) if filter else None
+        with self.timer.stage("search", len(q)):
+            if mask is not None:
+                # only live matching ids are selected, so no tombstone slack is needed
+                D, I = indexes.search_subset(index, q, k, mask, self.spec["filter_exact_max"])
+            else:
+                # tombstoned vectors (HNSW) may occupy some of the top slots
+                D, I = index.search(q, k + max(0, index.ntotal - len(self.docstore)))
+        results = []
+        with self.timer.stage("fetch", len(q)):
+            for drow, irow in zip(D, I):
+                out = []
+                for dist, idx in zip(drow, irow):
+                    if idx == -1: continue
+                    m = self.docstore.get(int(idx))  # decoded fresh, safe to annotate
+                    if m is None: continue
+                    m["_score"] = float(dist)
+                    out.append(m)
+                results.append(out[:k])
+        return results
+
+    def search_lexical_batch(self, queries, k=10, k1=1.2, b=0.75, filter=None):
+        """BM25 hits per query (docstore rows with "_bm25"); empty lists without a lexical index."""
+        if self.lexical is None:
+            return [[] for _ in queries]
+        mask = self.attrs.mask(filter) if filter else None
+        results = []
+        for q in queries:
+            with self.timer.stage("lexical"):
+                fids, scores = self.lexical.search(q, k, k1, b, mask=mask)
+            out = []
+            for fid, sc in zip(fids, scores):
+                m = self.docstore.get(int(fid))
+                if m is None: continue
+                m["_bm25"] = float(sc)
+                out.append(m)
+            results.append(out)
+        return results
+
+def unpublished(index_path, docstore_path):
+    """
+    Whether a store holds data that snapshot readers cannot see yet: an index saved before
+    publish() existed, or a legacy docstore.jsonl that only a writer migrates.
+    """
+    if Path(f"{index_path}.snapshot").exists():
+        return False
+    return Path(index_path).exists() or Path(_base(docstore_path) + ".jsonl").exists()
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _link(src, dst):
+    """dst becomes another name for src's file (a copy where hard links are not supported)."""
+    tmp = f"{dst}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+def _prune(path, below):
+    """Remove the <path>.v<N> snapshot files with N < below."""
+    p = Path(path)
+    for old in p.parent.glob(p.name + ".v*"):
+        n = old.name[len(p.name) + 2:]
+        if n.isdigit() and int(n) < below:
+            old.unlink(missing_ok=True)
+
+def _stat(path):
+    """Identity of the file currently at path (a rename-over gives a new inode), None if absent."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
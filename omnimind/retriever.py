@@ -1,18 +1,363 @@
-from sentence_transformers import CrossEncoder
+import math, threading
 from .memory import VectorMemory
+from .batching import MicroBatcher
+from .cache import TTLCache, normalize_query
+from .attrs import normalize_filter
+from . import inference
 
 class HybridRetriever:
-    def __init__(self, vecmem: VectorMemory, cross_encoder_name: str, top_k=12, rerank_k=6):
+    def __init__(self, vecmem: VectorMemory, cross_encoder_name: str, top_k=12, rerank_k=6, batch_size=64,
+                 backend_cfg=None):
         self.vecmem = vecmem
-        self.rank = CrossEncoder(cross_encoder_name)
+        self.backend_cfg = backend_cfg
+        self.rank = inference.load_cross_encoder(cross_encoder_name, backend_cfg)
         self.top_k, self.rerank_k = top_k, rerank_k
+        self.batch_size = batch_size
+        self.rank_batcher = None
+        self.rerank_cache = None  # (query, doc id) -> cross-encoder score
+        self.result_cache = None  # (query, top_k, rerank_k, index version) -> final contexts
+        self._cache_version = None
+        self.image_mem = None     # CLIP image store, see enable_images()
+        self.fusion = None        # BM25 + dense rank fusion settings, see enable_lexical()
+        self.cascade = None       # staged reranking settings, see enable_cascade()
+        self.graph = None         # KGStore for entity-linked expansion, see enable_graph()
+        self.small_rank = None    # optional distilled cross-encoder for the cascade's middle stage
+        self.shards = None        # ShardCoordinator searched instead of vecmem's index, see enable_shards()
+        self._small_name = None
+        self._counts = {"queries": 0, "candidates": 0, "small_pairs": 0, "large_pairs": 0, "early_exits": 0}
+        self._counts_lock = threading.Lock()
+        self.timer = vecmem.timer  # stage timings shared with the vector store
 
-    def retrieve(self, query: str):
-        initial = self.vecmem.search(query, k=self.top_k)
-        pairs = [(query, d["text"]) for d in initial]
-        scores = self.rank.predict(pairs)
-        rescored = sorted(
-            [dict(d, _rank=float(s)) for d, s in zip(initial, scores)],
-            key=lambda x: x["_rank"], reverse=True
-        )[:self.rerank_k]
-        return rescored
+    def enable_images(self, image_mem, cfg):
+        """
+        Merge CLIP image hits into the results (cfg: the `images` config section).
+        Cross-encoder logits and CLIP cosines live on different scales, so both are squashed
+        to (0, 1) before merging: sigmoid(logit) for text and
+        weight * sigmoid((cos - score_center) * score_scale) for images.
+        """
+        self.image_mem = image_mem
+        self.image_k, self.image_weight = cfg["top_k"], cfg["weight"]
+        self.image_center, self.image_scale = cfg["score_center"], cfg["score_scale"]
+
+    def enable_lexical(self, cfg):
+        """
+        Fuse BM25 candidates (cfg: the `retrieval.lexical` section) with the dense ones by
+        reciprocal rank fusion, sum of 1 / (rrf_k + rank), before reranking; top_k then caps
+        the fused list, so the cross-encoder scores the same number of pairs as dense-only.
+        """
+        if self.vecmem.lexical is None and self.shards is None:
+            raise ValueError("enable_lexical needs a VectorMemory built with lexical_path (or shards)")
+        self.fusion = {k: cfg[k] for k in ("top_k", "rrf_k", "k1", "b")}
+
+    def enable_cascade(self, cfg):
+        """
+        Rerank in stages (cfg: the `retrieval.cascade` section) instead of sending every
+        candidate to the cross-encoder:
+          1. prune by the retrieval order to prefilter_k, dropping dense hits more than
+             dense_margin below the best cosine;
+          2. score survivors with small_model (if set); when the rerank_k-th score leads the
+             next one by exit_margin the result is settled and the large model is skipped,
+             otherwise the best small_keep go on;
+          3. score what is left with the full cross-encoder.
+        Passages are cut to max_passage_tokens of the tokenizer before any model sees them.
+        """
+        self.cascade = dict(cfg)
+        if cfg.get("small_model") != self._small_name:  # re-enabling with the same model reuses it
+            self._small_name = cfg.get("small_model")
+            self.small_rank = inference.load_cross_encoder(self._small_name, self.backend_cfg) if self._small_name else None
+
+    def rerank_stats(self):
+        """Cross-encoder work so far: candidates seen, pairs scored per model, early exits."""
+        with self._counts_lock:
+            s = dict(self._counts)
+        q = s["queries"] or 1
+        s["large_pairs_per_query"] = s["large_pairs"] / q
+        s["small_pairs_per_query"] = s["small_pairs"] / q
+        return s
+
+    def reset_rerank_stats(self):
+        with self._counts_lock:
+            for k in self._counts:
+                self._counts[k] = 0
+
+    def stage_stats(self):
+        """Wall time per query-path stage (embed, search, fetch, lexical, graph, rerank, images) so far."""
+        return self.timer.stats()
+
+    def _count(self, **kw):
+        with self._counts_lock:
+            for k, v in kw.items():
+                self._counts[k] += v
+
+    def enable_graph(self, kg, cfg):
+        """
+        Add knowledge-graph neighbours as candidates (cfg: the `retrieval.graph` section): entities
+        linked in the query (token n-grams up to max_ngram) are expanded up to `hops` hops and at
+        most max_docs of the chunks mentioning them are appended to the candidates for reranking.
+        """
+        self.graph = kg
+        self.graph_cfg = {k: cfg[k] for k in ("hops", "max_docs", "max_fanout", "max_ngram")}
+
+    def enable_shards(self, coordinator):
+        """
+        Search shard workers (a shards.ShardCoordinator) instead of vecmem's own index: queries
+        are embedded here once (vecmem's batching / cache still apply) and the shards' merged
+        dense and BM25 top-k go on to fusion and reranking. Graph expansion still reads
+        vecmem's docstore. Call before enable_lexical().
+        """
+        self.shards = coordinator
+
+    def index_version(self):
+        return (self.vecmem.version, self.image_mem.version if self.image_mem is not None else None,
+                self.graph.gen if self.graph is not None else None,
+                self.shards.version if self.shards is not None else None)
+
+    def enable_batching(self, max_batch_size=64, max_wait_ms=5.0):
+        """Coalesce concurrent callers' embedding and cross-encoder work into shared batches."""
+        self.vecmem.enable_batching(max_batch_size, max_wait_ms)
+        self.rank_batcher = MicroBatcher(self._predict, max_batch_size, max_wait_ms, name="rerank")
+
+    def batching_stats(self):
+        if self.rank_batcher is None:
+            return {}
+        return {"embed": self.vecmem.query_batcher.stats(), "rerank": self.rank_batcher.stats()}
+
+    def enable_cache(self, cfg):
+        """cfg: {"embeddings"|"rerank"|"results": {"max_entries": int, "ttl_s": float}}"""
+        self.vecmem.enable_cache(**cfg["embeddings"])
+        self.rerank_cache = TTLCache(**cfg["rerank"], name="rerank")
+        self.result_cache = TTLCache(**cfg["results"], name="results")
+        self._cache_version = self.index_version()
+
+    def cache_stats(self):
+        if self.result_cache is None:
+            return {}
+        return {"embeddings": self.vecmem.embed_cache.stats(), "rerank": self.rerank_cache.stats(),
+                "results": self.result_cache.stats(), "index_version": self.index_version()}
+
+    def _sync_cache_version(self):
+        # doc ids survive re-ingest of an edited file, so scores and results die with the index version
+        if self._cache_version != self.index_version():
+            self.rerank_cache.clear()
+            self.result_cache.clear()
+            self._cache_version = self.index_version()
+
+    def _predict(self, pairs):
+        return self.rank.predict(pairs, batch_size=self.batch_size)
+
+    def retrieve(self, query: str, filter=None):
+        return self.retrieve_batch([query], filter)[0]
+
+    def retrieve_batch(self, queries, filter=None):
+        """
+        Batched retrieve: one embed pass, one FAISS search and one cross-encoder call for all queries.
+        filter ({"type": ..., "source": ...}, see attrs.py) restricts every stage to matching chunks;
+        ValueError for unknown fields.
+        """
+        filter = self._prepare(filter)
+        if self.result_cache is None:
+            return self._retrieve_batch(queries, filter)
+        keys = [self._result_key(q, filter) for q in queries]
+        out = [self.result_cache.get(k) for k in keys]
+        todo = [i for i, ctxs in enumerate(out) if ctxs is None]
+        if todo:
+            for i, ctxs in zip(todo, self._retrieve_batch([queries[i] for i in todo], filter)):
+                self.result_cache.put(keys[i], ctxs)
+                out[i] = ctxs
+        return [[dict(c) for c in ctxs] for ctxs in out]  # callers may annotate their copy
+
+    def retrieve_steps(self, query: str, filter=None):
+        """
+        retrieve() a stage at a time, for streaming: yields ("candidates", hits) as soon as the
+        ANN search (plus BM25 fusion / graph expansion) returns, then ("contexts", final contexts).
+        A cached result goes straight to "contexts".
+        """
+        filter = self._prepare(filter)
+        key = self._result_key(query, filter) if self.result_cache is not None else None
+        ctxs = self.result_cache.get(key) if key is not None else None
+        if ctxs is None:
+            initial = self._candidates([query], filter)
+            yield "candidates", [dict(d) for d in initial[0]]  # reranking annotates the originals
+            ctxs = self._finish([query], initial, filter)[0]
+            if key is not None:
+                self.result_cache.put(key, ctxs)
+        yield "contexts", [dict(c) for c in ctxs]
+
+    def _prepare(self, filter):
+        filter = normalize_filter(filter)
+        self.vecmem.refresh()  # read-only workers: pick up an index published by ingest
+        if self.image_mem is not None:
+            self.image_mem.refresh()
+        if self.shards is not None:
+            self.shards.refresh()
+        if self.result_cache is not None:
+            self._sync_cache_version()
+        return filter
+
+    def _result_key(self, query, filter):
+        return (normalize_query(query), self.top_k, self.rerank_k, self.fusion is not None, self.cascade is not None,
+                filter, self.index_version())
+
+    def _score(self, pairs, doc_ids, cut=None):
+        """Cross-encoder scores, cached per (query, doc id, cut): cut is the passage truncation in tokens, if any."""
+        scorer = self.rank_batcher or self._predict
+        if self.rerank_cache is None:
+            return scorer(pairs)
+        keys = [(normalize_query(q), i, cut) for (q, _), i in zip(pairs, doc_ids)]
+        scores = [self.rerank_cache.get(k) for k in keys]
+        miss = [j for j, sc in enumerate(scores) if sc is None]
+        if miss:
+            for j, sc in zip(miss, scorer([pairs[j] for j in miss])):
+                self.rerank_cache.put(keys[j], float(sc))
+                scores[j] = float(sc)
+        return scores
+
+    def _candidates(self, queries, filter=None):
+        if self.shards is not None:
+            with self.timer.stage("embed", len(queries)):
+                q = self.vecmem.encode_queries(list(queries))
+            with self.timer.stage("search", len(queries)):
+                out = self.shards.search(q, self.top_k, filter)
+        else:
+            out = self.vecmem.search_batch(queries, k=self.top_k, filter=filter)
+        if self.fusion is not None:
+            f = self.fusion
+            if self.shards is not None:
+                with self.timer.stage("lexical", len(queries)):
+                    lexical = self.shards.search_lexical(queries, f["top_k"], f["k1"], f["b"], filter)
+            else:
+                lexical = self.vecmem.search_lexical_batch(queries, f["top_k"], f["k1"], f["b"], filter)
+            out = [_rrf([d, l], f["rrf_k"])[:self.top_k] for d, l in zip(out, lexical)]
+        if self.graph is not None:
+            with self.timer.stage("graph", len(queries)):
+                self.graph.refresh()  # pick up a graph rebuilt by build_kg.py
+                mask = self.vecmem.attrs.mask(filter) if filter else None
+                out = [self._expand(q, docs, mask) for q, docs in zip(queries, out)]
+        return out
+
+    def _expand(self, query, docs, mask=None):
+        g = self.graph_cfg
+        seeds = self.graph.link(query, g["max_ngram"])
+        if not seeds:
+            return docs
+        have, added = {d["id"] for d in docs}, 0
+        for fid, hop in self.graph.expand(seeds, g["hops"], g["max_docs"] + len(docs), g["max_fanout"]):
+            if mask is not None and (fid >= len(mask) or not mask[fid]):
+                continue
+            m = self.vecmem.docstore.get(fid)  # None once the chunk was re-ingested or removed
+            if m is None or m["id"] in have:
+                continue
+            m["_graph"] = hop
+            have.add(m["id"])
+            docs.append(m)
+            added += 1
+            if added >= g["max_docs"]:
+                break
+        return docs
+
+    def _rerank(self, queries, candidates, scorer, text=lambda d: d["text"]):
+        """Score every (query, candidate) pair in one call; sets "_rank" and sorts each list best first."""
+        pairs = [(q, text(d)) for q, docs in zip(queries, candidates) for d in docs]
+        scores = scorer(pairs, [d["id"] for docs in candidates for d in docs]) if pairs else []
+        out, i = [], 0
+        for docs in candidates:
+            for d, s in zip(docs, scores[i:i + len(docs)]):
+                d["_rank"] = float(s)  # hits are fresh dicts, annotate in place
+            out.append(sorted(docs, key=lambda x: x["_rank"], reverse=True))
+            i += len(docs)
+        return out, len(pairs)
+
+    def _truncate(self, text):
+        n = self.cascade.get("max_passage_tokens")
+        if not n:
+            return text
+        tok = getattr(self.rank, "tokenizer", None)
+        if tok is None or not getattr(tok, "is_fast", False):
+            words = text.split()  # rough fallback: whitespace words
+            return text if len(words) <= n else " ".join(words[:n])
+        offsets = tok(text, add_special_tokens=False, truncation=True, max_length=n,
+                      return_offsets_mapping=True)["offset_mapping"]
+        return text[:offsets[-1][1]] if offsets else text
+
+    def _cascade(self, queries, candidates):
+        c, k = self.cascade, self.rerank_k
+        for docs in candidates:
+            for d in docs:
+                d["_cut"] = self._truncate(d["text"])
+        text = lambda d: d["_cut"]
+
+        # stage 1: retrieval order + dense score margin, no model calls
+        pruned = []
+        for docs in candidates:
+            docs = docs[:c["prefilter_k"]] + [d for d in docs[c["prefilter_k"]:] if "_graph" in d]
+            dense = [d["_score"] for d in docs if "_score" in d]
+            if dense and c.get("dense_margin") is not None:
+                floor = max(dense) - c["dense_margin"]
+                docs = [d for d in docs if d.get("_score", floor) >= floor]
+            pruned.append(docs)
+
+        # stage 2: distilled cross-encoder, early exit when the top rerank_k are clearly separated
+        settled = [False] * len(queries)
+        if self.small_rank is not None:
+            small = lambda pairs, ids: self.small_rank.predict(pairs, batch_size=self.batch_size)
+            pruned, n = self._rerank(queries, pruned, small, text)
+            self._count(small_pairs=n)
+            for j, docs in enumerate(pruned):
+                # settled only when there is a (k+1)-th to be separated from; ordering the top k is stage 3's job
+                settled[j] = len(docs) > k and docs[k - 1]["_rank"] - docs[k]["_rank"] >= c["exit_margin"]
+                if not settled[j]:
+                    pruned[j] = docs[:c["small_keep"]]
+            self._count(early_exits=sum(settled))
+
+        # stage 3: full cross-encoder on whatever is still open
+        todo = [j for j, done in enumerate(settled) if not done]
+        if todo:
+            large = lambda pairs, ids: self._score(pairs, ids, c.get("max_passage_tokens") or None)
+            scored, n = self._rerank([queries[j] for j in todo], [pruned[j] for j in todo], large, text)
+            self._count(large_pairs=n)
+            for j, docs in zip(todo, scored):
+                pruned[j] = docs
+        for docs in candidates:
+            for d in docs:
+                d.pop("_cut", None)
+        return [docs[:k] for docs in pruned]
+
+    def _retrieve_batch(self, queries, filter=None):
+        return self._finish(queries, self._candidates(queries, filter), filter)
+
+    def _finish(self, queries, initial, filter=None):
+        """Rerank candidate lists (and merge image hits) into the final contexts."""
+        self._count(queries=len(queries), candidates=sum(len(docs) for docs in initial))
+        with self.timer.stage("rerank", len(queries)):
+            if self.cascade is not None:
+                out = self._cascade(queries, initial)
+            else:
+                out, n = self._rerank(queries, initial, self._score)
+                self._count(large_pairs=n)
+                out = [docs[:self.rerank_k] for docs in out]
+        if self.image_mem is not None:
+            with self.timer.stage("images", len(queries)):
+                hits = self.image_mem.search_batch(queries, k=self.image_k, filter=filter)
+            out = [self._merge_images(ctxs, h) for ctxs, h in zip(out, hits)]
+        return out
+
+    def _merge_images(self, ctxs, image_hits):
+        for c in ctxs:
+            c["_norm"] = _sigmoid(c["_rank"])
+        for h in image_hits:
+            h["_norm"] = h["_rank"] = self.image_weight * _sigmoid((h["_score"] - self.image_center) * self.image_scale)
+        return sorted(ctxs + image_hits, key=lambda x: x["_norm"], reverse=True)[:self.rerank_k]
+
+def _rrf(rankings, rrf_k=60):
+    """Reciprocal rank fusion of hit lists (deduplicated by doc id); hits get "_rrf", best first."""
+    fused = {}
+    for hits in rankings:
+        for rank, h in enumerate(hits, start=1):
+            d = fused.setdefault(h["id"], h)
+            if d is not h:
+                d.update({k: v for k, v in h.items() if k.startswith("_")})  # keep both systems' scores
+            d["_rrf"] = d.get("_rrf", 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda x: x["_rrf"], reverse=True)
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + math.exp(-max(-50.0, min(50.0, x))))
@@ -0,0 +1,334 @@
+import argparse, base64, heapq, http.client, json, os, shutil, socket, subprocess, sys, threading, time, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import numpy as np
+from .memory import VectorMemory
+from .attrs import normalize_filter
+from .utils import ensure_dir, sha1, write_json_atomic, process_memory
+
+"""
+Sharded text store: chunks partitioned across N shards by doc id, one worker process per
+shard, scatter-gather search from the retriever (HybridRetriever.enable_shards).
+
+  <shards>/shards.json   {"shards": N, "dim": ..., "index": {...}}
+  <shards>/<i>/          faiss.index, docstore.*, bm25.* of shard i, published as snapshots
+
+Shards are derived from the primary store ingest writes: sync_shards() adds the chunks that
+are new there and removes the ones that are gone, and run with a different N it rebalances.
+A chunk's shard is a jump consistent hash of its id, so going from N to N + 1 shards moves
+only ~1/(N + 1) of the chunks. Workers (python -m omnimind.shards, or scripts/serve_shards.py
+for all of them) load no model: the coordinator embeds each query once and sends the vector.
+They speak JSON over HTTP, so a shard can move to another node by changing its URL.
+"""
+
+META = "shards.json"
+
+def jump_hash(key, n):
+    """Jump consistent hash (Lamping & Veach): bucket in [0, n) for a 64-bit key."""
+    b, j = -1, 0
+    while j < n:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+def shard_of(doc_id, n_shards):
+    return jump_hash(int(sha1(str(doc_id))[:16], 16), n_shards)
+
+def shard_urls(cfg):
+    """Worker base URLs from the retrieval.sharding section, in shard order."""
+    return list(cfg["urls"]) or [f"http://127.0.0.1:{cfg['base_port'] + i}" for i in range(cfg["shards"])]
+
+class VectorsOnly:
+    """Encoder stand-in for shard stores: queries arrive as vectors, so workers never load the model."""
+    def __init__(self, dim):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, **kwargs):
+        raise RuntimeError("shard stores are searched by vector (search_vectors)")
+
+def _meta(shards_dir):
+    path = os.path.join(shards_dir, META)
+    if not Path(path).exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def open_shard(shards_dir, shard, read_only=True, reload_check_s=2.0):
+    meta = _meta(shards_dir)
+    if meta is None:
+        raise FileNotFoundError(f"{shards_dir}/{META} not found; run `python scripts/shard_index.py` first")
+    d = os.path.join(shards_dir, str(shard))
+    # no embedding store per shard: a lost shard is rebuilt from the primary's (sync_shards)
+    return VectorMemory(os.path.join(d, "faiss.index"), os.path.join(d, "docstore"), "shard",
+                        dict(meta["index"] or {}, vectors="none"),
+                        model=VectorsOnly(meta["dim"]), lexical_path=os.path.join(d, "bm25"),
+                        read_only=read_only, reload_check_s=reload_check_s)
+
+# ---------- building / rebalancing ----------
+def sync_shards(primary, shards_dir, n_shards, index_cfg=None, batch_size=4096):
+    """
+    Bring shards 0..n_shards-1 under shards_dir in line with the live chunks of `primary`
+    (a writable VectorMemory) and publish every shard that changed. Shard directories past
+    n_shards (after shrinking) are deleted once their chunks are on their new shards.
+    index_cfg: shard index config (default: as before, else the primary's).
+    Returns {"shards", "added", "removed", "rows": [live chunks per shard], "seconds"}.
+    """
+    t0 = time.perf_counter()
+    ensure_dir(shards_dir)
+    old = _meta(shards_dir)
+    index_cfg = index_cfg if index_cfg is not None else (old["index"] if old else primary.index_cfg)
+    write_json_atomic(os.path.join(shards_dir, META), {"shards": n_shards, "dim": primary.dim, "index": index_cfg})
+
+    wanted = [[] for _ in range(n_shards)]  # primary fids per shard
+    fids = primary.docstore.live_ids()
+    for i in range(0, len(fids), batch_size):
+        part = [int(f) for f in fids[i:i + batch_size]]
+        for fid, m in zip(part, primary.docstore.get_many(part)):
+            wanted[shard_of(m["id"], n_shards)].append(fid)
+
+    stats = {"shards": n_shards, "added": 0, "removed": 0, "rows": []}
+    for s in range(n_shards):
+        shard = open_shard(shards_dir, s, read_only=False)
+        present = {m["pfid"]: fid for fid, m in shard.docstore.items()}  # primary fid -> shard row
+        want = set(wanted[s])
+        removed = shard.remove([fid for pfid, fid in present.items() if pfid not in want], save=False)
+        new = sorted(want - present.keys())
+        for i in range(0, len(new), batch_size):
+            part = new[i:i + batch_size]
+            docs = [dict(m, pfid=fid) for fid, m in zip(part, primary.docstore.get_many(part))]
+            shard.add_embeddings(docs, primary.vectors_for(part), save=False)
+        if removed or new or shard.snapshot is None:
+            shard.publish()
+        shard.close()
+        stats["added"] += len(new)
+        stats["removed"] += removed
+        stats["rows"].append(len(shard.docstore))
+    for d in Path(shards_dir).iterdir():
+        if d.is_dir() and d.name.isdigit() and int(d.name) >= n_shards:
+            shutil.rmtree(d)  # retired shard; stop its worker
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+# ---------- wire format ----------
+def _pack(vectors):
+    v = np.ascontiguousarray(vectors, dtype="<f4")
+    return {"shape": list(v.shape), "data": base64.b64encode(v.tobytes()).decode("ascii")}
+
+def _unpack(obj):
+    return np.frombuffer(base64.b64decode(obj["data"]), dtype="<f4").reshape(obj["shape"])
+
+def _wire_filter(filter):
+    """A filter as JSON: {field: [values]}, or None."""
+    filter = normalize_filter(filter)
+    return {field: list(values) for field, values in filter} if filter else None
+
+# ---------- worker ----------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: the coordinator reuses one connection per thread
+
+    def setup(self):
+        super().setup()
+        # headers and body go out as two writes; without this, Nagle + delayed ACK add ~40ms each
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, obj, status=200):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        store = self.server.store
+        store.refresh()  # the snapshot reported is the one the next search would use
+        if self.path == "/health":
+            self._send({"status": "ok", "shard": self.server.shard, "snapshot": store.snapshot})
+        elif self.path == "/stats":
+            self._send({"shard": self.server.shard, "snapshot": store.snapshot, "chunks": len(store.docstore),
+                        "memory": dict(process_memory(), pid=os.getpid()), "stages": store.timer.stats()})
+        else:
+            self._send({"error": f"not found: {self.path}"}, 404)
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        store = self.server.store
+        try:
+            store.refresh()  # pick up a snapshot published by sync_shards()
+            if self.path == "/search":
+                hits = store.search_vectors(_unpack(req["vectors"]), req["k"], req.get("filter"))
+            elif self.path == "/lexical":
+                hits = store.search_lexical_batch(req["queries"], req["k"], req["k1"], req["b"], req.get("filter"))
+            else:
+                return self._send({"error": f"not found: {self.path}"}, 404)
+        except Exception as e:
+            return self._send({"error": f"{type(e).__name__}: {e}"}, 500)
+        self._send({"hits": hits, "version": store.snapshot})
+
+def serve_shard(shards_dir, shard, host="127.0.0.1", port=8100, reload_check_s=2.0):
+    """Serve one shard (read-only, reloading published snapshots) until killed."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.shard = shard
+    server.store = open_shard(shards_dir, shard, read_only=True, reload_check_s=reload_check_s)
+    print(f"[shards] shard {shard} ({len(server.store.docstore)} chunks) on http://{host}:{port}")
+    server.serve_forever()
+
+def spawn_shard(shards_dir, shard, port, host="127.0.0.1", reload_check_s=2.0):
+    """Start a local worker process for one shard; returns its Popen."""
+    return subprocess.Popen([sys.executable, "-m", "omnimind.shards", "--dir", str(shards_dir),
+                             "--shard", str(shard), "--host", host, "--port", str(port),
+                             "--reload_check_s", str(reload_check_s)])
+
+def wait_ready(urls, timeout_s=60.0):
+    """Block until every worker answers /health."""
+    deadline = time.monotonic() + timeout_s
+    for url in urls:
+        client = ShardClient(url, timeout_s=1.0)
+        while True:
+            try:
+                client.call("GET", "/health")
+                break
+            except (OSError, RuntimeError, http.client.HTTPException):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"shard worker {url} not up after {timeout_s}s")
+                time.sleep(0.2)
+
+# ---------- coordinator ----------
+class ShardClient:
+    """JSON-over-HTTP client for one shard worker, one keep-alive connection per calling thread."""
+    def __init__(self, url, timeout_s=5.0):
+        u = urllib.parse.urlsplit(url)
+        self.url, self.host, self.port = url.rstrip("/"), u.hostname, u.port or 80
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+
+    def call(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        for attempt in (0, 1):  # a kept-alive connection may have been closed by a restarted worker
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                r = conn.getresponse()
+                out = json.loads(r.read() or b"{}")
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+                continue
+            if r.status != 200:
+                raise RuntimeError(f"{self.url}{path}: {out.get('error', r.status)}")
+            return out
+
+class ShardCoordinator:
+    """
+    Scatter-gather over shard workers: a search goes to every shard in parallel and the
+    per-shard top-k lists are merged into one top-k. Dense scores (inner products) compare
+    across shards as they are; BM25 idf / avgdl are per shard, close to global ones since
+    the hash spreads chunks evenly. A shard that errors or times out is left out of that
+    result and counted in stats(). `version` (every shard's snapshot, polled at most every
+    reload_check_s by refresh()) keys the retriever's result cache.
+    Usage:
+        coord = ShardCoordinator(["http://127.0.0.1:8100", "http://127.0.0.1:8101"])
+        hits = coord.search(vecmem.encode_queries(queries), k=12)
+    """
+    def __init__(self, urls, timeout_s=5.0, threads_per_shard=8, reload_check_s=2.0):
+        self.clients = [ShardClient(u, timeout_s) for u in urls]
+        self.pool = ThreadPoolExecutor(max(1, threads_per_shard * len(urls)), thread_name_prefix="shard")
+        self.versions = [None] * len(urls)  # snapshot each shard answered from last
+        self.reload_check_s = reload_check_s
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._errors = [0] * len(urls)
+
+    @property
+    def version(self):
+        return tuple(self.versions)
+
+    def refresh(self, force=False):
+        """
+        Ask every worker for the snapshot it serves, at most every reload_check_s, so a shard
+        republished by sync_shards() changes `version` even while results come from a cache.
+        A worker that does not answer counts as None. Returns whether any version changed.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_check_s:
+            return False
+        self._checked = now
+        futs = [self.pool.submit(c.call, "GET", "/health") for c in self.clients]
+        versions = []
+        for fut in futs:
+            try:
+                versions.append(fut.result()["snapshot"])
+            except Exception:
+                versions.append(None)
+        changed = versions != self.versions
+        self.versions = versions
+        return changed
+
+    def _gather(self, path, body):
+        futs = [self.pool.submit(c.call, "POST", path, body) for c in self.clients]
+        out = []
+        for i, fut in enumerate(futs):
+            try:
+                r = fut.result()
+            except Exception as e:
+                with self._lock:
+                    self._errors[i] += 1
+                print(f"[shards] {self.clients[i].url}{path} failed: {type(e).__name__}: {e}")
+                continue
+            self.versions[i] = r["version"]
+            out.append(r["hits"])
+        return out
+
+    def search(self, vectors, k=10, filter=None):
+        """Global top-k dense hits per query vector (docs with "_score"); filter as for VectorMemory.search."""
+        vectors = np.asarray(vectors, dtype="float32")
+        body = {"vectors": _pack(vectors), "k": k, "filter": _wire_filter(filter)}
+        return _merge(self._gather("/search", body), len(vectors), k, "_score")
+
+    def search_lexical(self, queries, k=10, k1=1.2, b=0.75, filter=None):
+        """Global top-k BM25 hits per query (docs with "_bm25")."""
+        body = {"queries": list(queries), "k": k, "k1": k1, "b": b, "filter": _wire_filter(filter)}
+        per_shard = self._gather("/lexical", body)
+        return _merge(per_shard, len(queries), k, "_bm25")
+
+    def stats(self):
+        """Per shard: URL, failed calls, snapshot served and the worker's own /stats (memory, chunks)."""
+        out = []
+        for c, errors, version in zip(self.clients, self._errors, self.versions):
+            try:
+                worker = c.call("GET", "/stats")
+            except Exception as e:
+                worker = {"error": f"{type(e).__name__}: {e}"}
+            out.append({"url": c.url, "errors": errors, "version": version, "worker": worker})
+        return out
+
+def _merge(per_shard, n_queries, k, key):
+    return [heapq.nlargest(k, (h for hits in per_shard for h in hits[j]), key=lambda h: h[key])
+            for j in range(n_queries)]
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve one shard of the text store to a ShardCoordinator.")
+    ap.add_argument("--dir", type=str, required=True, help="Shards directory (paths.shards).")
+    ap.add_argument("--shard", type=int, required=True)
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8100)
+    ap.add_argument("--reload_check_s", type=float, default=2.0)
+    args = ap.parse_args()
+    serve_shard(args.dir, args.shard, args.host, args.port, args.reload_check_s)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os, sys, threading, time, traceback
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+"""
+Low-overhead stage timers for the query path.
+
+A StageTimer keeps, per stage, a call / item count, the summed wall time and a
+fixed-bucket latency histogram (one bisect per observation), exported in the
+Prometheus text format by render_prometheus(). Code running inside request_trace()
+also gets its own per-stage breakdown, for returning timings with a single response;
+profile() samples stacks for one request.
+"""
+
+# histogram upper bounds, seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_trace = ContextVar("omnimind_trace", default=None)
+
+class StageTimer:
+    """
+    Wall time per pipeline stage (embed, search, fetch, lexical, graph, rerank, tool, synthesis,
+    critique, ...). Thread-safe; one timer is shared by a VectorMemory, the retriever and agent on top.
+    Usage:
+        timer = StageTimer()
+        with timer.stage("search", n=len(queries)):
+            D, I = index.search(q, k)
+        timer.stats()  # {"search": {"calls": 1, "items": 8, "seconds": ..., "ms_per_item": ...}}
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    @contextmanager
+    def stage(self, name, n=1):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t, n)
+
+    def add(self, name, seconds, n=1):
+        b = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            s = self._stages.get(name)
+            if s is None:
+                s = self._stages[name] = {"calls": 0, "items": 0, "seconds": 0.0, "buckets": [0] * (len(BUCKETS) + 1)}
+            s["calls"] += 1
+            s["items"] += n
+            s["seconds"] += seconds
+            s["buckets"][b] += 1
+        tr = _trace.get()
+        if tr is not None:
+            tr[name] = tr.get(name, 0.0) + 1000.0 * seconds
+
+    def stats(self):
+        with self._lock:
+            out = {k: {f: v[f] for f in ("calls", "items", "seconds")} for k, v in self._stages.items()}
+        for s in out.values():
+            s["ms_per_item"] = 1000.0 * s["seconds"] / s["items"] if s["items"] else 0.0
+        return out
+
+    def histograms(self):
+        """{stage: (cumulative bucket counts incl. +Inf, sum seconds, count)}"""
+        with self._lock:
+            snap = {k: (list(v["buckets"]), v["seconds"], v["calls"]) for k, v in self._stages.items()}
+        out = {}
+        for k, (b, total, n) in snap.items():
+            for i in range(1, len(b)):
+                b[i] += b[i - 1]
+            out[k] = (b, total, n)
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+@contextmanager
+def request_trace():
+    """Collect {stage: ms} for everything timed in this context (the caller's thread / task)."""
+    tr = {}
+    token = _trace.set(tr)
+    t = time.perf_counter()
+    try:
+        yield tr
+    finally:
+        tr["total"] = 1000.0 * (time.perf_counter() - t)
+        _trace.reset(token)
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus(timers, counters=None, prefix="omnimind"):
+    """
+    Prometheus text exposition of `timers` ({metric suffix: (StageTimer, label name)}) as
+    histograms, one series per stage, plus plain `counters` ({name: value}).
+    """
+    lines = []
+    for suffix, (timer, label_name) in timers.items():
+        name = f"{prefix}_{suffix}_seconds"
+        lines += [f"# HELP {name} Wall time per {label_name}.", f"# TYPE {name} histogram"]
+        for stage, (cum, total, n) in sorted(timer.histograms().items()):
+            label = f'{label_name}="{_esc(stage)}"'
+            for le, c in zip(BUCKETS, cum):
+                lines.append(f'{name}_bucket{{{label},le="{le}"}} {c}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {cum[-1]}')
+            lines.append(f"{name}_sum{{{label}}} {total:.6f}")
+            lines.append(f"{name}_count{{{label}}} {n}")
+    for key, value in sorted((counters or {}).items()):
+        name = f"{prefix}_{key}_total"
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+# ---------- sampling profiler ----------
+class SamplingProfiler:
+    """
+    Samples the stacks of a few threads every `interval_ms` from a background thread and
+    counts them in collapsed ("folded") form, ready for flamegraph.pl / speedscope.
+    It only runs while switched on (one request at a time), so normal serving pays nothing.
+    """
+    def __init__(self, thread_ids, interval_ms=5.0, max_depth=64):
+        self.thread_ids = set(thread_ids)
+        self.interval = interval_ms / 1000.0
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="omnimind-profiler", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for tid in self.thread_ids:
+                f = frames.get(tid)
+                if f is None:
+                    continue
+                stack = traceback.extract_stack(f, limit=self.max_depth)
+                self.stacks[";".join(f"{os.path.basename(fr.filename)}:{fr.name}:{fr.lineno}" for fr in stack)] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self, top=50):
+        """Most frequent stacks as "frame;frame;... count" lines."""
+        return "\n".join(f"{s} {n}" for s, n in self.stacks.most_common(top))
+
+@contextmanager
+def profile(interval_ms=5.0, thread_prefixes=("microbatch-",)):
+    """
+    Sample the calling thread (plus threads named with `thread_prefixes`: the micro-batchers
+    doing its model work, shared with concurrent requests) for the duration of the block.
+    """
+    ids = [threading.get_ident()] + [t.ident for t in threading.enumerate()
+                                     if t.ident and t.name.startswith(tuple(thread_prefixes))]
+    p = SamplingProfiler(ids, interval_ms).start()
+    try:
+        yield p
+    finally:
+        p.stop()
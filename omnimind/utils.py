@@ -7,6 +7,13 @@ def ensure_dir(p: str):
 def sha1(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8")).hexdigest()
 
+def file_sha1(path, bufsize=1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
 def load_jsonl(path):
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
@@ -16,3 +23,40 @@ def load_jsonl(path):
 def append_jsonl(path, obj):
     with open(path, "a", encoding="utf-8") as f:
         f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+def write_json_atomic(path, obj):
+    # write to a sibling temp file, then rename over the target so readers never see a partial file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def process_memory():
+    """This process's memory in MB; pss splits pages shared with other processes between them (Linux)."""
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                k, _, v = line.partition(":")
+                if k in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Anonymous"):
+                    out[k.lower() + "_mb"] = round(int(v.split()[0]) / 1024.0, 1)
+    except OSError:
+        import resource
+        out["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    return out
+
+# config entries holding filesystem paths, resolved against the config file's directory
+_CONFIG_PATHS = (("inference", "onnx_dir"), ("audio", "cache_dir"))
+
+def load_config(path):
+    """config.yaml with relative paths made absolute against its own directory (not the cwd)."""
+    import yaml
+    path = Path(path).resolve()
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    at = lambda p: str(p if Path(p).is_absolute() else (path.parent / p).resolve())
+    cfg["paths"] = {k: at(v) for k, v in cfg["paths"].items()}
+    for section, key in _CONFIG_PATHS:
+        if key in cfg.get(section, {}):
+            cfg[section][key] = at(cfg[section][key])
+    return cfg
@@ -0,0 +1,77 @@
+"""
+Chunker benchmark: character chunks (simple) vs. embedder-token chunks (token).
+
+    python scripts/bench_chunker.py --files 200
+    python scripts/bench_chunker.py --raw_dir data/raw --max_tokens 256 --overlap_tokens 32
+
+For each chunker reports MB/s of text chunked, chunk count, tokens per chunk and
+the share of chunks / tokens the embedder would silently truncate at its window
+(wasted_token_pct: tokens that are computed for nothing or cut off).
+Runs over a synthetic prose corpus unless --raw_dir is given.
+"""
+import argparse, json, random, time
+from pathlib import Path
+import numpy as np
+import yaml
+from omnimind import inference
+from omnimind.ingest_text import TEXT_EXTS, simple_chunks, token_chunker
+
+def synth_corpus(n_files, sentences_per_file=400, seed=0):
+    rnd = random.Random(seed)
+    vocab = [f"w{i}" for i in range(5000)] + ["internationalization", "electroencephalography", "3.14159", "e-mail"]
+    docs = []
+    for _ in range(n_files):
+        paras, para = [], []
+        for _ in range(sentences_per_file):
+            para.append(" ".join(rnd.choice(vocab) for _ in range(rnd.randint(5, 40))).capitalize() + ".")
+            if rnd.random() < 0.15:
+                paras.append(" ".join(para))
+                para = []
+        docs.append("\n\n".join(paras + [" ".join(para)]))
+    return docs
+
+def measure(name, chunk_fn, texts, tok, window):
+    t = time.perf_counter()
+    chunks = [c for text in texts for c in chunk_fn(text)]
+    seconds = time.perf_counter() - t
+    lens = np.array([len(ids) for ids in tok(chunks, add_special_tokens=True, verbose=False)["input_ids"]])
+    over = np.maximum(lens - window, 0)
+    return {
+        "chunker": name,
+        "chunks": len(chunks),
+        "mb_per_s": round(sum(len(x) for x in texts) / 1e6 / seconds, 2) if seconds else 0.0,
+        "tokens_mean": round(float(lens.mean()), 1) if len(lens) else 0.0,
+        "tokens_max": int(lens.max()) if len(lens) else 0,
+        "truncated_pct": round(100.0 * float((over > 0).mean()), 2) if len(lens) else 0.0,
+        "wasted_token_pct": round(100.0 * float(over.sum()) / max(int(lens.sum()), 1), 2),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=200, help="Synthetic files (ignored with --raw_dir).")
+    ap.add_argument("--raw_dir", type=str, default=None)
+    ap.add_argument("--max_tokens", type=int, default=None, help="Override retrieval.chunker.max_tokens.")
+    ap.add_argument("--overlap_tokens", type=int, default=None, help="Override retrieval.chunker.overlap_tokens.")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open("config.yaml"))
+    r, ch = cfg["retrieval"], cfg["retrieval"]["chunker"]
+    model = cfg["models"]["embed_text"]
+    embedder = inference.load_embedder(model, cfg["inference"])
+    tok, window = embedder.tokenizer, embedder.max_seq_length
+    if args.raw_dir:
+        texts = [p.read_text(encoding="utf-8", errors="ignore")
+                 for p in sorted(Path(args.raw_dir).rglob("*")) if p.suffix.lower() in TEXT_EXTS]
+    else:
+        texts = synth_corpus(args.files)
+
+    max_tokens = ch["max_tokens"] if args.max_tokens is None else args.max_tokens
+    overlap = ch["overlap_tokens"] if args.overlap_tokens is None else args.overlap_tokens
+    rows = [measure("simple", lambda t: simple_chunks(t, r["chunk_size"], r["chunk_overlap"]), texts, tok, window)]
+    for boundary in ("none", "sentence", "paragraph"):
+        chunker = token_chunker(model, window, max_tokens, overlap, boundary)
+        rows.append(measure(f"token:{boundary}", chunker.chunks, texts, tok, window))
+    print(json.dumps({"model": model, "window": window, "rows": rows}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Cold start + resident memory: legacy docstore.jsonl (parsed into a list of dicts)
+vs. the memory-mapped DocStore.
+
+    python scripts/bench_docstore.py --n 1000000
+
+Each measurement runs in a fresh interpreter so RSS is not shared between them.
+RSS is split into anonymous (private heap) and file-backed (page cache the kernel
+maps in for mmap'd files; shared between processes and reclaimable) on Linux.
+"""
+import argparse, json, os, random, subprocess, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+RSS = """
+def RSS():
+    try:
+        st = dict(l.split(":", 1) for l in open("/proc/self/status"))
+        return "%s,%s" % (st["RssAnon"].split()[0], st["RssFile"].split()[0])
+    except OSError:
+        return "%d,0" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+LEGACY = RSS + """
+import json, sys, time, random, resource
+t = time.perf_counter()
+with open(sys.argv[1], "r", encoding="utf-8") as f:
+    meta = [json.loads(line) for line in f if line.strip()]
+ids = [m["id"] for m in meta]
+load = time.perf_counter() - t
+t = time.perf_counter()
+for fid in random.Random(0).sample(range(len(meta)), 1000):
+    m = dict(meta[fid])
+lookup = time.perf_counter() - t
+print(load, lookup, RSS())
+"""
+
+COMPACT = RSS + """
+import sys, time, random, resource
+sys.path.insert(0, sys.argv[2])
+from omnimind.docstore import DocStore
+t = time.perf_counter()
+ds = DocStore(sys.argv[1])
+load = time.perf_counter() - t
+t = time.perf_counter()
+for fid in random.Random(0).sample(range(ds.n), 1000):
+    m = ds.get(fid)
+lookup = time.perf_counter() - t
+print(load, lookup, RSS())
+"""
+
+def synth(n, path):
+    rnd = random.Random(0)
+    words = "omnimind vector store faiss retrieval agent graph chunk audio image text query".split()
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            text = " ".join(rnd.choice(words) for _ in range(120))
+            f.write(json.dumps({"id": f"{i:040x}", "source": f"data/raw/doc{i // 20}.txt", "type": "text", "text": text}) + "\n")
+
+def run(code, *args):
+    out = subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True, check=True).stdout
+    load, lookup, rss = out.splitlines()[-1].split()
+    anon_kb, file_kb = rss.split(",")
+    return {"load_s": round(float(load), 3), "lookup_1000_s": round(float(lookup), 4),
+            "rss_anon_mb": round(int(anon_kb) / 1024, 1), "rss_file_mb": round(int(file_kb) / 1024, 1)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000, help="Number of synthetic chunks.")
+    ap.add_argument("--workdir", type=str, default=None)
+    args = ap.parse_args()
+
+    root = Path(__file__).resolve().parents[1]
+    with tempfile.TemporaryDirectory(dir=args.workdir) as d:
+        legacy = os.path.join(d, "docstore.jsonl")
+        synth(args.n, legacy)
+        t = time.perf_counter()
+        run(COMPACT, legacy, str(root))  # first open migrates the JSONL
+        migrate = time.perf_counter() - t
+        report = {
+            "n": args.n,
+            "jsonl_bytes": os.path.getsize(legacy),
+            "migration_s": round(migrate, 2),
+            "legacy_jsonl": run(LEGACY, legacy),
+            "compact_mmap": run(COMPACT, os.path.join(d, "docstore"), str(root)),
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
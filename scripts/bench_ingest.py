@@ -0,0 +1,60 @@
+"""
+Ingest scaling benchmark: chunks/s for serial vs. parallel parsing and embedding.
+
+    python scripts/bench_ingest.py --files 2000 --settings 0:0,4:0,4:2,8:4,16:8
+
+Each setting is "<workers>:<embed_workers>" and runs against a fresh store over
+the same synthetic corpus (or --raw_dir to use your own files).
+"""
+import argparse, json, os, random, tempfile, time
+from pathlib import Path
+import yaml
+from omnimind.memory import VectorMemory
+from omnimind.ingest import ingest_dir
+
+def synth_corpus(root, n_files, words_per_file=1500, seed=0):
+    rnd = random.Random(seed)
+    vocab = [f"w{i}" for i in range(5000)]
+    for i in range(n_files):
+        (Path(root) / f"doc{i:05d}.txt").write_text(" ".join(rnd.choice(vocab) for _ in range(words_per_file)))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=1000)
+    ap.add_argument("--raw_dir", type=str, default=None, help="Benchmark on existing files instead of a synthetic corpus.")
+    ap.add_argument("--settings", type=str, default="0:0,4:0,4:2,8:4")
+    ap.add_argument("--config", type=str, default="config.yaml")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open(args.config))
+    ing = cfg["ingest"]
+    with tempfile.TemporaryDirectory() as d:
+        raw = args.raw_dir
+        if raw is None:
+            raw = os.path.join(d, "raw")
+            os.makedirs(raw)
+            synth_corpus(raw, args.files)
+        rows = []
+        for setting in args.settings.split(","):
+            workers, embed_workers = (int(x) for x in setting.split(":"))
+            out = os.path.join(d, f"run_{workers}_{embed_workers}")
+            vec = VectorMemory(os.path.join(out, "faiss.index"), os.path.join(out, "docstore"),
+                               cfg["models"]["embed_text"], cfg["retrieval"]["index"],
+                               lexical_path=os.path.join(out, "bm25"), backend_cfg=cfg["inference"])
+            t = time.perf_counter()
+            stats = ingest_dir(vec, raw, os.path.join(out, "manifest.json"),
+                               cfg["retrieval"]["chunk_size"], cfg["retrieval"]["chunk_overlap"],
+                               ing["batch_size"], ing["checkpoint_every"],
+                               workers=workers, embed_workers=embed_workers,
+                               threads_per_embed_worker=ing["threads_per_embed_worker"],
+                               chunker=cfg["retrieval"]["chunker"])
+            rows.append({"workers": workers, "embed_workers": embed_workers, "chunks": stats["chunks_added"],
+                         "seconds": round(time.perf_counter() - t, 2), "chunks_per_s": stats["chunks_per_s"]})
+            print(json.dumps(rows[-1]))
+        base = rows[0]["chunks_per_s"] or 1.0
+        for r in rows:
+            r["speedup"] = round(r["chunks_per_s"] / base, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": rows}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Scatter-gather scaling: search latency / QPS and worker memory as the shard count grows.
+
+    python scripts/bench_shards.py --chunks 200000 --shards 1,2,4,8 --concurrency 1,8,32
+
+Builds a synthetic store (random clustered unit vectors plus short texts, so no model
+is needed), then for each shard count partitions it with sync_shards(), starts that many
+local workers and drives a ShardCoordinator with dense + BM25 searches from N client
+threads. The "in_process" row searches the unsharded store directly. Per setting:
+p50/p95/p99 and QPS per concurrency level, top-k overlap with the unsharded dense
+results, and worker memory (rss_mb counts shared pages in every worker, pss_mb splits
+them; both summed over workers, plus the largest worker).
+"""
+import argparse, json, os, random, sys, tempfile, time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from omnimind.memory import VectorMemory
+from omnimind.shards import VectorsOnly, ShardCoordinator, sync_shards, spawn_shard, wait_ready
+from omnimind.benchmark import run_load
+from omnimind.utils import sha1
+
+def build_store(root, n_chunks, dim, topics=64, words=40, batch=10000, seed=0):
+    rng, rnd = np.random.RandomState(seed), random.Random(seed)
+    centers = rng.randn(topics, dim).astype("float32")
+    vocab = [[f"t{t}w{j}" for j in range(300)] for t in range(topics)]
+    vec = VectorMemory(os.path.join(root, "faiss.index"), os.path.join(root, "docstore"), "synthetic", {"type": "flat"},
+                       model=VectorsOnly(dim), lexical_path=os.path.join(root, "bm25"))
+    for start in range(0, n_chunks, batch):
+        ids = range(start, min(start + batch, n_chunks))
+        topic = rng.randint(0, topics, len(ids))
+        embs = centers[topic] + 0.5 * rng.randn(len(ids), dim).astype("float32")
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+        docs = [{"id": sha1(f"chunk{i}"), "source": f"doc{i // 8}", "type": "text",
+                 "text": " ".join(rnd.choice(vocab[t]) for _ in range(words))} for i, t in zip(ids, topic)]
+        vec.add_embeddings(docs, embs, save=False)
+    vec.publish()
+    return vec
+
+def queries_for(vec, n, seed=1):
+    rng = np.random.RandomState(seed)
+    fids = rng.choice(vec.docstore.live_ids(), n)
+    q = vec.index.reconstruct_batch(fids) + 0.3 * rng.randn(n, vec.dim).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    texts = [" ".join(m["text"].split()[:4]) for m in vec.docstore.get_many(fids)]
+    return q.astype("float32"), texts
+
+def load(call, n_queries, levels, n_requests):
+    return [run_load(call, list(range(n_queries)), c, n_requests or max(n_queries, 4 * c)) for c in levels]
+
+def overlap(hits, exact):
+    both = [len({h["id"] for h in a} & {h["id"] for h in b}) / max(1, len(b)) for a, b in zip(hits, exact)]
+    return sum(both) / len(both)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark sharded search as the shard count grows.")
+    ap.add_argument("--chunks", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=12)
+    ap.add_argument("--shards", type=str, default="1,2,4,8", help="Comma-separated shard counts.")
+    ap.add_argument("--concurrency", type=str, default="1,8,32", help="Comma-separated client counts.")
+    ap.add_argument("--requests", type=int, default=None, help="Requests per concurrency level.")
+    ap.add_argument("--base_port", type=int, default=8600)
+    ap.add_argument("--work_dir", type=str, default=None, help="Scratch location (default: a temp dir).")
+    ap.add_argument("--out", type=str, default=None)
+    args = ap.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as d:
+        t = time.perf_counter()
+        vec = build_store(os.path.join(d, "primary"), args.chunks, args.dim)
+        print(f"[bench_shards] built {args.chunks} chunks in {time.perf_counter() - t:.1f}s")
+        Q, texts = queries_for(vec, args.queries)
+        exact = vec.search_vectors(Q, args.k)
+        local = lambda i: (vec.search_vectors(Q[i:i + 1], args.k), vec.search_lexical_batch([texts[i]], args.k))
+        report = {"chunks": args.chunks, "dim": args.dim, "k": args.k,
+                  "in_process": {"concurrency": load(local, len(Q), levels, args.requests)}, "sharded": []}
+
+        for n in [int(s) for s in args.shards.split(",")]:
+            shards_dir = os.path.join(d, f"shards{n}")
+            sync = sync_shards(vec, shards_dir, n)
+            ports = [args.base_port + i for i in range(n)]
+            workers = [spawn_shard(shards_dir, i, p) for i, p in enumerate(ports)]
+            try:
+                urls = [f"http://127.0.0.1:{p}" for p in ports]
+                wait_ready(urls)
+                coord = ShardCoordinator(urls, timeout_s=30.0)
+                hits = coord.search(Q, args.k)
+                call = lambda i: (coord.search(Q[i:i + 1], args.k), coord.search_lexical([texts[i]], args.k))
+                levels_out = load(call, len(Q), levels, args.requests)
+                mem = [s["worker"]["memory"] for s in coord.stats()]
+                report["sharded"].append({
+                    "shards": n, "chunks_per_shard": sync["rows"], "sync_s": sync["seconds"],
+                    "overlap_vs_unsharded": overlap(hits, exact), "concurrency": levels_out,
+                    "memory_mb": {k: {"sum": round(sum(m.get(k, 0.0) for m in mem), 1),
+                                      "max_worker": max(m.get(k, 0.0) for m in mem)} for k in ("rss_mb", "pss_mb")},
+                })
+            finally:
+                for p in workers:
+                    p.terminate()
+                    p.wait()
+            print(f"[bench_shards] {n} shards: " + ", ".join(
+                f"c={r['concurrency']} p50={r['p50_ms']:.2f}ms qps={r['qps']:.0f}" for r in levels_out))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import yaml, os, time, argparse
+from omnimind.memory import VectorMemory
+from omnimind import indexes
+
+ap = argparse.ArgumentParser(description="Train/rebuild the vector index as configured in retrieval.index, "
+                                         "from the stored embeddings (see retrieval.index.vectors).")
+ap.add_argument("--type", choices=indexes.INDEX_TYPES, default=None, help="Override retrieval.index.type.")
+args = ap.parse_args()
+
+cfg = yaml.safe_load(open("config.yaml"))
+index_cfg = dict(cfg["retrieval"]["index"], **({"type": args.type} if args.type else {}))
+open_store = lambda: VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"],
+                                  index_cfg, backend_cfg=cfg["inference"], reset_vectors=True)
+try:
+    vec = open_store()
+except RuntimeError as e:  # unreadable index file: set it aside, the stored embeddings are enough
+    path = cfg["paths"]["vector_index"]
+    print(f"Cannot read {path} ({e}); moving it to {path}.corrupt and rebuilding")
+    os.replace(path, f"{path}.corrupt")
+    vec = None
+if vec is None:  # reopened outside the handler: its traceback still holds the failed open's writer lock
+    vec = open_store()
+
+t = time.perf_counter()
+n = vec.rebuild(index_cfg)
+print(f"Rebuilt {indexes.index_type(vec.index)} index over {n} chunks in {time.perf_counter() - t:.1f}s")
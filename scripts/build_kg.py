@@ -1,5 +1,6 @@
 import yaml
 from omnimind.kg import build_graph
 cfg = yaml.safe_load(open("config.yaml"))
-G = build_graph(cfg["paths"]["docstore"], cfg["paths"]["kg_graph"])
+G = build_graph(cfg["paths"]["docstore"], cfg["paths"]["kg_graph"], cfg["kg"]["batch_size"], cfg["kg"]["n_process"],
+                store_path=cfg["paths"]["kg_store"], index_path=cfg["paths"]["vector_index"])
 print(f"KG nodes={len(G.nodes)}, edges={len(G.edges)}")
@@ -0,0 +1,50 @@
+"""
+Parity check of the configured inference backend against the fp32 PyTorch models,
+run over the eval queries before rolling a backend out:
+
+    python scripts/check_backend.py --backend onnx_int8
+    python scripts/check_backend.py --eval_jsonl data/processed/eval_qa.jsonl --threads 4
+
+Exits non-zero when a metric falls below the inference.parity thresholds.
+"""
+import argparse, json, sys
+import yaml
+from omnimind.memory import VectorMemory
+from omnimind.utils import load_jsonl
+from omnimind import inference
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--eval_jsonl", type=str, default="data/processed/eval_qa.jsonl")
+ap.add_argument("--backend", choices=inference.BACKENDS, default=None, help="Override inference.backend.")
+ap.add_argument("--threads", type=int, default=None, help="Override inference.intra_op_threads.")
+args = ap.parse_args()
+
+cfg = yaml.safe_load(open("config.yaml"))
+backend_cfg = dict(cfg["inference"], **({"backend": args.backend} if args.backend else {}))
+if args.threads is not None:
+    backend_cfg["intra_op_threads"] = args.threads
+ref_cfg = dict(backend_cfg, backend="torch")
+
+vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"],
+                   cfg["retrieval"]["index"], backend_cfg=ref_cfg, read_only=True)
+queries = [ex["query"] for ex in load_jsonl(args.eval_jsonl)]
+if not queries:
+    sys.exit(f"No queries in {args.eval_jsonl}")
+candidates = [[d["text"] for d in hits] for hits in vec.search_batch(queries, k=cfg["retrieval"]["top_k"])]
+
+report = inference.parity_report(
+    queries, candidates,
+    vec.model, inference.load_embedder(cfg["models"]["embed_text"], backend_cfg),
+    inference.load_cross_encoder(cfg["models"]["cross_encoder"], ref_cfg),
+    inference.load_cross_encoder(cfg["models"]["cross_encoder"], backend_cfg),
+    index=vec.index, k=cfg["retrieval"]["top_k"], rerank_k=cfg["retrieval"]["rerank_k"])
+
+limits = cfg["inference"]["parity"]
+checks = {
+    "cosine_min": report["embed"]["cosine_min"] >= limits["min_cosine"],
+    "top1_agreement": report["rerank"]["top1_agreement"] >= limits["min_top1_agreement"],
+    "rerank_overlap": report["rerank"][f"overlap@{cfg['retrieval']['rerank_k']}"] >= limits["min_overlap"],
+}
+report.update(backend=inference.backend_spec(backend_cfg), checks=checks, passed=all(checks.values()))
+print(json.dumps(report, indent=2))
+sys.exit(0 if report["passed"] else 1)
@@ -0,0 +1,45 @@
+"""
+Recall@k and latency of each ANN setting against an exact Flat scan over the
+current corpus, to pick a latency/recall trade-off before switching retrieval.index.
+
+    python scripts/index_recall.py --k 10 --queries 500
+    python scripts/index_recall.py --eval_jsonl data/processed/eval_qa.jsonl
+"""
+import yaml, json, argparse
+import numpy as np
+from omnimind.memory import VectorMemory
+from omnimind.utils import load_jsonl
+from omnimind import indexes
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--k", type=int, default=10)
+ap.add_argument("--queries", type=int, default=500, help="Stored chunks sampled as queries (if no eval file).")
+ap.add_argument("--eval_jsonl", type=str, default=None, help="Use the queries of an eval file instead.")
+ap.add_argument("--types", type=str, default="ivf_flat,ivf_pq,hnsw")
+ap.add_argument("--nprobe", type=str, default="1,4,16,64")
+ap.add_argument("--efSearch", type=str, default="16,32,64,128")
+args = ap.parse_args()
+
+cfg = yaml.safe_load(open("config.yaml"))
+vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"], cfg["retrieval"]["index"],
+                   backend_cfg=cfg["inference"], read_only=True)
+fids = vec.docstore.live_ids()
+vecs = vec.vectors_for(fids)  # exact even when the current index is PQ
+if args.eval_jsonl:
+    queries = vec.encode([ex["query"] for ex in load_jsonl(args.eval_jsonl)])
+else:
+    queries = vecs[np.random.RandomState(0).choice(len(vecs), min(args.queries, len(vecs)), replace=False)]
+
+base = dict(cfg["retrieval"]["index"])
+rows = [dict(setting={"type": "flat"}, **indexes.recall_at_k(vecs, queries, indexes.index_spec({"type": "flat"}), args.k))]
+for t in args.types.split(","):
+    sweep = ("efSearch", args.efSearch) if t == "hnsw" else ("nprobe", args.nprobe)
+    for v in sweep[1].split(","):
+        spec = indexes.index_spec(dict(base, type=t, **{sweep[0]: int(v)}))
+        try:
+            res = indexes.recall_at_k(vecs, queries, spec, args.k)
+        except RuntimeError as e:  # e.g. too few vectors to train IVF
+            res = {"error": str(e)}
+        rows.append(dict(setting={"type": t, sweep[0]: int(v)}, **res))
+
+print(json.dumps({"chunks": len(fids), "queries": len(queries), "k": args.k, "results": rows}, indent=2))
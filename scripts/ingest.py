@@ -1,21 +1,44 @@
-import yaml, json
+import yaml, json, argparse
 from pathlib import Path
 from omnimind.memory import VectorMemory
-from omnimind.ingest_text import prepare_text_docs
-from omnimind.ingest_image import prepare_image_docs
-# from omnimind.ingest_audio import prepare_audio_docs  # optional
+from omnimind.ingest import ingest_dir
+from omnimind.ingest_image import build_image_memory
+from omnimind.ingest_audio import build_audio_pool
 
-cfg = yaml.safe_load(open("config.yaml"))
-vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"])
+def main():
+    ap = argparse.ArgumentParser(description="Incrementally ingest data/raw into the vector store.")
+    ap.add_argument("--workers", type=int, default=None, help="Override ingest.workers (file parsing processes).")
+    ap.add_argument("--embed-workers", type=int, default=None, help="Override ingest.embed_workers (embedding processes).")
+    args = ap.parse_args()
 
-docs = []
-docs += prepare_text_docs(cfg["paths"]["data_raw"])
-docs += prepare_image_docs(cfg["paths"]["data_raw"])
-# docs += prepare_audio_docs(cfg["paths"]["data_raw"], model_size="base")  # optional
+    cfg = yaml.safe_load(open("config.yaml"))
+    ing = cfg["ingest"]
+    vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"], cfg["retrieval"]["index"],
+                       lexical_path=cfg["paths"]["lexical_index"], backend_cfg=cfg["inference"], reset_vectors=True)
+    img = build_image_memory(cfg)
+    audio = build_audio_pool(cfg)
 
-print(f"Ingesting {len(docs)} chunks...")
-if not docs:                     # ← add this guard
-    print("No files found under data/raw. Add .txt/.md/.jpg/.png (and audio if enabled).")
-else:
-    vec.add_texts(docs)
-    print("Done.")
+    raw_dir = cfg["paths"]["data_raw"]
+    if not Path(raw_dir).exists():
+        print(f"Raw data directory not found: {raw_dir}")
+        return
+    stats = ingest_dir(vec, raw_dir, cfg["paths"]["ingest_manifest"],
+                       cfg["retrieval"]["chunk_size"], cfg["retrieval"]["chunk_overlap"],
+                       ing["batch_size"], ing["checkpoint_every"],
+                       workers=ing["workers"] if args.workers is None else args.workers,
+                       embed_workers=ing["embed_workers"] if args.embed_workers is None else args.embed_workers,
+                       threads_per_embed_worker=ing["threads_per_embed_worker"],
+                       img_vec=img, audio=audio, chunker=cfg["retrieval"]["chunker"])
+    sharding = cfg["retrieval"]["sharding"]
+    if sharding["enabled"]:
+        from omnimind.shards import sync_shards
+        stats["shards"] = sync_shards(vec, cfg["paths"]["shards"], sharding["shards"])
+    print(json.dumps(stats, indent=2))
+    if not (stats["files_added"] or stats["files_updated"] or stats["files_skipped"]):
+        print("No files found under data/raw. Add .txt/.md/.jpg/.png (and audio if enabled).")
+    else:
+        print("Done.")
+
+# guarded: transcription workers are spawned and re-import this module
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,30 @@
-import yaml, sys
+import argparse, yaml
 from omnimind.memory import VectorMemory
 from omnimind.retriever import HybridRetriever
+from omnimind.kgstore import KGStore
+from omnimind.ingest_image import build_image_memory
 from omnimind.rag import synthesize_answer
 
 cfg = yaml.safe_load(open("config.yaml"))
-vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"])
-rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], cfg["retrieval"]["top_k"], cfg["retrieval"]["rerank_k"])
+vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"], cfg["retrieval"]["index"],
+                   lexical_path=cfg["paths"]["lexical_index"], backend_cfg=cfg["inference"], read_only=True)
+rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], cfg["retrieval"]["top_k"], cfg["retrieval"]["rerank_k"],
+                      backend_cfg=cfg["inference"])
+if cfg["retrieval"]["lexical"]["enabled"]:
+    rtv.enable_lexical(cfg["retrieval"]["lexical"])
+if cfg["retrieval"]["cascade"]["enabled"]:
+    rtv.enable_cascade(cfg["retrieval"]["cascade"])
+if cfg["retrieval"]["graph"]["enabled"]:
+    rtv.enable_graph(KGStore(cfg["paths"]["kg_store"]), cfg["retrieval"]["graph"])
+img = build_image_memory(cfg, read_only=True)
+if img is not None:
+    rtv.enable_images(img, cfg["images"])
 
-q = " ".join(sys.argv[1:]) or "What do these documents say about X?"
-ctxs = rtv.retrieve(q)
+ap = argparse.ArgumentParser(description="Retrieve and answer one query.")
+ap.add_argument("query", nargs="*")
+ap.add_argument("--type", action="append", help="Only chunks of this type (text, audio, image...); repeatable.")
+ap.add_argument("--source", action="append", help="Only chunks whose source starts with this path; repeatable.")
+args = ap.parse_args()
+q = " ".join(args.query) or "What do these documents say about X?"
+ctxs = rtv.retrieve(q, {"type": args.type, "source": args.source})
 print(synthesize_answer(q, ctxs))
@@ -1,11 +1,24 @@
 import yaml, sys
 from omnimind.memory import VectorMemory
 from omnimind.retriever import HybridRetriever
+from omnimind.kgstore import KGStore
+from omnimind.ingest_image import build_image_memory
 from omnimind.agent import Agent
 
 cfg = yaml.safe_load(open("config.yaml"))
-vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"])
-rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], cfg["retrieval"]["top_k"], cfg["retrieval"]["rerank_k"])
+vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"], cfg["retrieval"]["index"],
+                   lexical_path=cfg["paths"]["lexical_index"], backend_cfg=cfg["inference"], read_only=True)
+rtv = HybridRetriever(vec, cfg["models"]["cross_encoder"], cfg["retrieval"]["top_k"], cfg["retrieval"]["rerank_k"],
+                      backend_cfg=cfg["inference"])
+if cfg["retrieval"]["lexical"]["enabled"]:
+    rtv.enable_lexical(cfg["retrieval"]["lexical"])
+if cfg["retrieval"]["cascade"]["enabled"]:
+    rtv.enable_cascade(cfg["retrieval"]["cascade"])
+if cfg["retrieval"]["graph"]["enabled"]:
+    rtv.enable_graph(KGStore(cfg["paths"]["kg_store"]), cfg["retrieval"]["graph"])
+img = build_image_memory(cfg, read_only=True)
+if img is not None:
+    rtv.enable_images(img, cfg["images"])
 agent = Agent(rtv, enable_critique=cfg["agent"]["self_critique"], max_iters=cfg["agent"]["max_iters"])
 
 q = " ".join(sys.argv[1:]) or "calc 2+2*3"
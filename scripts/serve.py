@@ -0,0 +1,75 @@
+"""
+Pre-fork server: load the models once, then fork N uvicorn workers that share them.
+
+    python scripts/serve.py --workers 4 --port 8000
+    python scripts/ingest.py          # elsewhere; workers pick up the new index within serving.reload_check_s
+
+`uvicorn --workers N` spawns fresh interpreters, so each loads its own copy of every
+model. Here the parent loads the weights (app.preload_models) and forks; tensors are
+never written after load, so their pages stay shared copy-on-write. Each worker then
+opens the index and docstore memory-mapped (serving.read_only is forced on), which the
+page cache shares as well, warms up, and serves from the same listening socket.
+Compare workers with GET /stats -> memory.pss_mb (shared pages split between them).
+"""
+import argparse, gc, os, signal, socket, sys, time
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve omnimind.app from N forked workers sharing one model copy.")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    args = ap.parse_args()
+
+    import uvicorn
+    from omnimind import app as server
+
+    server.CFG["serving"]["read_only"] = True  # ingest runs as its own process
+    server.preload_models()
+    server.migrate_stores()  # once, here: the workers only open snapshots
+    gc.collect()
+    gc.freeze()  # keep the parent's objects out of the children's collections (fewer copied pages)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            uvicorn.Server(uvicorn.Config(server.app, log_level="info")).run(sockets=[sock])
+            os._exit(0)
+        return pid
+
+    children = {spawn() for _ in range(args.workers)}
+    print(f"[serve] {args.workers} workers on http://{args.host}:{args.port} (pids {sorted(children)})")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"[serve] worker {pid} exited ({status}); restarting")
+            time.sleep(1.0)
+            children.add(spawn())
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Start one local worker process per shard and keep them running.
+
+    python scripts/shard_index.py --shards 4      # build / rebalance the shard stores
+    python scripts/serve_shards.py --shards 4     # workers on retrieval.sharding.base_port + i
+    uvicorn omnimind.app:app                      # with retrieval.sharding.enabled: true
+
+Workers load no model and serve their shard read-only, switching to the snapshot
+sync_shards() publishes (after each ingest, or shard_index.py) within --reload_check_s.
+To move a shard to another node, run `python -m omnimind.shards --dir ... --shard i`
+there and list its URL in retrieval.sharding.urls.
+"""
+import argparse, signal, sys, time
+import yaml
+from omnimind.shards import spawn_shard, shard_urls, wait_ready
+
+def main():
+    ap = argparse.ArgumentParser(description="Run local shard workers for the sharded text store.")
+    ap.add_argument("--shards", type=int, default=None, help="Override retrieval.sharding.shards.")
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--reload_check_s", type=float, default=2.0)
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open("config.yaml"))
+    sharding = cfg["retrieval"]["sharding"]
+    n = args.shards or sharding["shards"]
+    start = lambda i: spawn_shard(cfg["paths"]["shards"], i, sharding["base_port"] + i, args.host, args.reload_check_s)
+    workers = {i: start(i) for i in range(n)}
+    wait_ready([f"http://{args.host}:{sharding['base_port'] + i}" for i in range(n)])
+    print(f"[serve_shards] {n} shard workers up; coordinator URLs: {shard_urls(dict(sharding, shards=n))}")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for p in workers.values():
+            p.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    while not stopping:
+        time.sleep(1.0)
+        for i, p in list(workers.items()):
+            if p.poll() is not None and not stopping:
+                print(f"[serve_shards] shard {i} worker exited ({p.returncode}); restarting")
+                workers[i] = start(i)
+    for p in workers.values():
+        p.wait()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Partition the text store into retrieval.sharding.shards shards (or --shards N), or bring
+existing shards up to date with it. With a different N this rebalances: only the chunks
+whose shard changes are moved. Run it while no ingest is running, like build_index.py.
+"""
+import yaml, json, argparse
+from omnimind.memory import VectorMemory
+from omnimind.shards import sync_shards, shard_urls
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / rebalance the shard stores from the main text store.")
+    ap.add_argument("--shards", type=int, default=None, help="Override retrieval.sharding.shards.")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open("config.yaml"))
+    sharding = dict(cfg["retrieval"]["sharding"])
+    if args.shards is not None:
+        sharding["shards"] = args.shards
+    vec = VectorMemory(cfg["paths"]["vector_index"], cfg["paths"]["docstore"], cfg["models"]["embed_text"],
+                       cfg["retrieval"]["index"], backend_cfg=cfg["inference"])
+    stats = sync_shards(vec, cfg["paths"]["shards"], sharding["shards"])
+    print(json.dumps(stats, indent=2))
+    print("Shard workers (python scripts/serve_shards.py) expected at: " + ", ".join(shard_urls(sharding)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import zlib
+import numpy as np
+import pytest
+
+class HashEncoder:
+    """Hashed bag of words standing in for the embedder: texts sharing words are close."""
+    def __init__(self, dim=32):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in zip(out, texts):
+            for w in text.lower().split():
+                row[zlib.crc32(w.encode()) % self.dim] += 1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+@pytest.fixture
+def encoder():
+    return HashEncoder()
@@ -0,0 +1,95 @@
+import pytest
+from omnimind.attrs import AttributeIndex, normalize_filter
+from omnimind.docstore import DocStore
+from omnimind.memory import VectorMemory
+
+DOCS = [{"id": "a", "type": "text", "source": "data/raw/notes/a.txt", "text": "alpha notes"},
+        {"id": "b", "type": "audio", "source": "data/raw/talks/b.mp3", "text": "alpha talk"},
+        {"id": "c", "type": "text", "source": "data/raw/notes/c.md", "text": "beta notes"},
+        {"id": "d", "type": "image", "source": "data/raw/img/d.png", "text": "alpha picture"}]
+
+def _reopen(ds, tmp_path):
+    ds.close()
+    ds = DocStore(tmp_path / "docstore")
+    return ds, AttributeIndex(ds.base, ds)
+
+def _rows(mask):
+    return [i for i, m in enumerate(mask) if m]
+
+def test_normalize_filter():
+    assert normalize_filter({"type": "text", "source": None}) == (("type", ("text",)),)
+    assert normalize_filter({"type": ["audio", "text", "text"]}) == (("type", ("audio", "text")),)
+    assert normalize_filter({}) is None
+    with pytest.raises(ValueError):
+        normalize_filter({"lang": "en"})
+
+def test_masks_round_trip(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(DOCS)
+    attrs = AttributeIndex(ds.base, ds)  # caught up from the docstore
+    assert _rows(attrs.mask({"type": "text"})) == [0, 2]
+    assert _rows(attrs.mask({"type": ["text", "audio"], "source": "data/raw/notes/"})) == [0, 2]
+    assert _rows(attrs.mask({"source": ["data/raw/talks/", "data/raw/img/d.png"]})) == [1, 3]
+    assert _rows(attrs.mask({"type": "video"})) == []
+    ds, attrs = _reopen(ds, tmp_path)
+    assert attrs.n == 4 and _rows(attrs.mask({"type": "text"})) == [0, 2]
+
+def test_deleted_rows_leave_cached_masks(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(DOCS)
+    attrs = AttributeIndex(ds.base, ds)
+    assert _rows(attrs.mask({"type": "text"})) == [0, 2]
+    attrs.delete(ds.delete([2]))
+    assert _rows(attrs.mask({"type": "text"})) == [0]
+    fids = ds.append(DOCS[2:3])
+    attrs.add(fids, DOCS[2:3])
+    assert _rows(attrs.mask({"type": "text"})) == [0, 4]
+
+def test_reopen_after_interrupted_save(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(DOCS[:2])
+    attrs = AttributeIndex(ds.base, ds)
+    with open(attrs.values_path, "ab") as f:
+        f.write(b"type\tvid")  # torn value line
+    with open(attrs.rows_path, "ab") as f:
+        f.write(b"\x01\x00\x00")  # torn row
+    ds, attrs = _reopen(ds, tmp_path)
+    assert attrs.n == 2 and "vid" not in attrs.ids["type"]
+    fids = ds.append(DOCS[2:])
+    attrs.add(fids, DOCS[2:])
+    attrs.save()
+    ds, attrs = _reopen(ds, tmp_path)
+    assert _rows(attrs.mask({"type": "image"})) == [3]
+
+def test_rows_past_the_docstore_are_rebuilt(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(DOCS[:2])
+    attrs = AttributeIndex(ds.base, ds)
+    attrs.add([2], [{"type": "stray", "source": "elsewhere"}])  # a row the docstore never got
+    attrs.save()
+    ds, attrs = _reopen(ds, tmp_path)
+    assert attrs.n == 2 and "stray" not in attrs.ids["type"]
+    assert _rows(attrs.mask({"type": "audio"})) == [1]
+
+def test_filtered_search(tmp_path, encoder):
+    vec = VectorMemory(str(tmp_path / "faiss.index"), str(tmp_path / "docstore"), "hash", {"type": "flat"},
+                       model=encoder, lexical_path=str(tmp_path / "bm25"))
+    vec.add_texts(DOCS)
+    assert [h["id"] for h in vec.search("alpha", k=10, filter={"type": "text"})] == ["a", "c"]
+    assert [h["id"] for h in vec.search("alpha", k=1, filter={"source": "data/raw/talks/"})] == ["b"]
+    assert [h["id"] for h in vec.search_lexical_batch(["alpha"], k=10, filter={"type": "image"})[0]] == ["d"]
+    vec.remove([0])
+    assert [h["id"] for h in vec.search("alpha", k=10, filter={"type": "text"})] == ["c"]
+
+def test_snapshot_readers_filter_their_rows_only(tmp_path, encoder):
+    open_store = lambda read_only: VectorMemory(str(tmp_path / "faiss.index"), str(tmp_path / "docstore"), "hash",
+                                                {"type": "flat"}, model=encoder, read_only=read_only)
+    writer = open_store(False)
+    writer.add_texts(DOCS, save=False)
+    writer.publish()
+    reader = open_store(True)
+    writer.add_texts([dict(DOCS[0], id="e")])  # saved, not published
+    assert [h["id"] for h in reader.search("alpha", k=10, filter={"type": "text"})] == ["a", "c"]
+    writer.publish()
+    reader.refresh(force=True)
+    assert [h["id"] for h in reader.search("alpha", k=10, filter={"type": "text"})] == ["a", "e", "c"]
@@ -0,0 +1,59 @@
+import json
+import pytest
+from omnimind.docstore import DocStore
+
+def _docs(n, start=0):
+    return [{"id": f"c{i}", "source": f"doc{i // 2}.txt", "text": f"chunk {i} – ünïcode"} for i in range(start, start + n)]
+
+def test_round_trip_and_reopen(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    assert ds.append(_docs(3)) == [0, 1, 2]
+    assert ds.append(_docs(2, 3)) == [3, 4]
+    assert ds.get(4) == _docs(1, 4)[0] and len(ds) == 5
+    ds.close()
+    ds = DocStore(tmp_path / "docstore")
+    assert [m for _, m in ds.items()] == _docs(5)
+    assert ds.get_many([2, 0]) == [_docs(1, 2)[0], _docs(1)[0]]
+
+def test_delete_and_alive_mask(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(_docs(4))
+    assert ds.delete([1, 3, 7]) == [1, 3]
+    assert ds.delete([1]) == []  # already dead
+    assert list(ds.alive_mask()) == [1, 0, 1, 0]
+    assert 1 not in ds and ds.get(1) is None and len(ds) == 2
+    ds.close()
+    ds = DocStore(tmp_path / "docstore")
+    assert list(ds.live_ids()) == [0, 2]
+    assert ds.append(_docs(1, 4)) == [4]  # deleted rows keep their ids
+
+def test_reopen_after_interrupted_append(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(_docs(2))
+    ds.close()
+    # a crash after .blob / .alive were written but before the offset committed the row
+    with open(ds.blob_path, "ab") as f:
+        f.write(b'{"id": "torn"')
+    with open(ds.alive_path, "ab") as f:
+        f.write(b"\x01")
+    with open(ds.offsets_path, "ab") as f:
+        f.write(b"\x07\x00\x00")
+    ds = DocStore(tmp_path / "docstore")
+    assert ds.n == 2 and [m["id"] for _, m in ds.items()] == ["c0", "c1"]
+    assert ds.append(_docs(1, 2)) == [2] and ds.get(2) == _docs(1, 2)[0]
+
+def test_migrates_legacy_jsonl(tmp_path):
+    with open(tmp_path / "docstore.jsonl", "w", encoding="utf-8") as f:
+        for fid, d in zip([0, 2], _docs(2)):
+            f.write(json.dumps(dict(d, _fid=fid)) + "\n")
+    ds = DocStore(tmp_path / "docstore.jsonl")
+    assert ds.n == 3 and list(ds.live_ids()) == [0, 2]  # the missing id became a dead row
+    assert ds.get(2) == _docs(1, 1)[0]
+
+def test_single_writer(tmp_path):
+    ds = DocStore(tmp_path / "docstore")
+    ds.append(_docs(1))
+    with pytest.raises(BlockingIOError, match="another writer"):
+        DocStore(tmp_path / "docstore")
+    ds.close()
+    assert DocStore(tmp_path / "docstore").n == 1
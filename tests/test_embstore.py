@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from omnimind.embstore import EmbeddingStore, same_model
+from omnimind.memory import VectorMemory
+
+TAG = {"model": "hash", "backend": "torch", "dim": 8, "fingerprint": None}
+
+def _vecs(n, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, TAG["dim"])).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def test_round_trip_and_reopen(tmp_path):
+    store = EmbeddingStore(tmp_path / "docstore", TAG)
+    store.put([0, 1, 2], ["a", "b", "c"], _vecs(3))
+    store.flush()
+    store = EmbeddingStore(tmp_path / "docstore", TAG)
+    vecs, ok = store.get([2, 0, 5], ["c", "a", "f"])
+    assert list(ok) == [True, True, False]  # row 5 was never stored
+    np.testing.assert_allclose(vecs[:2], _vecs(3)[[2, 0]], rtol=1e-6)
+
+def test_rows_holding_another_chunk_are_invalid(tmp_path):
+    store = EmbeddingStore(tmp_path / "docstore", TAG)
+    store.put([0, 3], ["a", "d"], _vecs(2))  # rows 1-2 left as gaps
+    _, ok = store.get([0, 1, 3], ["x", "b", "d"])
+    assert list(ok) == [False, False, True]
+
+def test_reopen_after_torn_record(tmp_path):
+    store = EmbeddingStore(tmp_path / "docstore", TAG)
+    store.put([0, 1], ["a", "b"], _vecs(2))
+    store.flush()
+    with open(store.path, "ab") as f:
+        f.write(b"\x00" * 10)
+    store = EmbeddingStore(tmp_path / "docstore", TAG)
+    assert store.n == 2 and list(store.get([0, 1], ["a", "b"])[1]) == [True, True]
+
+def test_float16_halves_the_records(tmp_path):
+    store = EmbeddingStore(tmp_path / "docstore", TAG, dtype="float16")
+    store.put([0], ["a"], _vecs(1))
+    vecs, ok = store.get([0], ["a"])
+    assert ok[0] and store.nbytes == 16 + 2 * TAG["dim"]
+    np.testing.assert_allclose(vecs, _vecs(1), atol=1e-3)
+
+def test_another_model_needs_reset(tmp_path):
+    store = EmbeddingStore(tmp_path / "docstore", TAG)
+    store.put([0], ["a"], _vecs(1))
+    store.flush()
+    other = dict(TAG, model="other")
+    assert not same_model(TAG, other)
+    with pytest.raises(ValueError, match="holds vectors of hash"):
+        EmbeddingStore(tmp_path / "docstore", other)
+    assert EmbeddingStore(tmp_path / "docstore", TAG).get([0], ["a"])[1][0]  # left as it was
+    store = EmbeddingStore(tmp_path / "docstore", other, reset=True)
+    assert store.n == 0 and store.meta["model"] == "other"
+
+def test_other_encoders_leave_stored_vectors(tmp_path, encoder):
+    open_store = lambda name, **kw: VectorMemory(str(tmp_path / "faiss.index"), str(tmp_path / "docstore"), name,
+                                                 {"type": "flat"}, model=encoder, **kw)
+    vec = open_store("hash")
+    vec.add_texts([{"id": "a", "source": "a.txt", "type": "text", "text": "alpha"}])
+    vec.close()
+    vec = open_store("other")  # e.g. a diagnostic script on another model
+    assert vec.vectors is None
+    vec.close()
+    vec = open_store("hash")
+    assert vec.vectors.n == 1
+    vec.close()
+    assert open_store("other", reset_vectors=True).vectors.n == 0  # ingest / rebuild
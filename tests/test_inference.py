@@ -0,0 +1,25 @@
+import sys, types
+from pathlib import Path
+import yaml
+from omnimind import inference
+
+CONFIG = Path(__file__).resolve().parents[1] / "config.yaml"
+
+class _Model:
+    def __init__(self, name, **kwargs):
+        self.name, self.kwargs = name, kwargs
+
+def test_load_with_shipped_config(monkeypatch):
+    # the real `inference` section, parity thresholds (a dict) included
+    cfg = yaml.safe_load(CONFIG.read_text())["inference"]
+    st = types.SimpleNamespace(SentenceTransformer=_Model, CrossEncoder=_Model)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", st)
+    monkeypatch.setattr(inference, "_torch_threads", lambda spec: None)
+    monkeypatch.setattr(inference, "_preloaded", {})
+    cfg = dict(cfg, backend="torch")
+
+    inference.preload(["embedder"], ["ranker"], cfg)
+    embedder = inference.load_embedder("embedder", cfg)
+    assert embedder.name == "embedder"
+    assert inference.load_embedder("embedder", cfg) is embedder  # preloaded instance handed out
+    assert inference.load_cross_encoder("ranker", cfg).name == "ranker"
@@ -0,0 +1,65 @@
+import numpy as np
+from omnimind.docstore import DocStore
+from omnimind.lexical import BM25Index
+
+TEXTS = ["the cat sat on the mat", "dogs chase cats", "a mat for the dog", "stock market news", "cat food prices"]
+
+def _store(tmp_path, texts=TEXTS):
+    ds = DocStore(tmp_path / "docstore")
+    fids = ds.append([{"id": f"c{i}", "text": t} for i, t in enumerate(texts)])
+    return ds, fids
+
+def _reopen(ds, tmp_path):
+    ds.close()
+    ds = DocStore(tmp_path / "docstore")
+    return ds, BM25Index(tmp_path / "bm25", ds)
+
+def test_round_trip(tmp_path):
+    ds, fids = _store(tmp_path)
+    bm = BM25Index(tmp_path / "bm25", ds)
+    assert bm.n == len(TEXTS)  # caught up from the docstore text
+    found, scores = bm.search("cat mat", k=3)
+    assert found[0] == 0 and list(scores) == sorted(scores, reverse=True)
+    more = ds.append([{"id": "c5", "text": "mat mat mat"}])
+    bm.add(more, ["mat mat mat"])
+    bm.save()
+    ds, bm2 = _reopen(ds, tmp_path)
+    for q in ("cat mat", "market", "dog"):
+        a, b = bm.search(q, k=4), bm2.search(q, k=4)
+        assert list(a[0]) == list(b[0]) and np.allclose(a[1], b[1])
+
+def test_deleted_rows_never_match(tmp_path):
+    ds, _ = _store(tmp_path)
+    bm = BM25Index(tmp_path / "bm25", ds)
+    bm.delete(ds.delete([0]))
+    assert 0 not in bm.search("cat", k=5)[0]
+    ds, bm = _reopen(ds, tmp_path)
+    assert 0 not in bm.search("cat", k=5)[0] and bm.live == len(TEXTS) - 1
+
+def test_reopen_after_interrupted_save(tmp_path):
+    ds, _ = _store(tmp_path)
+    bm = BM25Index(tmp_path / "bm25", ds)
+    # a crash mid-save: a torn vocab line and postings of a row .doclen never committed
+    with open(bm.vocab_path, "ab") as f:
+        f.write(b"unfinish")
+    with open(bm.postings_path, "ab") as f:
+        f.write(np.array([(0, len(TEXTS), 1)], dtype=[("term", "<u4"), ("fid", "<u4"), ("tf", "<u2")]).tobytes())
+    ds, bm = _reopen(ds, tmp_path)
+    assert bm.n == len(TEXTS) and "unfinish" not in bm.term_ids
+    more = ds.append([{"id": "c5", "text": "cat"}])
+    bm.add(more, ["cat"])
+    bm.save()
+    ds, bm = _reopen(ds, tmp_path)
+    assert len(TEXTS) in bm.search("cat", k=10)[0]
+
+def test_rows_missing_or_extra_are_rebuilt_from_the_docstore(tmp_path):
+    ds, _ = _store(tmp_path, TEXTS[:2])
+    BM25Index(tmp_path / "bm25", ds)
+    ds.append([{"id": f"c{i}", "text": t} for i, t in enumerate(TEXTS[2:], 2)])  # never indexed
+    ds, bm = _reopen(ds, tmp_path)
+    assert bm.n == len(TEXTS) and list(bm.search("market", k=1)[0]) == [3]
+    # rows past the docstore's end (saved by a second writer) no longer line up with it
+    bm.add([len(TEXTS)], ["stray row"])
+    bm.save()
+    ds, bm = _reopen(ds, tmp_path)
+    assert bm.n == len(TEXTS) and "stray" not in bm.term_ids
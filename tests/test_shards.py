@@ -0,0 +1,78 @@
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+from omnimind import shards
+from omnimind.memory import VectorMemory
+
+WORDS = "apple pear plum fig lime kiwi date grape melon berry cherry mango".split()
+
+def _docs(n, start=0):
+    return [{"id": f"c{i}", "source": f"doc{i}.txt", "type": "text",
+             "text": f"{WORDS[i % len(WORDS)]} {WORDS[(i * 5 + 1) % len(WORDS)]} item{i}"} for i in range(start, start + n)]
+
+@pytest.fixture
+def primary(tmp_path, encoder):
+    vec = VectorMemory(str(tmp_path / "faiss.index"), str(tmp_path / "docstore"), "hash", {"type": "flat"},
+                       model=encoder, lexical_path=str(tmp_path / "bm25"))
+    vec.add_texts(_docs(40))
+    return vec
+
+@pytest.fixture
+def serve(tmp_path):
+    servers = []
+    def start(n):
+        for s in range(n):
+            server = ThreadingHTTPServer(("127.0.0.1", 0), shards._Handler)
+            server.daemon_threads = True
+            server.shard = s
+            server.store = shards.open_shard(str(tmp_path / "shards"), s, reload_check_s=0.0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+        return shards.ShardCoordinator([f"http://127.0.0.1:{s.server_address[1]}" for s in servers[-n:]],
+                                       reload_check_s=0.0)
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def _ids(hits):
+    return [h["id"] for h in hits]
+
+def test_jump_hash_moves_only_to_the_new_shard():
+    keys = range(1, 2000)
+    before, after = [shards.jump_hash(k, 4) for k in keys], [shards.jump_hash(k, 5) for k in keys]
+    assert set(before) == {0, 1, 2, 3}
+    moved = [b for a, b in zip(before, after) if a != b]
+    assert set(moved) == {4} and 0.1 < len(moved) / len(keys) < 0.3
+
+def test_scatter_gather_matches_the_primary(tmp_path, primary, serve):
+    stats = shards.sync_shards(primary, str(tmp_path / "shards"), 2)
+    assert stats["added"] == 40 and sum(stats["rows"]) == 40 and min(stats["rows"]) > 0
+    coord = serve(2)
+    queries = ["apple pear", "melon item7", "cherry"]
+    for q, hits in zip(queries, coord.search(primary.encode_queries(queries), k=5)):
+        expected = primary.search(q, k=5)  # which ids make the cut among equal scores may differ
+        assert [h["_score"] for h in hits] == pytest.approx([h["_score"] for h in expected])
+    hits = coord.search_lexical(["item7"], k=3)[0]
+    assert _ids(hits)[:1] == ["c7"]
+
+def test_republished_shards_change_the_version(tmp_path, primary, serve):
+    shards.sync_shards(primary, str(tmp_path / "shards"), 2)
+    coord = serve(2)
+    coord.refresh(force=True)
+    before = coord.version
+    assert None not in before and not coord.refresh(force=True)
+    primary.remove([7])
+    primary.add_texts(_docs(1, 40))
+    stats = shards.sync_shards(primary, str(tmp_path / "shards"), 2)
+    assert stats["added"] == 1 and stats["removed"] == 1
+    assert coord.refresh(force=True) and coord.version != before
+    hits = coord.search(primary.encode_queries(["melon item7"]), k=40)[0]
+    assert "c7" not in _ids(hits) and "c40" in _ids(hits)
+
+def test_rebalance_moves_a_fraction(tmp_path, primary):
+    shards.sync_shards(primary, str(tmp_path / "shards"), 2)
+    stats = shards.sync_shards(primary, str(tmp_path / "shards"), 3)
+    assert sum(stats["rows"]) == 40 and stats["added"] == stats["removed"] == stats["rows"][2]
+    stats = shards.sync_shards(primary, str(tmp_path / "shards"), 2)
+    assert sum(stats["rows"]) == 40 and not (tmp_path / "shards" / "2").exists()
@@ -0,0 +1,56 @@
+from omnimind.docstore import DocStore
+from omnimind.memory import VectorMemory
+
+def _open(tmp_path, encoder, read_only=False):
+    return VectorMemory(str(tmp_path / "faiss.index"), str(tmp_path / "docstore"), "hash", {"type": "flat"},
+                        model=encoder, lexical_path=str(tmp_path / "bm25"), read_only=read_only,
+                        reload_check_s=0.0)
+
+def _docs(*texts):
+    return [{"id": t, "source": f"{t}.txt", "type": "text", "text": t} for t in texts]
+
+def _texts(hits):
+    return {h["text"] for h in hits}
+
+def test_reader_serves_published_snapshots_only(tmp_path, encoder):
+    writer = _open(tmp_path, encoder)
+    writer.add_texts(_docs("red apple", "green pear"), save=False)
+    writer.publish()
+    reader = _open(tmp_path, encoder, read_only=True)
+    assert _texts(reader.search("apple", k=5)) == {"red apple", "green pear"}
+
+    writer.add_texts(_docs("apple pie"))  # saved, not published
+    fid = next(f for f, m in writer.docstore.items() if m["text"] == "red apple")
+    writer.remove([fid])
+    assert not reader.refresh(force=True)
+    assert _texts(reader.search("apple", k=5)) == {"red apple", "green pear"}  # deletes wait for the snapshot too
+    assert _texts(reader.search_lexical_batch(["apple"], k=5)[0]) == {"red apple"}
+
+    version = reader.version
+    writer.publish()
+    assert reader.refresh(force=True) and reader.version > version
+    assert _texts(reader.search("apple", k=5)) == {"green pear", "apple pie"}
+    assert _texts(reader.search_lexical_batch(["apple"], k=5)[0]) == {"apple pie"}
+
+def test_old_snapshots_are_pruned(tmp_path, encoder):
+    writer = _open(tmp_path, encoder)
+    for i in range(5):
+        writer.add_texts(_docs(f"doc {i}"), save=False)
+        writer.publish(keep=2)
+    assert sorted(p.name for p in tmp_path.glob("faiss.index.v*")) == ["faiss.index.v4", "faiss.index.v5"]
+    reader = _open(tmp_path, encoder, read_only=True)
+    assert reader.snapshot == 5 and len(reader.docstore) == 5
+
+def test_readers_never_repair(tmp_path, encoder):
+    writer = _open(tmp_path, encoder)
+    writer.add_texts(_docs("one", "two"))
+    writer.publish()
+    # an append the writer has written to .blob but not yet committed with its offset
+    with open(writer.docstore.blob_path, "ab") as f:
+        f.write(b'{"id": "in flight"')
+    size = (tmp_path / "docstore.blob").stat().st_size
+    store = DocStore(str(tmp_path / "docstore"), read_only=True)
+    reader = _open(tmp_path, encoder, read_only=True)
+    assert store.n == 2 and len(reader.docstore) == 2
+    assert (tmp_path / "docstore.blob").stat().st_size == size
+    assert (tmp_path / "bm25.doclen").stat().st_size == 2 * 4
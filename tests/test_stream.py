@@ -0,0 +1,49 @@
+import asyncio, json, time
+import pytest
+
+pytest.importorskip("fastapi")
+from omnimind import app as server
+from omnimind.agent import Agent
+from omnimind.timing import StageTimer
+
+class _Retriever:
+    """Two stages that take long enough for the profiler to sample them."""
+    def __init__(self):
+        self.timer = StageTimer()
+
+    def retrieve_steps(self, query, filter=None):
+        with self.timer.stage("search"):
+            time.sleep(0.05)
+        yield "candidates", [{"text": "Alpha. Beta", "source": "a.txt", "_score": 0.5}]
+        with self.timer.stage("rerank"):
+            time.sleep(0.05)
+        yield "contexts", [{"text": "Alpha. Beta", "source": "a.txt", "_score": 0.5, "_rank": 1.0}]
+
+def _events(body):
+    async def collect():
+        return "".join([chunk async for chunk in body])
+    out = []
+    for block in asyncio.run(collect()).strip().split("\n\n"):
+        name, data = block.split("\n")
+        out.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return out
+
+@pytest.fixture
+def components(monkeypatch):
+    rtv = _Retriever()
+    monkeypatch.setattr(server, "_rtv", rtv)
+    monkeypatch.setattr(server, "_agent", Agent(rtv))
+    monkeypatch.setattr(server, "_ensure_components", lambda: None)
+    monkeypatch.setitem(server.CFG["serving"], "metrics",
+                        dict(server.CFG["serving"]["metrics"], request_timings=True, profiling=True))
+
+@pytest.mark.parametrize("endpoint,model", [("query_stream", "QueryRequest"), ("agent_stream", "AgentRequest")])
+def test_stream_returns_stage_timings_and_profile(components, endpoint, model):
+    req = getattr(server, model)(query="alpha", timings=True, profile=True)
+    res = asyncio.run(getattr(server, endpoint)(req))
+    events = _events(res.body_iterator)
+    names = [name for name, _ in events]
+    assert names[:2] == ["candidates", "contexts"] and names[-2:] == ["answer", "done"]
+    done = events[-1][1]
+    assert done["timings"]["search"] >= 40 and done["timings"]["rerank"] >= 40
+    assert "retrieve_steps" in done["profile"]  # samples of the thread that ran the stages